@@ -0,0 +1,69 @@
+"""Run the benchmark suite, or compare two of its runs.
+
+Run from the repository root with::
+
+    python -m benchmarks run -o results.json
+    python -m benchmarks compare base.json results.json
+
+When comparing, the exit status is ``1`` if any regression is found.
+"""
+import argparse
+import sys
+
+from . import suite
+
+parser = argparse.ArgumentParser('python -m benchmarks', description=__doc__,
+                                 formatter_class=argparse.RawTextHelpFormatter)
+subparsers = parser.add_subparsers(dest='command', required=True)
+
+run_parser = subparsers.add_parser('run', help='Run benchmarks.')
+run_parser.add_argument('-o', dest='output', help='Output JSON file.')
+run_parser.add_argument('-q', dest='quick', action='store_true',
+                        help='Reduce the workload, for a rough estimate.')
+run_parser.add_argument('names', nargs='*',
+                        help='Benchmarks to run (all by default): '
+                             + ', '.join(suite.BENCHMARKS))
+
+compare_parser = subparsers.add_parser(
+    'compare', help='Compare two runs, flagging regressions.')
+compare_parser.add_argument('base', help='Reference JSON file.')
+compare_parser.add_argument('new', help='JSON file to be checked.')
+compare_parser.add_argument('-t', dest='threshold', type=float,
+                            default=suite.DEFAULT_THRESHOLD,
+                            help='Tolerated relative slowdown '
+                                 f'(defaults to {suite.DEFAULT_THRESHOLD}).')
+compare_parser.add_argument('-a', dest='all', action='store_true',
+                            help='Also list unchanged results.')
+
+args = parser.parse_args()
+
+if args.command == 'run':
+    unknown = set(args.names) - suite.BENCHMARKS.keys()
+    if unknown:
+        parser.error(f'unknown benchmarks: {", ".join(sorted(unknown))}')
+
+    document = suite.run(args.names or None, args.quick)
+    for key, seconds in document['results'].items():
+        print(f'{key:<50} {seconds * 1e6:12.1f} us')
+
+    if args.output is not None:
+        suite.save(document, args.output)
+
+elif args.command == 'compare':
+    comparison = suite.compare(suite.load(args.base), suite.load(args.new),
+                               args.threshold)
+    regressions = 0
+    for key, base_seconds, new_seconds, status in comparison:
+        regressions += status == 'regression'
+        if status == 'same' and not args.all:
+            continue
+
+        if base_seconds is None or new_seconds is None:
+            print(f'{key:<50} {status}')
+        else:
+            print(f'{key:<50} {base_seconds * 1e6:12.1f} -> '
+                  f'{new_seconds * 1e6:12.1f} us '
+                  f'({new_seconds / base_seconds - 1:+7.1%}) {status}')
+
+    print(f'{regressions} regression(s) out of {len(comparison)} results')
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,135 @@
+"""Compare screen composition backends on synthetic worlds.
+
+Both the byte per pixel (:class:`graphics.ScreenSurfaceHandler`) and
+the packed 1-bit (:class:`packed.PackedScreenSurfaceHandler`) backends
+are measured, composing incrementally and from scratch, with and
+without a static layer (half of the sprites never moving).
+
+Run from the repository root with::
+
+    python -m benchmarks.compositor
+"""
+import itertools
+import timeit
+
+import desper
+import numpy as np
+from sdl2.ext import SurfaceArray
+
+from nerissimo import graphics
+from nerissimo import packed
+
+BACKENDS = {
+    'surface_array': (graphics.ScreenSurfaceHandler, False),
+    'packed': (packed.PackedScreenSurfaceHandler, True),
+}
+
+
+class Moving:
+    """ID component: sprites that move, when a static layer is used."""
+
+
+def build_world(handler_type, packed_screen: bool, sprite_count: int,
+                incremental: bool = True, layered: bool = False,
+                seed=0) -> desper.World:
+    """Build a world with randomly placed square sprites.
+
+    Only half of the sprites are :class:`Moving`. If ``layered``, the
+    others are baked in the static layer.
+    """
+    rng = np.random.default_rng(seed)
+    world = desper.World()
+
+    world.create_entity(handler_type(
+        incremental=incremental,
+        dynamic_types=(Moving,) if layered else None))
+    world.create_entity(
+        graphics.ScreenSurface(),
+        *graphics.prepare_surface_array_components(
+            graphics.build_surface(graphics.BONNET_WIDTH,
+                                   graphics.BONNET_HEIGHT, 0)))
+    if packed_screen:
+        packed.add_screen_bitmap(world)
+
+    for index in range(sprite_count):
+        side = int(rng.integers(4, 24))
+        entity = world.create_entity(
+            desper.Transform2D(position=rng.integers(0, 40, 2)),
+            *graphics.prepare_surface_array_components(
+                graphics.build_surface(side, side, 0xFF)))
+        if index % 2 == 0:
+            world.add_component(entity, Moving())
+
+    return world
+
+
+def move_sprites(world: desper.World, rng, fraction=0.1):
+    """Move a fraction of the :class:`Moving` sprites by one pixel."""
+    moving = world.get(Moving)
+    for index in rng.choice(len(moving), max(1, int(len(moving) * fraction)),
+                            replace=False):
+        transform = world.get_component(moving[index][0], desper.Transform2D)
+        transform.position += rng.choice((-1, 1), 2)
+
+
+def run(sprite_counts=(1, 10, 100, 1000), number=20):
+    """Time a composition after moving some sprites, for each backend.
+
+    Return a nested dictionary of seconds per frame, by backend, mode
+    and sprite count.
+    """
+    results = {}
+    for backend, (handler_type, packed_screen) in BACKENDS.items():
+        for incremental, layered in itertools.product((True, False),
+                                                      repeat=2):
+            mode = ('incremental' if incremental else 'full') + (
+                '+layer' if layered else '')
+            timings = results.setdefault(backend, {}).setdefault(mode, {})
+
+            for sprite_count in sprite_counts:
+                world = build_world(handler_type, packed_screen,
+                                    sprite_count, incremental, layered)
+                world.dispatch('update_screen_surface')
+                rng = np.random.default_rng(1)
+
+                def frame():
+                    move_sprites(world, rng)
+                    world.dispatch('update_screen_surface')
+
+                timings[sprite_count] = min(timeit.repeat(
+                    frame, number=number, repeat=3)) / number
+
+    return results
+
+
+def check_backends_agree(sprite_count=100, frames=20):
+    """Compose the same animation with all backends, compare screens.
+
+    Each backend is also run with a static layer.
+    """
+    worlds = [build_world(handler_type, packed_screen, sprite_count,
+                          layered=layered)
+              for handler_type, packed_screen in BACKENDS.values()
+              for layered in (False, True)]
+    rngs = [np.random.default_rng(1) for _ in worlds]
+
+    for _ in range(frames):
+        screens = []
+        for world, rng in zip(worlds, rngs):
+            move_sprites(world, rng)
+            world.dispatch('update_screen_surface')
+            screen_surface_entity, _ = world.get(graphics.ScreenSurface)[0]
+            screens.append(world.get_component(screen_surface_entity,
+                                               SurfaceArray))
+
+        assert all(np.array_equal(screens[0], screen)
+                   for screen in screens[1:]), 'Backends disagree'
+
+
+if __name__ == '__main__':
+    check_backends_agree()
+    for backend, modes in run().items():
+        for mode, timings in modes.items():
+            for sprite_count, seconds in timings.items():
+                print(f'{backend:>14} {mode:>17} {sprite_count:5d} sprites: '
+                      f'{seconds * 1e6:10.1f} us/frame')
@@ -0,0 +1,88 @@
+"""Compare the per-pixel display fill against the batched conversion.
+
+Run from the repository root with::
+
+    python -m benchmarks.fill_display
+"""
+import ctypes
+import timeit
+
+import numpy as np
+import sdl2
+from sdl2.ext import pixels2d
+
+from nerissimo import graphics
+from nerissimo import ssd1306
+
+
+class FakeDisplay:
+    """Minimal stand-in for ``adafruit_ssd1306.SSD1306_I2C``.
+
+    Only the framebuffer is emulated (vertical LSB format, as in
+    ``adafruit_framebuf``), nothing is ever sent anywhere.
+    """
+
+    def __init__(self, width=graphics.BONNET_WIDTH,
+                 height=graphics.BONNET_HEIGHT):
+        self.width = width
+        self.buffer = bytearray((height // 8) * width + 1)
+        self.buf = memoryview(self.buffer)[1:]
+
+    def pixel(self, x, y, color):
+        index = (y >> 3) * self.width + x
+        offset = y & 0x07
+        self.buf[index] = ((self.buf[index] & ~(0x01 << offset))
+                           | ((color != 0) << offset))
+
+
+def fill_display_pixelwise(display, surface):
+    """Former implementation of ``bonnet.fill_display``."""
+    pixels = ctypes.cast(surface.contents.pixels,
+                         ctypes.POINTER(ctypes.c_uint8))
+    for y in range(graphics.BONNET_HEIGHT):
+        for x in range(graphics.BONNET_WIDTH):
+            display.pixel(x, y, pixels[128 * y + x] & 1)
+
+
+def build_random_screen(seed=0):
+    """Return a screen surface filled with random black/white noise."""
+    surface = graphics.build_surface(graphics.BONNET_WIDTH,
+                                     graphics.BONNET_HEIGHT, 0)
+    surface_array = pixels2d(surface)
+    rng = np.random.default_rng(seed)
+    surface_array[:] = rng.integers(0, 2, surface_array.shape) * 0xFF
+
+    return surface, surface_array
+
+
+def run(number=20):
+    """Run both implementations, check they agree and time them.
+
+    Return a dictionary of seconds per call, by implementation name.
+    """
+    surface, surface_array = build_random_screen()
+
+    reference = FakeDisplay()
+    fill_display_pixelwise(reference, surface)
+    batched = FakeDisplay()
+    ssd1306.fill_display(batched, surface_array)
+    assert reference.buffer == batched.buffer, 'Implementations disagree'
+
+    results = {
+        'pixelwise': min(timeit.repeat(
+            lambda: fill_display_pixelwise(reference, surface),
+            number=number, repeat=3)) / number,
+        'batched': min(timeit.repeat(
+            lambda: ssd1306.fill_display(batched, surface_array),
+            number=number * 50, repeat=3)) / (number * 50),
+    }
+
+    sdl2.SDL_FreeSurface(surface)
+    return results
+
+
+if __name__ == '__main__':
+    results = run()
+    for name, seconds in results.items():
+        print(f'{name:>10}: {seconds * 1e6:10.1f} us/frame')
+    print(f'{"speedup":>10}: {results["pixelwise"] / results["batched"]:10.1f}x')
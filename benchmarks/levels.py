@@ -0,0 +1,25 @@
+"""Time every level, headless, with scripted input.
+
+Each level in :attr:`levels.transformer_list` is processed through
+:func:`headless.run`, in fixed timesteps and as fast as possible.
+
+Run from the repository root with::
+
+    python -m benchmarks.levels
+"""
+from nerissimo import headless
+
+
+def run(frames=300, packed=False):
+    """Process each level for the given number of frames.
+
+    Return a dictionary of seconds per frame, by level name.
+    """
+    return {level_name: result['seconds'] / result['frames']
+            for level_name, result
+            in headless.run(frames=frames, packed=packed).items()}
+
+
+if __name__ == '__main__':
+    for level_name, seconds in run().items():
+        print(f'{level_name:>20}: {seconds * 1e6:10.1f} us/frame')
@@ -0,0 +1,111 @@
+"""Time the movement processors on synthetic worlds.
+
+Each processor is measured alone, in a world where every sprite is
+subject to it: :class:`game.VelocityProcessor`,
+:class:`game.TargetProcessor`, :class:`game.OscillationProcessor` and
+:class:`graphics.ClipTransformsProcessors`. Velocity and target
+processors are also measured with :mod:`movement` arrays.
+
+Run from the repository root with::
+
+    python -m benchmarks.movement
+"""
+import timeit
+
+import desper
+import numpy as np
+
+from nerissimo import game
+from nerissimo import graphics
+from nerissimo import movement
+
+DT = 1 / 30
+
+CLIP_RECT = (0, 0, graphics.BONNET_HEIGHT, graphics.BONNET_WIDTH)
+
+
+def add_velocity(world, rng):
+    world.add_processor(game.VelocityProcessor())
+    return [game.Velocity(*rng.uniform(-20, 20, 2))]
+
+
+def add_target(world, rng):
+    world.add_processor(game.TargetProcessor())
+    # Far enough not to be reached during the benchmark
+    return [game.Velocity(0, 0),
+            game.Target(desper.math.Vec2(*rng.uniform(-1e6, 1e6, 2)))]
+
+
+def add_oscillate(world, rng):
+    world.add_processor(game.OscillationProcessor())
+    return [game.Oscillate(rng.uniform(1, 10), rng.uniform(1, 5),
+                           int(rng.integers(0, 2)))]
+
+
+def add_clip(world, rng):
+    world.add_processor(graphics.ClipTransformsProcessors(CLIP_RECT))
+    return [graphics.EnsureClipped()]
+
+
+PROCESSORS = {
+    'velocity': (add_velocity, False),
+    'velocity_arrays': (add_velocity, True),
+    'target': (add_target, False),
+    'target_arrays': (add_target, True),
+    'oscillate': (add_oscillate, False),
+    'clip': (add_clip, False),
+}
+
+
+def build_world(add_processor, sprite_count: int, arrays: bool = False,
+                seed=0) -> desper.World:
+    """Build a world with randomly placed sprites.
+
+    ``add_processor`` adds the measured processor to the world and
+    returns the additional components for each sprite. If ``arrays``,
+    :mod:`movement` arrays are used.
+    """
+    rng = np.random.default_rng(seed)
+    world = desper.World()
+    surface = graphics.build_surface(8, 8, 0xFF)
+
+    components = []
+    for _ in range(sprite_count):
+        components.append(add_processor(world, rng))
+
+    for sprite_components in components:
+        world.create_entity(
+            desper.Transform2D(
+                position=desper.math.Vec2(*rng.uniform(0, 56, 2))),
+            *graphics.prepare_surface_array_components(surface),
+            *sprite_components)
+
+    if arrays:
+        movement.world_transformer(None, world)
+    world.process(DT)       # Apply pending entities
+
+    return world
+
+
+def run(sprite_counts=(1, 10, 100, 1000), number=20):
+    """Time a step of each processor.
+
+    Return a nested dictionary of seconds per frame, by processor and
+    sprite count.
+    """
+    results = {}
+    for name, (add_processor, arrays) in PROCESSORS.items():
+        timings = results.setdefault(name, {})
+        for sprite_count in sprite_counts:
+            world = build_world(add_processor, sprite_count, arrays)
+            timings[sprite_count] = min(timeit.repeat(
+                lambda: world.process(DT), number=number, repeat=3)) / number
+
+    return results
+
+
+if __name__ == '__main__':
+    for name, timings in run().items():
+        for sprite_count, seconds in timings.items():
+            print(f'{name:>16} {sprite_count:5d} sprites: '
+                  f'{seconds * 1e6:10.1f} us/frame')
@@ -0,0 +1,128 @@
+"""Run all benchmarks, save results as JSON and compare runs.
+
+Results are flattened to a dictionary of seconds (lower is better),
+keyed by slash separated paths such as
+``compositor/packed/incremental/100``.
+"""
+import json
+import platform
+import time
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+
+from . import compositor
+from . import fill_display
+from . import levels
+from . import movement
+from . import text
+from . import win_check
+from . import worlds
+
+BENCHMARKS: dict[str, Callable[..., dict]] = {
+    'compositor': compositor.run,
+    'fill_display': fill_display.run,
+    'win_check': win_check.run,
+    'text': text.run,
+    'movement': movement.run,
+    'worlds': worlds.run,
+    'levels': levels.run,
+    'levels_packed': lambda **kwargs: levels.run(packed=True, **kwargs),
+}
+
+# Reduced workload for quick runs, by benchmark
+QUICK_ARGUMENTS = {
+    'compositor': {'sprite_counts': (1, 10, 100), 'number': 5},
+    'fill_display': {'number': 2},
+    'win_check': {'sprite_counts': (1, 10, 100), 'number': 5},
+    'text': {'number': 5},
+    'movement': {'sprite_counts': (1, 10, 100), 'number': 5},
+    'worlds': {'number': 5},
+    'levels': {'frames': 60},
+    'levels_packed': {'frames': 60},
+}
+
+DEFAULT_THRESHOLD = 0.1
+
+
+def flatten(results: dict, prefix: str = '') -> dict[str, float]:
+    """Flatten nested results to a single level, joining keys by ``/``."""
+    flat = {}
+    for key, value in results.items():
+        path = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{path}/'))
+        else:
+            flat[path] = float(value)
+
+    return flat
+
+
+def run(names: Optional[Iterable[str]] = None, quick: bool = False) -> dict:
+    """Run the given benchmarks (all by default).
+
+    Return a JSON serializable document, with some information on the
+    machine (``meta``) and the flattened results (``results``).
+    """
+    if names is None:
+        names = BENCHMARKS
+
+    results = {}
+    for name in names:
+        arguments = QUICK_ARGUMENTS[name] if quick else {}
+        results[name] = BENCHMARKS[name](**arguments)
+
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'quick': quick,
+        },
+        'results': flatten(results),
+    }
+
+
+def save(document: dict, filename: str):
+    with open(filename, 'w') as file:
+        json.dump(document, file, indent=2)
+
+
+def load(filename: str) -> dict:
+    with open(filename) as file:
+        return json.load(file)
+
+
+def compare(base: dict, new: dict, threshold: float = DEFAULT_THRESHOLD
+            ) -> list[tuple[str, Optional[float], Optional[float], str]]:
+    """Compare two result documents.
+
+    Return a list of ``(key, base seconds, new seconds, status)``, where
+    status is one of ``'regression'``, ``'improvement'``, ``'same'``
+    (relative change within ``threshold``), ``'added'`` or
+    ``'removed'``.
+    """
+    base_results = base['results']
+    new_results = new['results']
+
+    comparison = []
+    for key in sorted(base_results.keys() | new_results.keys()):
+        base_seconds = base_results.get(key)
+        new_seconds = new_results.get(key)
+
+        if base_seconds is None:
+            status = 'added'
+        elif new_seconds is None:
+            status = 'removed'
+        elif new_seconds > base_seconds * (1 + threshold):
+            status = 'regression'
+        elif new_seconds < base_seconds / (1 + threshold):
+            status = 'improvement'
+        else:
+            status = 'same'
+
+        comparison.append((key, base_seconds, new_seconds, status))
+
+    return comparison
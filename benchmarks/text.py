@@ -0,0 +1,43 @@
+"""Time text rendering with the game font.
+
+Run from the repository root with::
+
+    python -m benchmarks.text
+"""
+import timeit
+
+import sdl2
+from sdl2 import sdlttf as ttf
+
+from nerissimo import text
+from nerissimo import load_resources
+
+FONT = 'fonts/exepixelperfect'
+
+TEXTS = {
+    'word': 'RESTART',
+    'title': 'NERISSIMO',
+    'sentence': 'PRESS RETURN TO START AGAIN',
+}
+
+
+def run(number=20):
+    """Time the rendering of each text, surface release included.
+
+    Return a dictionary of seconds per call, by text name.
+    """
+    ttf.TTF_Init()
+    load_resources()
+
+    results = {}
+    for name, string in TEXTS.items():
+        results[name] = min(timeit.repeat(
+            lambda: sdl2.SDL_FreeSurface(text.render_text(FONT, string)),
+            number=number, repeat=3)) / number
+
+    return results
+
+
+if __name__ == '__main__':
+    for name, seconds in run().items():
+        print(f'{name:>10}: {seconds * 1e6:10.1f} us/call')
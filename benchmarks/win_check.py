@@ -0,0 +1,85 @@
+"""Time the win condition check on synthetic screen damage.
+
+Both the byte per pixel (:class:`game.WinConditionProcessor`) and the
+packed 1-bit (:class:`game.PackedWinConditionProcessor`) variants are
+measured, for a growing number of damaged rectangles (one per moving
+sprite).
+
+Run from the repository root with::
+
+    python -m benchmarks.win_check
+"""
+import timeit
+
+import desper
+import numpy as np
+
+from nerissimo import game
+from nerissimo import graphics
+from nerissimo import packed
+
+
+def build_processors(seed=0):
+    """Build both processors, on the same random screen.
+
+    Return a dictionary of ``(processor, screen_surface_array)`` pairs,
+    by backend name. Both processors are part of a world, so that
+    the win event can be dispatched.
+    """
+    rng = np.random.default_rng(seed)
+    surface_array = (rng.integers(0, 2, (graphics.BONNET_WIDTH,
+                                         graphics.BONNET_HEIGHT))
+                     * 0xFF).astype(np.uint8)
+    bitmap = packed.PackedBitmap.from_surface_array(surface_array)
+
+    processors = {
+        'surface_array': game.WinConditionProcessor(surface_array),
+        'packed': game.PackedWinConditionProcessor(bitmap),
+    }
+    for processor in processors.values():
+        desper.World().add_processor(processor)
+
+    return processors
+
+
+def build_damage(rect_count: int, seed=0) -> list[graphics.Rect]:
+    """Build random damaged rectangles, as big as typical sprites."""
+    rng = np.random.default_rng(seed)
+    damage = []
+    for _ in range(rect_count):
+        w, h = rng.integers(4, 24, 2)
+        damage.append(graphics.clip_rect(
+            (int(rng.integers(0, graphics.BONNET_WIDTH - w)),
+             int(rng.integers(0, graphics.BONNET_HEIGHT - h)),
+             int(w), int(h))))
+
+    return damage
+
+
+def run(sprite_counts=(1, 10, 100, 1000), number=20):
+    """Time a damage notification followed by the check.
+
+    Return a nested dictionary of seconds per frame, by backend and
+    sprite count.
+    """
+    results = {}
+    for backend, processor in build_processors().items():
+        timings = results.setdefault(backend, {})
+        for sprite_count in sprite_counts:
+            damage = build_damage(sprite_count)
+
+            def frame():
+                processor.on_screen_damage(damage)
+                processor.process(1)
+
+            timings[sprite_count] = min(timeit.repeat(
+                frame, number=number, repeat=3)) / number
+
+    return results
+
+
+if __name__ == '__main__':
+    for backend, timings in run().items():
+        for sprite_count, seconds in timings.items():
+            print(f'{backend:>14} {sprite_count:5d} sprites: '
+                  f'{seconds * 1e6:10.1f} us/frame')
@@ -0,0 +1,56 @@
+"""Time level worlds being built, from scratch or from snapshots.
+
+Each level in :attr:`levels.transformer_list` is loaded repeatedly,
+either running its transformers every time (``rebuild``) or restoring
+a :class:`snapshot.WorldSnapshot` (``snapshot``). Headless platform
+transformers are used.
+
+Run from the repository root with::
+
+    python -m benchmarks.worlds
+"""
+import timeit
+
+import desper
+import sdl2
+from sdl2 import sdlttf as ttf
+
+from nerissimo import headless
+from nerissimo import levels
+from nerissimo import load_resources, register_levels
+
+
+def load(handle: desper.WorldHandle):
+    handle.clear()
+    handle()
+
+
+def run(number=20, packed=False):
+    """Time the loading of each level.
+
+    Return a nested dictionary of seconds per load, by path (rebuild or
+    snapshot) and level name.
+    """
+    sdl2.SDL_Init(0)
+    ttf.TTF_Init()
+    load_resources()
+
+    results = {}
+    for path, snapshots in (('rebuild', False), ('snapshot', True)):
+        register_levels(headless.game_world_transformer, packed,
+                        snapshots=snapshots)
+        timings = results[path] = {}
+        for level_name, _ in levels.transformer_list:
+            handle = desper.resource_map.get(f'worlds/{level_name}')
+            load(handle)        # Warm up caches (and take snapshots)
+            timings[level_name] = min(timeit.repeat(
+                lambda: load(handle), number=number, repeat=3)) / number
+            handle.clear()
+
+    return results
+
+
+if __name__ == '__main__':
+    for path, timings in run().items():
+        for level_name, seconds in timings.items():
+            print(f'{path:>8} {level_name:>20}: {seconds * 1e6:10.1f} us/load')
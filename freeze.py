@@ -1,10 +1,20 @@
 from cx_Freeze import setup, Executable
+import subprocess
 import sys
 
 TARGET = 'nerissimo'
 EXCLUDE = []
 PACKAGES = []
-INCLUDE_FILES = ['resources']
+# Resources are shipped as a single pack, loaded at startup when found
+# next to the executable (see nerissimo.resource_pack.PACK_FILENAME)
+PACK_FILENAME = 'resources.pack'
+INCLUDE_FILES = [PACK_FILENAME]
+
+# Importing nerissimo sets up the hardware, if any: build the pack
+# in a separate process
+if __name__ == '__main__':
+    subprocess.run([sys.executable, '-m', 'nerissimo.resource_pack',
+                    'resources', PACK_FILENAME], check=True)
 
 # Dependencies are automatically detected, but it might need
 # fine tuning.
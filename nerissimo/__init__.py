@@ -1,16 +1,31 @@
+import logging
 import sys
 import pathlib
 from functools import partial
 from collections import deque
+from typing import Optional
 
 import desper
 import sdl2
 from sdl2 import sdlttf as ttf
 
+from . import emulator
+
+# Stand-in hardware modules must be in place before importing bonnet
+if emulator.requested():
+    emulator.install()
+
+from . import assets
 from . import graphics
 from . import desktop
 from . import game
 from . import levels
+from . import movement
+from . import preload
+from . import profiling
+from . import scheduler
+from . import snapshot
+from . import surfaces
 
 try:
     from . import bonnet
@@ -26,7 +41,13 @@ LAYOUT_X_CELL_OFFSET = 1
 LAYOUT_Y_CELL_OFFSET = 1
 
 
-def start_game(on_bonnet: bool = False, window_scale: int = 1):
+def start_game(on_bonnet: bool = False, window_scale: int = 1,
+               packed: bool = False, step_rate: float = 30,
+               render_rate: Optional[float] = None, idle: bool = True,
+               profiler: Optional[profiling.Profiler] = None,
+               record: Optional[str] = None, array_movement: bool = False,
+               pack_filename: Optional[str] = None,
+               preload_levels: bool = True, snapshot_levels: bool = True):
     from .log import logger
     logger.info('window scale %d', window_scale)
     sdl2.SDL_Init(0)
@@ -41,50 +62,136 @@ def start_game(on_bonnet: bool = False, window_scale: int = 1):
                                        graphics.BONNET_HEIGHT * window_scale,
                                        0)
 
-    if getattr(sys, 'frozen', False):
-        resource_root = pathlib.Path(sys.executable).absolute().parent
-        logger.info('Game frozen, executable path is %s', resource_root)
-    else:
-        resource_root = pathlib.Path(__file__).absolute().parents[1]
-
-    directory_populator = desper.DirectoryResourcePopulator(
-        resource_root / 'resources',
-        trim_extensions=True)
-
-    directory_populator.add_rule('sprites', graphics.SurfaceHandle)
-    directory_populator.add_rule('fonts', graphics.TTFHandle)
-    directory_populator(desper.resource_map)
-
-    for level_name, level_transformer in levels.transformer_list:
-        resource_key = f'worlds/{level_name}'
-        desper.resource_map[resource_key] = desper.WorldHandle()
-        desper.resource_map.get(resource_key).transform_functions.append(level_transformer)
+    load_resources(pack_filename)
 
     platform_specific_transformer = desktop.game_world_transformer
+    wait_input = desktop.wait_input
     if on_bonnet:
         platform_specific_transformer = bonnet.game_world_transformer
-
-    # Platform specific world transformer
-    for world_handle in desper.resource_map['worlds'].handles.values():
-        logger.info(world_handle.key)
-        if world_handle.key != 'trailer_black_screen':
-            world_handle.transform_functions += [platform_specific_transformer,
-                                                 levels.base_level_transformer]
+        wait_input = bonnet.wait_input
+
+    recorder = None
+    extra_transformers = []
+    if array_movement:
+        extra_transformers.append(movement.world_transformer)
+
+    if record is not None:
+        from . import replay
+        recorder = replay.Recorder(record, 1 / step_rate)
+        extra_transformers.append(recorder.world_transformer)
+
+    register_levels(platform_specific_transformer, packed,
+                    extra_transformers, snapshot_levels)
+
+    # Fixed timestep pacing, replacing desper's variable timestep loop.
+    # Sleep when nothing is going on, unless told otherwise.
+    desper.default_loop = scheduler.FixedTimestepLoop(
+        scheduler.FrameScheduler(
+            1 / step_rate, 1 / (render_rate or step_rate)),
+        idle_timeout=game.idle_timeout if idle else None,
+        wait_input=wait_input)
+    if profiler is not None:
+        profiler.install(desper.default_loop)
 
     desper.default_loop.switch(desper.resource_map.get(f'worlds/{levels.transformer_list[0][0]}'))
     level_queue = deque(map(lambda pair: pair[0], levels.transformer_list))
+    # Build the next level while the current one is played
+    preloader = preload.WorldPreloader() if preload_levels else None
     try:
         while True:
+            if preloader is not None and len(level_queue) > 1:
+                preloader.preload(desper.resource_map.get(f'worlds/{level_queue[1]}'))
+
             try:
                 desper.default_loop.loop()
             except game.Next:
                 level_queue.rotate(-1)
+                if preloader is not None:
+                    preloader.wait()
                 desper.default_loop.switch(desper.resource_map.get(f'worlds/{level_queue[0]}'),
                                            clear_current=True)
+                surfaces.log_report(logging.DEBUG)
     except desper.Quit:
         pass
 
-    if not on_bonnet:       # Window exists on desktop only
+    if preloader is not None:
+        preloader.wait()
+
+    desper.default_loop.log_stats()
+    surfaces.log_report()
+
+    if recorder is not None:
+        recorder.close()
+
+    if on_bonnet:           # Let the last frame reach the display
+        bonnet.display_worker.close()
+        if bonnet.button_reader is not None:
+            bonnet.button_reader.stop()
+    else:                   # Window exists on desktop only
         sdl2.SDL_DestroyWindow(window)
 
     sdl2.SDL_Quit()
+
+
+def load_resources(pack_filename: Optional[str] = None):
+    """Populate the resource map with sprites and fonts.
+
+    Resources are read from the given pack file, if any (see
+    :mod:`resource_pack`), from the ``resources`` directory otherwise.
+    Frozen games use the pack next to the executable, if present.
+    """
+    from . import resource_pack
+    from .log import logger
+
+    if getattr(sys, 'frozen', False):
+        resource_root = pathlib.Path(sys.executable).absolute().parent
+        logger.info('Game frozen, executable path is %s', resource_root)
+        default_pack = resource_root / resource_pack.PACK_FILENAME
+        if pack_filename is None and default_pack.exists():
+            pack_filename = str(default_pack)
+    else:
+        resource_root = pathlib.Path(__file__).absolute().parents[1]
+
+    if pack_filename is not None:
+        logger.info('Loading resources from %s', pack_filename)
+        resource_pack.PackPopulator(pack_filename)(desper.resource_map)
+        return
+
+    directory_populator = desper.DirectoryResourcePopulator(
+        resource_root / 'resources',
+        trim_extensions=True)
+
+    directory_populator.add_rule('sprites', assets.SpriteHandle)
+    directory_populator.add_rule('fonts', graphics.TTFHandle)
+    directory_populator(desper.resource_map)
+
+
+def register_levels(platform_specific_transformer, packed: bool = False,
+                    extra_transformers=(), snapshots: bool = False):
+    """Add a world handle for each level to the resource map.
+
+    Levels are found under ``worlds/``, see
+    :attr:`levels.transformer_list`. Extra transformers are applied
+    last, to the same levels as the platform specific one.
+
+    Each level owns the surfaces built for it, until cleared (see
+    :mod:`surfaces`). If ``snapshots`` is ``True``, levels are built
+    once and then restored from snapshots (see :mod:`snapshot`).
+    """
+    from .log import logger
+
+    handle_type = snapshot.SnapshotWorldHandle if snapshots \
+        else surfaces.OwningWorldHandle
+    for level_name, level_transformer in levels.transformer_list:
+        resource_key = f'worlds/{level_name}'
+        desper.resource_map[resource_key] = handle_type()
+        desper.resource_map.get(resource_key).transform_functions.append(level_transformer)
+
+    # Platform specific world transformer
+    for world_handle in desper.resource_map['worlds'].handles.values():
+        logger.info(world_handle.key)
+        if world_handle.key != 'trailer_black_screen':
+            world_handle.transform_functions += [
+                platform_specific_transformer,
+                partial(levels.base_level_transformer, packed=packed),
+                *extra_transformers]
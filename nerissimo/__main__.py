@@ -5,8 +5,10 @@ OLED Bonnet, it can be played on any regular desktop computer.
 """
 import argparse
 from dataclasses import dataclass
+from typing import Optional
 
 from .log import logger
+from . import profiling
 from . import start_game
 
 # Detect whether we are on bonnet
@@ -26,6 +28,70 @@ Window scale. This has no effect when played on a bonnet. A value of 1
 sets the window size to exactly the display size of the bonnet (128x64).
 This is most likely too tiny. Defaults to 3.
 """
+PACKED_HELP = """
+Use the packed 1-bit rendering backend, which composes the screen on
+packed bits instead of one byte per pixel.
+"""
+STEP_RATE_HELP = """
+Simulation steps per second. The game is updated in fixed timesteps,
+whatever the actual performance. Defaults to 30.
+"""
+RENDER_RATE_HELP = """
+Maximum frames per second actually presented on screen. Defaults to
+the step rate. Under load, frames are skipped while the simulation
+keeps its pace.
+"""
+ARRAY_MOVEMENT_HELP = """
+Move entities through the struct of arrays movement engine, updating
+all positions in vectorized steps.
+"""
+NO_IDLE_HELP = """
+Keep the game loop running at full rate even when nothing is moving.
+By default, the game sleeps until the next input in such cases.
+"""
+NO_PRELOAD_HELP = """
+Build each level only when switching to it. By default, the next level
+is built in the background while the current one is played.
+"""
+NO_SNAPSHOT_HELP = """
+Build levels from scratch each time they are entered. By default, each
+level is built once and then restored from a snapshot.
+"""
+HEADLESS_HELP = """
+Headless mode. Run every level with no window and no display, as fast
+as possible, fed by scripted input. Simulated frames per second are
+reported for each level.
+"""
+FRAMES_HELP = """
+Frames to simulate for each level in headless mode. Defaults to 1000.
+"""
+SCRIPT_HELP = """
+Input script for headless mode. Each line is in the form
+"FRAME down|up KEY", KEY being an SDL scancode name (e.g. RIGHT). By
+default, a built-in script is repeated.
+"""
+PROFILE_HELP = """
+Profile processors and events, writing a JSON report to the given file
+on exit. On platforms supporting it, the report is also written when
+receiving SIGUSR1.
+"""
+PROFILE_EVERY_HELP = """
+Only profile one frame every N, to lower the overhead of profiling.
+Defaults to 1 (every frame).
+"""
+RECORD_HELP = """
+Record the key events of the session to the given file, for later
+replay.
+"""
+REPLAY_HELP = """
+Replay a recorded session headless, as fast as possible, checking that
+the screen matches the recorded one along the way.
+"""
+RESOURCE_PACK_HELP = """
+Load resources from the given pack file, built with
+"python -m nerissimo.resource_pack", instead of the resources
+directory.
+"""
 PLAYER_HELP = """
 Specify one or more player types for the game. Accepted player types
 are: "user", "random", "mmX". "user" is desigend for human input.
@@ -43,6 +109,21 @@ class Args:
     """Custom argument namespace for corso bonnet CLI."""
     desktop: bool = False
     scale: int = 3
+    packed: bool = False
+    step_rate: float = 30
+    render_rate: Optional[float] = None
+    no_idle: bool = False
+    array_movement: bool = False
+    no_preload: bool = False
+    no_snapshot: bool = False
+    headless: bool = False
+    frames: int = 1000
+    script: Optional[str] = None
+    profile: Optional[str] = None
+    profile_every: int = 1
+    record: Optional[str] = None
+    replay: Optional[str] = None
+    pack_filename: Optional[str] = None
 
 
 if __name__ == '__main__':
@@ -53,8 +134,63 @@ if __name__ == '__main__':
                         help=DESKTOP_HELP)
     parser.add_argument('-s', action='store', dest='scale', type=int,
                         help=SCALE_HELP)
+    parser.add_argument('-p', action='store_true', dest='packed',
+                        help=PACKED_HELP)
+    parser.add_argument('-f', action='store', dest='step_rate', type=float,
+                        help=STEP_RATE_HELP)
+    parser.add_argument('-r', action='store', dest='render_rate',
+                        type=float, help=RENDER_RATE_HELP)
+    parser.add_argument('-i', action='store_true', dest='no_idle',
+                        help=NO_IDLE_HELP)
+    parser.add_argument('-a', action='store_true', dest='array_movement',
+                        help=ARRAY_MOVEMENT_HELP)
+    parser.add_argument('--no-preload', action='store_true',
+                        dest='no_preload', help=NO_PRELOAD_HELP)
+    parser.add_argument('--no-snapshot', action='store_true',
+                        dest='no_snapshot', help=NO_SNAPSHOT_HELP)
+
+    parser.add_argument('--headless', action='store_true', dest='headless',
+                        help=HEADLESS_HELP)
+    parser.add_argument('--frames', action='store', dest='frames', type=int,
+                        help=FRAMES_HELP)
+    parser.add_argument('--script', action='store', dest='script',
+                        help=SCRIPT_HELP)
+
+    parser.add_argument('--profile', action='store', dest='profile',
+                        help=PROFILE_HELP)
+    parser.add_argument('--profile-every', action='store',
+                        dest='profile_every', type=int,
+                        help=PROFILE_EVERY_HELP)
+
+    parser.add_argument('--record', action='store', dest='record',
+                        help=RECORD_HELP)
+    parser.add_argument('--replay', action='store', dest='replay',
+                        help=REPLAY_HELP)
+    parser.add_argument('--pack', action='store', dest='pack_filename',
+                        help=RESOURCE_PACK_HELP)
 
     args = parser.parse_args(namespace=Args())
+    profiler = profiling.open_profiler(args.profile, args.profile_every)
+
+    if args.replay is not None:
+        from . import replay
+        results = replay.run(args.replay, packed=args.packed,
+                             profiler=profiler,
+                             array_movement=args.array_movement,
+                             pack_filename=args.pack_filename)
+        raise SystemExit(any(result['mismatches'] for result in results))
+
+    if args.headless:
+        from . import headless
+        script = None
+        if args.script is not None:
+            script = headless.load_script(args.script)
+
+        headless.run(frames=args.frames, step=1 / args.step_rate,
+                     packed=args.packed, script=script, profiler=profiler,
+                     array_movement=args.array_movement,
+                     pack_filename=args.pack_filename)
+        raise SystemExit
 
     # In the end, we are on bonnet only if it is actually detected
     on_bonnet = BONNET_DETECTED and not args.desktop
@@ -67,4 +203,11 @@ if __name__ == '__main__':
                        'Is this what you wanted? If you intend to run '
                        'on bonnet, remove option "-d".')
 
-    start_game(on_bonnet=on_bonnet, window_scale=args.scale)
+    start_game(on_bonnet=on_bonnet, window_scale=args.scale,
+               packed=args.packed, step_rate=args.step_rate,
+               render_rate=args.render_rate, idle=not args.no_idle,
+               profiler=profiler, record=args.record,
+               array_movement=args.array_movement,
+               pack_filename=args.pack_filename,
+               preload_levels=not args.no_preload,
+               snapshot_levels=not args.no_snapshot)
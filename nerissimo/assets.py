@@ -0,0 +1,171 @@
+"""Sprite normalization and on-disk asset cache.
+
+Sprites may be stored in any format understood by ``SDL_LoadBMP``.
+When loaded (see :class:`SpriteHandle`), they are normalized once
+into the engine's canonical format: RGB332 surfaces whose pixels are
+either ``0`` or ``0xFF`` (lit), so that xor composition and the
+packed backend behave the same whatever the source bit depth.
+
+Normalized sprites are persisted in a cache directory
+(:attr:`CACHE_DIR_VARIABLE`, or the user's cache directory), keyed by
+the source's path. Entries are valid as long as the source's
+modification time and size are unchanged, or its content hash is, so
+that later startups skip decoding.
+"""
+import hashlib
+import os
+import pathlib
+import struct
+from typing import Optional
+
+import numpy as np
+import sdl2
+from sdl2.ext import pixels2d
+
+from . import graphics
+from . import surfaces
+from .log import logger
+
+CACHE_DIR_VARIABLE = 'NERISSIMO_CACHE_DIR'
+
+# Bump when the canonical format changes, invalidating cached entries
+CACHE_VERSION = 1
+
+ENTRY_HEADER = struct.Struct('<BqQ32sHH')
+"""Version, source modification time (ns), source size, source hash,
+width and height. Followed by the pixels, column by column."""
+
+LIT = 0xFF
+
+# Pixels at least this bright (0-255) are lit
+LUMINANCE_THRESHOLD = 128
+
+
+def normalize(surface: graphics.LP_SDL_Surface) -> np.ndarray:
+    """Convert a surface of any format to a canonical array.
+
+    The array is indexed as ``[x, y]``, lit pixels are :attr:`LIT`.
+    """
+    converted = sdl2.SDL_ConvertSurfaceFormat(
+        surface, sdl2.SDL_PIXELFORMAT_RGB888, 0)
+    pixels = pixels2d(converted).astype(np.uint32)
+    sdl2.SDL_FreeSurface(converted)
+
+    red = pixels >> 16 & 0xFF
+    green = pixels >> 8 & 0xFF
+    blue = pixels & 0xFF
+    luminance = (299 * red + 587 * green + 114 * blue) // 1000
+    return np.where(luminance >= LUMINANCE_THRESHOLD, LIT, 0).astype(np.uint8)
+
+
+def decode(data: bytes) -> np.ndarray:
+    """Decode BMP data to a canonical array (see :func:`normalize`)."""
+    surface = sdl2.SDL_LoadBMP_RW(sdl2.SDL_RWFromConstMem(data, len(data)), 1)
+    if not surface:
+        raise ValueError(sdl2.SDL_GetError().decode())
+
+    array = normalize(surface)
+    sdl2.SDL_FreeSurface(surface)
+    return array
+
+
+def default_cache_dir() -> pathlib.Path:
+    directory = os.environ.get(CACHE_DIR_VARIABLE)
+    if directory:
+        return pathlib.Path(directory)
+
+    cache_home = os.environ.get('XDG_CACHE_HOME')
+    if cache_home:
+        return pathlib.Path(cache_home) / 'nerissimo'
+    return pathlib.Path.home() / '.cache' / 'nerissimo'
+
+
+class AssetCache:
+    """Normalized sprites persisted in a directory."""
+
+    def __init__(self, directory: Optional[os.PathLike] = None):
+        self.directory = pathlib.Path(directory or default_cache_dir())
+
+    def entry_path(self, filename: os.PathLike) -> pathlib.Path:
+        source = pathlib.Path(filename).absolute()
+        key = hashlib.blake2b(str(source).encode(), digest_size=8).hexdigest()
+        return self.directory / f'{source.stem}-{key}.sprite'
+
+    def load(self, filename: os.PathLike) -> np.ndarray:
+        """Get the canonical array of the given sprite file.
+
+        Decode it only if not cached, or if changed.
+        """
+        stat = os.stat(filename)
+        entry_path = self.entry_path(filename)
+        entry = self._read(entry_path)
+        if (entry is not None and entry['mtime'] == stat.st_mtime_ns
+                and entry['size'] == stat.st_size):
+            return entry['pixels']
+
+        with open(filename, 'rb') as file:
+            data = file.read()
+        digest = hashlib.blake2b(data, digest_size=32).digest()
+
+        if entry is not None and entry['digest'] == digest:
+            pixels = entry['pixels']
+        else:
+            logger.info('Decoding sprite %s', filename)
+            pixels = decode(data)
+
+        self._write(entry_path, pixels, stat, digest)
+        return pixels
+
+    def _read(self, entry_path: pathlib.Path) -> Optional[dict]:
+        try:
+            with open(entry_path, 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+        except OSError as error:
+            logger.warning('Cannot read cached sprite %s (%s)', entry_path,
+                           error)
+            return None
+
+        if len(data) < ENTRY_HEADER.size:
+            return None
+        version, mtime, size, digest, width, height = \
+            ENTRY_HEADER.unpack_from(data)
+        if (version != CACHE_VERSION
+                or len(data) != ENTRY_HEADER.size + width * height):
+            return None
+
+        pixels = np.frombuffer(data, dtype=np.uint8, offset=ENTRY_HEADER.size)
+        return {'pixels': pixels.reshape(width, height), 'mtime': mtime,
+                'size': size, 'digest': digest}
+
+    def _write(self, entry_path: pathlib.Path, pixels: np.ndarray,
+               stat: os.stat_result, digest: bytes):
+        # Written aside and then renamed, never leave partial entries
+        temporary_path = entry_path.with_suffix('.tmp')
+        header = ENTRY_HEADER.pack(CACHE_VERSION, stat.st_mtime_ns,
+                                   stat.st_size, digest, *pixels.shape)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(temporary_path, 'wb') as file:
+                file.write(header + np.ascontiguousarray(pixels).tobytes())
+            os.replace(temporary_path, entry_path)
+        except OSError as error:
+            logger.warning('Cannot cache sprite in %s (%s)', self.directory,
+                           error)
+
+
+asset_cache = AssetCache()
+
+
+class SpriteHandle(graphics.SurfaceHandle):
+    """Handle for sprites, normalized to the canonical format.
+
+    Normalized sprites are fetched from :attr:`asset_cache`.
+    """
+
+    def load(self) -> graphics.LP_SDL_Surface:
+        pixels = asset_cache.load(self.filename)
+        # Owned by the handle, not by the world loading it
+        with surfaces.detached():
+            return graphics.surface_from_array(pixels)
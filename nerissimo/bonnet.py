@@ -1,5 +1,5 @@
-import ctypes
 import enum
+import time
 
 import desper
 import busio
@@ -7,42 +7,22 @@ import board
 import adafruit_ssd1306
 import sdl2
 from digitalio import DigitalInOut, Direction, Pull
+from sdl2.ext import SurfaceArray
 
+from . import gpio
 from . import graphics
+from . import packed
+from . import ssd1306
+from .ssd1306 import fill_display
 
 # Create the I2C interface.
 i2c = busio.I2C(board.SCL, board.SDA)
 # Create the SSD1306 OLED class.
 display = adafruit_ssd1306.SSD1306_I2C(graphics.BONNET_WIDTH,
                                        graphics.BONNET_HEIGHT, i2c)
-
-_BUTTON_A_DIGITAL = DigitalInOut(board.D5)
-_BUTTON_A_DIGITAL.direction = Direction.INPUT
-_BUTTON_A_DIGITAL.pull = Pull.UP
-
-_BUTTON_B_DIGITAL = DigitalInOut(board.D6)
-_BUTTON_B_DIGITAL.direction = Direction.INPUT
-_BUTTON_B_DIGITAL.pull = Pull.UP
-
-_BUTTON_L_DIGITAL = DigitalInOut(board.D27)
-_BUTTON_L_DIGITAL.direction = Direction.INPUT
-_BUTTON_L_DIGITAL.pull = Pull.UP
-
-_BUTTON_R_DIGITAL = DigitalInOut(board.D23)
-_BUTTON_R_DIGITAL.direction = Direction.INPUT
-_BUTTON_R_DIGITAL.pull = Pull.UP
-
-_BUTTON_U_DIGITAL = DigitalInOut(board.D17)
-_BUTTON_U_DIGITAL.direction = Direction.INPUT
-_BUTTON_U_DIGITAL.pull = Pull.UP
-
-_BUTTON_D_DIGITAL = DigitalInOut(board.D22)
-_BUTTON_D_DIGITAL.direction = Direction.INPUT
-_BUTTON_D_DIGITAL.pull = Pull.UP
-
-_BUTTON_C_DIGITAL = DigitalInOut(board.D4)
-_BUTTON_C_DIGITAL.direction = Direction.INPUT
-_BUTTON_C_DIGITAL.pull = Pull.UP
+# Only transfer what changed since the last frame, in the background
+updater = ssd1306.PartialUpdater(display)
+display_worker = ssd1306.DisplayWorker(updater)
 
 
 class Button(enum.Enum):
@@ -56,16 +36,45 @@ class Button(enum.Enum):
     C = enum.auto()
 
 
-_BUTTONS = {
-    Button.A: _BUTTON_A_DIGITAL,
-    Button.B: _BUTTON_B_DIGITAL,
-    Button.L: _BUTTON_L_DIGITAL,
-    Button.R: _BUTTON_R_DIGITAL,
-    Button.U: _BUTTON_U_DIGITAL,
-    Button.D: _BUTTON_D_DIGITAL,
-    Button.C: _BUTTON_C_DIGITAL,
+_BUTTON_PINS = {
+    Button.A: board.D5,
+    Button.B: board.D6,
+    Button.L: board.D27,
+    Button.R: board.D23,
+    Button.U: board.D17,
+    Button.D: board.D22,
+    Button.C: board.D4,
 }
 
+# Prefer edge events, fall back to polling the lines each frame.
+# Emulated boards provide their own lines (see emulator).
+button_reader = gpio.open_button_reader(
+    {pin.id: button for button, pin in _BUTTON_PINS.items()},
+    lines=getattr(board, 'button_lines', None))
+
+_BUTTONS = {}
+if button_reader is None:
+    for button, pin in _BUTTON_PINS.items():
+        digital = DigitalInOut(pin)
+        digital.direction = Direction.INPUT
+        digital.pull = Pull.UP
+        _BUTTONS[button] = digital
+
+
+# When polling, how often buttons are checked while idle (seconds)
+IDLE_POLL_INTERVAL = 1 / 30
+
+
+def wait_input(timeout: float):
+    """Block until a button event is available, or the timeout expires.
+
+    When polling, simply sleep for a short while.
+    """
+    if button_reader is None:
+        time.sleep(min(timeout, IDLE_POLL_INTERVAL))
+    else:
+        button_reader.wait(timeout)
+
 
 _BONNET_TO_SDL_MAP = {
     Button.A: sdl2.SDL_SCANCODE_RETURN,
@@ -78,71 +87,53 @@ _BONNET_TO_SDL_MAP = {
 }
 
 
-def fill_display(display, surface):
-    pixels = ctypes.cast(surface.contents.pixels,
-                         ctypes.POINTER(ctypes.c_uint8))
-    for y in range(graphics.BONNET_HEIGHT):
-        for x in range(graphics.BONNET_WIDTH):
-            display.pixel(x, y, pixels[128 * y + x] & 1)
-
-
-@desper.event_handler('render')
+@desper.event_handler('render', graphics.ON_SCREEN_DAMAGE_EVENT_NAME)
 class RenderHandler(desper.Controller):
-    """Actually render screen to bonnet, on ``render`` event."""
-
-    def render(self):
-        screen_surface_entity, _ = self.world.get(graphics.ScreenSurface)[0]
-        screen_surface = self.world.get_component(screen_surface_entity,
-                                                  graphics.LP_SDL_Surface)
+    """Actually render screen to bonnet, on ``render`` event.
 
-        fill_display(display, screen_surface)
-        display.show()
+    Only the damaged areas of the screen are converted to the display's
+    format. If no damage was notified, the whole screen is converted.
+    If the screen is packed (see :mod:`packed`), its pages are copied
+    as they are.
 
-
-@desper.event_handler('on_dirty_render')
-class DirtyRenderLoopProcessor(desper.Processor):
-    """Dispatch ``update_screen_surface``, ``render`` events, if needed.
-
-    This implementation only updates and flips the screen if during the
-    frame a change is notified through the ``on_dirty_render`` event.
-    Since the game is extremely static, with nothing changes for entire
-    seconds, this is a lot of computation saved on the bonnet.
-    Not flipping the screen at all may be problematic on desktop
-    systems, let's keep it on the bonnet for the moment.
-
-    Could be potentially improved with more fine-grained dirty
-    rectangles.
+    Frames are transmitted by :attr:`display_worker`, not to stall the
+    game during I2C transfers.
     """
-    _dirty = False
 
-    def on_dirty_render(self):
-        """Store a dirty "bit" for this frame."""
-        self._dirty = True
+    def __init__(self):
+        self._damage = []
 
-    def process(self, dt):
-        if not self._dirty:
-            return
+    def on_screen_damage(self, rects):
+        """Accumulate damaged areas until the next render."""
+        self._damage += rects
 
-        self.world.dispatch('update_screen_surface')
-        self.world.dispatch('render')
+    def render(self):
+        screen_surface_entity, _ = self.world.get(graphics.ScreenSurface)[0]
+        screen_bitmap = self.world.get_component(screen_surface_entity,
+                                                 packed.PackedBitmap)
 
-        self._dirty = False
+        if screen_bitmap is not None:
+            ssd1306.copy_pages(display_worker, screen_bitmap.pages,
+                               self._damage or None)
+        else:
+            screen_surface_array = self.world.get_component(
+                screen_surface_entity, SurfaceArray)
+            fill_display(display_worker, screen_surface_array,
+                         self._damage or None)
+        self._damage.clear()
+        display_worker.submit()
 
 
 def game_world_transformer(handle: desper.WorldHandle, world: desper.World):
     """Instantiate game world (bonnet specific)."""
     world.add_processor(InputProcessor())
-    # world.add_processor(DirtyRenderLoopProcessor())
-    world.add_processor(graphics.RenderLoopProcessor(), 100)
+    world.add_processor(graphics.DirtyRenderLoopProcessor(), 100)
     world.create_entity(BonnetToSDLKeys())
 
     world.create_entity(RenderHandler())
 
     world.create_entity(QuitButtonHandler(Button.C))
 
-    # Notify a change to render during the game's first frame
-    world.dispatch('on_dirty_render')
-
 
 @desper.event_handler('on_bonnet_button_press')
 class QuitButtonHandler:
@@ -154,23 +145,55 @@ class QuitButtonHandler:
     def on_bonnet_button_press(self, button):
         """Handle event: quit if the designated button is pressed."""
         if button == self.button:
+            display_worker.close()
+            if button_reader is not None:
+                button_reader.stop()
             display.poweroff()
             desper.quit_loop()
 
 
 class InputProcessor(desper.Processor):
-    """Handle input events."""
+    """Handle input events.
+
+    Events queued by :attr:`button_reader` are dispatched, if
+    available, otherwise buttons are polled. A release following a
+    press of the same button in the same frame is postponed to the
+    next frame, so that even the shortest presses have an effect.
+    """
     _button_states = {}
 
+    def __init__(self):
+        self._postponed: list[gpio.ButtonEvent] = []
+
     def process(self, dt):
+        if button_reader is None:
+            self._poll()
+            return
+
+        events = self._postponed + button_reader.drain()
+        self._postponed = []
+        pressed = set()
+
+        for index, event in enumerate(events):
+            if not event.pressed and event.button in pressed:
+                self._postponed = events[index:]
+                break
+
+            if event.pressed:
+                pressed.add(event.button)
+                self.world.dispatch('on_bonnet_button_press', event.button)
+            else:
+                self.world.dispatch('on_bonnet_button_release', event.button)
+
+    def _poll(self):
         for button, digital in _BUTTONS.items():
-            # Detect down-up edge
             button_value = not digital.value
+
+            # Detect down-up edge
             if not self._button_states.get(button) and button_value:
                 self.world.dispatch('on_bonnet_button_press', button)
 
             # Detect up-down edge
-            button_value = not digital.value
             if self._button_states.get(button) and not button_value:
                 self.world.dispatch('on_bonnet_button_release', button)
 
@@ -0,0 +1,45 @@
+"""Coroutine processing aware of idle time.
+
+:class:`CoroutineProcessor` extends desper's one, so that the frame
+scheduler can tell when coroutines need the world to be processed (see
+:meth:`CoroutineProcessor.time_to_wake`) and let their timers advance
+while the loop sleeps (see :attr:`scheduler.ON_IDLE_EVENT_NAME`).
+"""
+import math
+
+import desper
+
+from .scheduler import ON_IDLE_EVENT_NAME
+
+
+@desper.event_handler(ON_IDLE_EVENT_NAME)
+class CoroutineProcessor(desper.CoroutineProcessor):
+    """Coroutine processor exposing its schedule.
+
+    Rely on this class, instead of the internals of
+    :class:`desper.CoroutineProcessor`.
+    """
+
+    def time_to_wake(self) -> float:
+        """Time until some coroutine is to run, in seconds.
+
+        ``0`` if some coroutine is active (i.e. runs every frame),
+        ``math.inf`` if none is waiting either.
+        """
+        # The active queue always holds a None sentinel
+        if len(self._active_queue) > 1:
+            return 0.
+        if self._wait_queue:
+            return max(0., self._wait_queue[0].wait_time - self._timer)
+        return math.inf
+
+    def on_idle(self, steps: int, dt: float):
+        """Advance timers as ``steps`` processed frames would.
+
+        No coroutine must be active or due in the meantime (see
+        :meth:`time_to_wake`).
+        """
+        # Same additions as process, for frames to be reproducible
+        for _ in range(steps):
+            if self._wait_queue:
+                self._timer += dt
@@ -22,10 +22,22 @@ class InputProcessor(desper.Processor):
                 self.world.dispatch('on_key_down', event.key.keysym.scancode)
             elif event.type == sdl2.SDL_KEYUP:
                 self.world.dispatch('on_key_up', event.key.keysym.scancode)
+            elif (event.type == sdl2.SDL_WINDOWEVENT
+                  and event.window.event == sdl2.SDL_WINDOWEVENT_EXPOSED):
+                # Window content was lost, render again
+                self.world.dispatch('on_dirty_render')
             elif event.type == sdl2.SDL_QUIT:
                 desper.quit_loop()
 
 
+def wait_input(timeout: float):
+    """Block until an SDL event is available, or the timeout expires.
+
+    The event is left in the queue, for :class:`InputProcessor`.
+    """
+    sdl2.SDL_WaitEventTimeout(None, max(1, int(timeout * 1000)))
+
+
 @desper.event_handler('on_key_down')
 class KeyLogger:
     """Log key downs for debug purposes."""
@@ -35,9 +47,20 @@ class KeyLogger:
         print('key down:', key)
 
 
-@desper.event_handler('render')
+@desper.event_handler('render', graphics.ON_SCREEN_DAMAGE_EVENT_NAME)
 class RenderHandler(desper.Controller):
-    """Actually render screen on ``render`` event."""
+    """Actually render screen on ``render`` event.
+
+    Only the damaged areas of the screen are updated. If no damage was
+    notified, the whole window is updated.
+    """
+
+    def __init__(self):
+        self._damage = []
+
+    def on_screen_damage(self, rects):
+        """Accumulate damaged areas until the next render."""
+        self._damage += rects
 
     def render(self):
         # Retrieve necessary surfaces (window, game screen)
@@ -46,15 +69,33 @@ class RenderHandler(desper.Controller):
                                                   graphics.LP_SDL_Surface)
         window_surface = sdl2.SDL_GetWindowSurface(nerissimo.window)
 
-        # Update window surface
-        sdl2.SDL_BlitScaled(screen_surface, None, window_surface, None)
-        sdl2.SDL_UpdateWindowSurface(nerissimo.window)
+        if not self._damage:
+            # Update window surface
+            sdl2.SDL_BlitScaled(screen_surface, None, window_surface, None)
+            sdl2.SDL_UpdateWindowSurface(nerissimo.window)
+            return
+
+        scale_x = window_surface.contents.w // graphics.BONNET_WIDTH
+        scale_y = window_surface.contents.h // graphics.BONNET_HEIGHT
+        window_rects = (sdl2.SDL_Rect * len(self._damage))()
+        for window_rect, (x, y, w, h) in zip(window_rects, self._damage):
+            window_rect.x, window_rect.y = x * scale_x, y * scale_y
+            window_rect.w, window_rect.h = w * scale_x, h * scale_y
+            # Blitting may clip the destination rectangle, pass a copy
+            sdl2.SDL_BlitScaled(screen_surface, sdl2.SDL_Rect(x, y, w, h),
+                                window_surface,
+                                sdl2.SDL_Rect(window_rect.x, window_rect.y,
+                                              window_rect.w, window_rect.h))
+
+        sdl2.SDL_UpdateWindowSurfaceRects(nerissimo.window, window_rects,
+                                          len(window_rects))
+        self._damage.clear()
 
 
 def game_world_transformer(handle: desper.WorldHandle,
                            world: desper.World):
     """Instantiate game world (desktop specific)."""
-    world.add_processor(graphics.RenderLoopProcessor(), 100)
+    world.add_processor(graphics.DirtyRenderLoopProcessor(), 100)
     world.add_processor(desktop.InputProcessor())
 
     world.create_entity(RenderHandler())
@@ -0,0 +1,44 @@
+"""Hardware-free stand-in for the bonnet.
+
+Provides replacements for the ``board``, ``busio``, ``digitalio`` and
+``adafruit_ssd1306`` modules, backed by an emulated I2C bus (with
+transfer timing) connected to an emulated SSD1306 controller, and by
+emulated button lines (see :mod:`.device`).
+
+Set the environment variable :attr:`ENVIRONMENT_VARIABLE` to run the
+bonnet code path on any machine, e.g.::
+
+    NERISSIMO_EMULATE_BONNET=1 python -m nerissimo
+
+The I2C clock frequency (Hz) is read from :attr:`FREQUENCY_VARIABLE`.
+A frequency of ``0`` makes transfers instantaneous.
+"""
+import importlib
+import os
+import sys
+
+ENVIRONMENT_VARIABLE = 'NERISSIMO_EMULATE_BONNET'
+FREQUENCY_VARIABLE = 'NERISSIMO_I2C_FREQUENCY'
+
+DEFAULT_FREQUENCY = 400_000
+
+MODULES = ('board', 'busio', 'digitalio', 'adafruit_ssd1306')
+
+
+def requested() -> bool:
+    """Whether emulation is requested through the environment."""
+    return os.environ.get(ENVIRONMENT_VARIABLE, '') not in ('', '0')
+
+
+def frequency() -> int:
+    """Get the requested I2C clock frequency."""
+    return int(os.environ.get(FREQUENCY_VARIABLE, DEFAULT_FREQUENCY))
+
+
+def install():
+    """Register the stand-in modules in place of the hardware ones.
+
+    Must be called before :mod:`nerissimo.bonnet` is imported.
+    """
+    for name in MODULES:
+        sys.modules[name] = importlib.import_module(f'.{name}', __name__)
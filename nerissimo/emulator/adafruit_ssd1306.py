@@ -0,0 +1,114 @@
+"""Stand-in for ``adafruit_ssd1306``, see :mod:`.board`.
+
+Mimics the I2C driver's transfers (initialization, commands and
+framebuffer writes), so that traffic on the emulated bus matches the
+real one.
+"""
+SET_CONTRAST = 0x81
+SET_ENTIRE_ON = 0xA4
+SET_NORM_INV = 0xA6
+SET_DISP = 0xAE
+SET_MEM_ADDR = 0x20
+SET_COL_ADDR = 0x21
+SET_PAGE_ADDR = 0x22
+SET_DISP_START_LINE = 0x40
+SET_SEG_REMAP = 0xA0
+SET_MUX_RATIO = 0xA8
+SET_COM_OUT_DIR = 0xC0
+SET_DISP_OFFSET = 0xD3
+SET_COM_PIN_CFG = 0xDA
+SET_DISP_CLK_DIV = 0xD5
+SET_PRECHARGE = 0xD9
+SET_VCOM_DESEL = 0xDB
+SET_CHARGE_PUMP = 0x8D
+
+
+class I2CDevice:
+    """Minimal ``adafruit_bus_device.i2c_device.I2CDevice``."""
+
+    def __init__(self, i2c, device_address: int):
+        self.i2c = i2c
+        self.device_address = device_address
+
+    def write(self, buf, *, start=0, end=None):
+        self.i2c.writeto(self.device_address, buf, start=start, end=end)
+
+    def __enter__(self):
+        while not self.i2c.try_lock():
+            pass
+        return self
+
+    def __exit__(self, *exc):
+        self.i2c.unlock()
+        return False
+
+
+class SSD1306_I2C:
+    """Emulated counterpart of the I2C driver (horizontal addressing)."""
+    page_addressing = False
+
+    def __init__(self, width: int, height: int, i2c, *, addr=0x3C,
+                 external_vcc=False, reset=None, page_addressing=False):
+        self.width = width
+        self.height = height
+        self.pages = height // 8
+        self.external_vcc = external_vcc
+        self.i2c_device = I2CDevice(i2c, addr)
+
+        self.temp = bytearray(2)
+        self.buffer = bytearray(self.pages * width + 1)
+        self.buffer[0] = 0x40
+        self.buf = memoryview(self.buffer)[1:]
+
+        self.init_display()
+
+    def init_display(self):
+        for cmd in (
+                SET_DISP,
+                SET_MEM_ADDR, 0x00,
+                SET_DISP_START_LINE,
+                SET_SEG_REMAP | 0x01,
+                SET_MUX_RATIO, self.height - 1,
+                SET_COM_OUT_DIR | 0x08,
+                SET_DISP_OFFSET, 0x00,
+                SET_COM_PIN_CFG, 0x02 if self.width > 2 * self.height
+                else 0x12,
+                SET_DISP_CLK_DIV, 0x80,
+                SET_PRECHARGE, 0x22 if self.external_vcc else 0xF1,
+                SET_VCOM_DESEL, 0x30,
+                SET_CONTRAST, 0xFF,
+                SET_ENTIRE_ON,
+                SET_NORM_INV,
+                SET_CHARGE_PUMP, 0x10 if self.external_vcc else 0x14,
+                SET_DISP | 0x01):
+            self.write_cmd(cmd)
+        self.fill(0)
+        self.show()
+
+    def fill(self, color: int):
+        self.buf[:] = (b'\xff' if color else b'\x00') * len(self.buf)
+
+    def poweroff(self):
+        self.write_cmd(SET_DISP)
+
+    def poweron(self):
+        self.write_cmd(SET_DISP | 0x01)
+
+    def show(self):
+        column_offset = (128 - self.width) // 2
+        self.write_cmd(SET_COL_ADDR)
+        self.write_cmd(column_offset)
+        self.write_cmd(column_offset + self.width - 1)
+        self.write_cmd(SET_PAGE_ADDR)
+        self.write_cmd(0)
+        self.write_cmd(self.pages - 1)
+
+        self.buffer[0] = 0x40
+        with self.i2c_device:
+            self.i2c_device.write(self.buffer)
+
+    def write_cmd(self, cmd: int):
+        self.temp[0] = 0x80
+        self.temp[1] = cmd
+        with self.i2c_device:
+            self.i2c_device.write(self.temp)
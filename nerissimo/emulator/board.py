@@ -0,0 +1,37 @@
+"""Stand-in for Blinka's ``board``: an emulated Raspberry Pi.
+
+Besides the pins, the emulated hardware is exposed: :attr:`oled` (the
+display controller), :attr:`i2c_bus` and :attr:`button_lines` (a
+:class:`gpio.FakeChip`, drive it to press bonnet buttons).
+"""
+from .. import emulator
+from .. import gpio
+from .device import I2CBus, SSD1306Model
+
+OLED_ADDRESS = 0x3C
+
+
+class Pin:
+    """GPIO pin, identified by its BCM number."""
+
+    def __init__(self, bcm: int):
+        self.id = bcm
+
+    def __repr__(self):
+        return f'Pin({self.id})'
+
+
+SDA = Pin(2)
+SCL = Pin(3)
+D4 = Pin(4)
+D5 = Pin(5)
+D6 = Pin(6)
+D17 = Pin(17)
+D22 = Pin(22)
+D23 = Pin(23)
+D27 = Pin(27)
+
+oled = SSD1306Model()
+i2c_bus = I2CBus({OLED_ADDRESS: oled}, emulator.frequency())
+button_lines = gpio.FakeChip((D4.id, D5.id, D6.id, D17.id, D22.id, D23.id,
+                              D27.id))
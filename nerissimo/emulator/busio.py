@@ -0,0 +1,28 @@
+"""Stand-in for Blinka's ``busio``, see :mod:`.board`."""
+from . import board
+
+
+class I2C:
+    """Access the emulated I2C bus.
+
+    As on Linux, the clock frequency cannot be set from here (see
+    :func:`emulator.frequency`).
+    """
+
+    def __init__(self, scl, sda, frequency=None):
+        self.bus = board.i2c_bus
+
+    def try_lock(self) -> bool:
+        return self.bus.lock.acquire(blocking=False)
+
+    def unlock(self):
+        self.bus.lock.release()
+
+    def writeto(self, address: int, buffer, *, start=0, end=None):
+        self.bus.write(address, buffer[start:end])
+
+    def scan(self) -> list[int]:
+        return list(self.bus.devices)
+
+    def deinit(self):
+        pass
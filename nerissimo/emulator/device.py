@@ -0,0 +1,180 @@
+"""Emulated I2C bus and SSD1306 controller."""
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from .. import ssd1306
+
+# Control bytes, see the SSD1306 datasheet
+CONTROL_CONTINUATION = 0x80
+CONTROL_DATA = 0x40
+
+# Commands, by number of argument bytes. Any other command has none.
+COMMAND_ARGUMENTS = {
+    0x20: 1,    # Memory addressing mode
+    0x21: 2,    # Column address
+    0x22: 2,    # Page address
+    0x26: 6, 0x27: 6,   # Horizontal scroll
+    0x29: 5, 0x2A: 5,   # Vertical and horizontal scroll
+    0x81: 1,    # Contrast
+    0x8D: 1,    # Charge pump
+    0xA3: 2,    # Vertical scroll area
+    0xA8: 1,    # Multiplex ratio
+    0xAD: 1,    # Internal current reference
+    0xD3: 1,    # Display offset
+    0xD5: 1,    # Clock divide
+    0xD9: 1,    # Precharge period
+    0xDA: 1,    # COM pins configuration
+    0xDB: 1,    # VCOMH deselect level
+}
+
+SET_MEM_ADDR = 0x20
+SET_DISP_OFF = 0xAE
+SET_DISP_ON = 0xAF
+
+HORIZONTAL_ADDRESSING = 0
+VERTICAL_ADDRESSING = 1
+PAGE_ADDRESSING = 2
+
+# Bits on the wire for each byte (including acknowledge), and for the
+# start condition, address byte and stop condition of a transaction
+BITS_PER_BYTE = 9
+TRANSACTION_OVERHEAD_BITS = 1 + BITS_PER_BYTE + 1
+
+
+class SSD1306Model:
+    """Emulate the SSD1306 protocol, on a page-major GDDRAM.
+
+    Only what affects the content of the GDDRAM is interpreted
+    (addressing modes and windows), other commands are parsed and
+    ignored. :attr:`gddram` has the same layout as
+    :func:`ssd1306.pack_pages` results.
+    """
+
+    def __init__(self, width: int = 128, pages: int = ssd1306.PAGES):
+        self.gddram = np.zeros((pages, width), dtype=np.uint8)
+        self.on = False
+        self.addressing = HORIZONTAL_ADDRESSING
+        self.columns = 0, width - 1
+        self.pages = 0, pages - 1
+        self.column = 0
+        self.page = 0
+        self._command: list[int] = []
+
+    def receive(self, data: bytes):
+        """Interpret a write transaction."""
+        if not data:
+            return
+
+        control, payload = data[0], data[1:]
+        if control & CONTROL_DATA:
+            self._write_data(payload)
+        elif control & CONTROL_CONTINUATION:
+            # Single command byte, followed by a new control byte
+            self._receive_command(payload[:1])
+            self.receive(payload[1:])
+        else:
+            self._receive_command(payload)
+
+    def to_surface_array(self) -> np.ndarray:
+        """Get the GDDRAM content as a ``(width, height)`` array.
+
+        Lit pixels are ``0xFF``.
+        """
+        bits = np.unpackbits(self.gddram, axis=0, bitorder='little')
+        return bits.T * np.uint8(0xFF)
+
+    def _receive_command(self, payload: bytes):
+        for byte in payload:
+            self._command.append(byte)
+            if len(self._command) > COMMAND_ARGUMENTS.get(self._command[0], 0):
+                self._execute(*self._command)
+                self._command.clear()
+
+    def _execute(self, command: int, *arguments: int):
+        if command == SET_MEM_ADDR:
+            self.addressing = arguments[0] & 0x03
+        elif command == ssd1306.SET_COL_ADDR:
+            self.columns = arguments
+            self.column = arguments[0]
+        elif command == ssd1306.SET_PAGE_ADDR:
+            self.pages = arguments
+            self.page = arguments[0]
+        elif command == SET_DISP_OFF:
+            self.on = False
+        elif command == SET_DISP_ON:
+            self.on = True
+        elif 0xB0 <= command <= 0xB7:       # Page start (page mode)
+            self.page = command & 0x07
+        elif command <= 0x0F:               # Lower column (page mode)
+            self.column = (self.column & 0xF0) | command
+        elif command <= 0x1F:               # Higher column (page mode)
+            self.column = (self.column & 0x0F) | ((command & 0x0F) << 4)
+
+    def _write_data(self, payload: bytes):
+        first_column, last_column = self.columns
+        first_page, last_page = self.pages
+
+        for byte in payload:
+            self.gddram[self.page, self.column] = byte
+
+            if self.addressing == PAGE_ADDRESSING:
+                self.column = (self.column + 1) % self.gddram.shape[1]
+            elif self.addressing == HORIZONTAL_ADDRESSING:
+                if self.column < last_column:
+                    self.column += 1
+                else:
+                    self.column = first_column
+                    self.page = (self.page + 1 if self.page < last_page
+                                 else first_page)
+            else:
+                if self.page < last_page:
+                    self.page += 1
+                else:
+                    self.page = first_page
+                    self.column = (self.column + 1
+                                   if self.column < last_column
+                                   else first_column)
+
+
+class I2CBus:
+    """Emulate an I2C bus, delivering writes to attached devices.
+
+    Each transaction blocks for the time it would take on the wire at
+    the given clock ``frequency`` (Hz, ``0`` for no delay). Transfer
+    statistics are kept in :attr:`transactions`, :attr:`bytes_written`
+    (payload only) and :attr:`bus_time` (seconds, overhead included).
+    """
+
+    def __init__(self, devices: dict, frequency: int):
+        self.devices = devices
+        self.frequency = frequency
+        self.lock = threading.Lock()
+
+        self.transactions = 0
+        self.bytes_written = 0
+        self.bus_time = 0.
+
+    def write(self, address: int, data: bytes):
+        """Write bytes to the device at the given address."""
+        device: Optional[SSD1306Model] = self.devices.get(address)
+        if device is None:
+            raise OSError(f'No I2C device at address {address:#x}')
+
+        bus_time = 0.
+        if self.frequency:
+            bus_time = ((TRANSACTION_OVERHEAD_BITS + BITS_PER_BYTE * len(data))
+                        / self.frequency)
+            time.sleep(bus_time)
+
+        device.receive(bytes(data))
+        self.transactions += 1
+        self.bytes_written += len(data)
+        self.bus_time += bus_time
+
+    def reset_stats(self):
+        self.transactions = 0
+        self.bytes_written = 0
+        self.bus_time = 0.
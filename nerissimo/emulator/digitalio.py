@@ -0,0 +1,34 @@
+"""Stand-in for Blinka's ``digitalio``, see :mod:`.board`.
+
+Only inputs are supported: their value is read from the emulated
+button lines (active low).
+"""
+import enum
+
+from . import board
+
+
+class Direction(enum.Enum):
+    INPUT = enum.auto()
+    OUTPUT = enum.auto()
+
+
+class Pull(enum.Enum):
+    UP = enum.auto()
+    DOWN = enum.auto()
+
+
+class DigitalInOut:
+    """Emulated GPIO pin."""
+    direction = Direction.INPUT
+    pull = None
+
+    def __init__(self, pin):
+        self.pin = pin
+
+    @property
+    def value(self) -> bool:
+        return not board.button_lines.pressed(self.pin.id)
+
+    def deinit(self):
+        pass
@@ -1,4 +1,5 @@
 import math
+from typing import Hashable, Optional
 
 import desper
 import sdl2
@@ -6,17 +7,21 @@ from sdl2.ext import SurfaceArray
 
 import numpy as np
 
+from . import coroutines
 from . import graphics
+from . import movement
+from . import packed
 from .log import logger
+from .ssd1306 import PAGE_HEIGHT, page_span
 
 ON_WIN_EVENT = 'on_win'
 
 
-class Velocity():
+class Velocity(movement.VelocityView):
     """Velociy component."""
 
     def __init__(self, x, y):
-        self.value = desper.math.Vec2(x, y)
+        super().__init__(desper.math.Vec2(x, y))
 
 
 @desper.event_handler('on_key_down', 'on_key_up')
@@ -54,9 +59,17 @@ class UserControlled(desper.Controller):
 
 
 class VelocityProcessor(desper.Processor):
-    """Add velocity to transform."""
+    """Add velocity to transform.
+
+    With :mod:`movement` arrays, this is done in a single step.
+    """
 
     def process(self, dt):
+        arrays = movement.get_arrays(self.world)
+        if arrays is not None:
+            arrays.integrate(dt)
+            return
+
         for entity, velocity in self.world.get(Velocity):
             transform = self.world.get_component(entity, desper.Transform2D)
 
@@ -72,56 +85,273 @@ class VelocityProcessor(desper.Processor):
                                    entity, velocity.value * (dt, dt))
 
 
+@desper.event_handler(graphics.ON_SCREEN_DAMAGE_EVENT_NAME)
 class WinConditionProcessor(desper.Processor):
-    """Dispatch :attr:`ON_WIN_EVENT` when whole screen is black."""
+    """Dispatch :attr:`ON_WIN_EVENT` when whole screen is black.
+
+    A running count of lit pixels is kept for each cell of the screen,
+    one column wide and one page (:attr:`ssd1306.PAGE_HEIGHT` rows)
+    tall. Only the cells covered by damaged rectangles (see
+    :attr:`graphics.ON_SCREEN_DAMAGE_EVENT_NAME`) are counted again,
+    all at once, and the check is only done on frames where damage was
+    notified.
+
+    If ``verify`` is ``True``, the running count is checked against a
+    full scan of the screen.
+    """
     _enabled = True
+    _pending = False
 
-    def __init__(self, screen_surface_array: np.ndarray):
+    def __init__(self, screen_surface_array: np.ndarray, verify: bool = False):
         self.screen_surface_array = screen_surface_array
+        self.verify = verify
+        self._cell_counts = self._count_cells()
+        self._damaged = np.zeros_like(self._cell_counts, dtype=bool)
+        self.lit_count = int(self._cell_counts.sum())
+
+    def _count_cells(self, cells: Optional[np.ndarray] = None) -> np.ndarray:
+        """Count lit pixels in screen cells, indexed as ``[x, page]``.
+
+        If given, only the cells selected by the ``cells`` mask are
+        counted, as a flat array.
+        """
+        width, height = self.screen_surface_array.shape
+        if height % PAGE_HEIGHT:
+            # The last page is cut by the screen's bottom edge
+            counts = np.add.reduceat(self.screen_surface_array != 0,
+                                     range(0, height, PAGE_HEIGHT), axis=1,
+                                     dtype=np.intp)
+            return counts if cells is None else counts[cells]
+
+        pixels = self.screen_surface_array.reshape(width, -1, PAGE_HEIGHT)
+        if cells is not None:
+            pixels = pixels[cells]
+        return np.count_nonzero(pixels, axis=-1)
+
+    def on_screen_damage(self, rects):
+        """Mark damaged cells, to be counted again."""
+        damaged = self._damaged
+        for rect in rects:
+            x, _, w, _ = rect
+            first_page, end_page = page_span(rect)
+            damaged[x:x + w, first_page:end_page] = True
+
+        self._pending = True
 
     def process(self, dt):
-        if not self._enabled:
+        if not self._enabled or not self._pending:
             return
+        self._pending = False
+
+        self._recount()
+        if self.verify:
+            self._verify()
 
-        if np.count_nonzero(self.screen_surface_array) == 0:
+        if self.lit_count == 0:
             logger.info('Win')
             self._enabled = False
             self.world.dispatch(ON_WIN_EVENT)
 
+    def _recount(self):
+        """Count lit pixels again in the damaged cells."""
+        damaged = self._damaged
+        counts = self._count_cells(damaged)
+        self.lit_count += int(counts.sum()
+                              - self._cell_counts[damaged].sum())
+        self._cell_counts[damaged] = counts
+        damaged[...] = False
+
+    def _verify(self):
+        """Check the running count against a full scan."""
+        cell_counts = self._count_cells()
+        if np.array_equal(cell_counts, self._cell_counts):
+            return
+
+        logger.warning('Lit pixels count diverged (%d, actually %d)',
+                       self.lit_count, cell_counts.sum())
+        self._cell_counts = cell_counts
+        self.lit_count = int(cell_counts.sum())
 
-@desper.event_handler(desper.ON_UPDATE_EVENT_NAME)
-class Oscillate(desper.Controller):
-    transform = desper.ComponentReference(desper.Transform2D)
-    _time = 0
 
-    def __init__(self, amplitude, freq, axis=0):
-        self.amplitude = amplitude
-        self.freq = freq
-        self.axis = axis
+# Amount of set bits for each byte value
+_POPCOUNT = np.array([bin(byte).count('1') for byte in range(256)],
+                     dtype=np.uint8)
+
 
-    def on_add(self, *args):
-        super().on_add(*args)
-        self.base = self.transform.position[self.axis]
+class PackedWinConditionProcessor(WinConditionProcessor):
+    """Dispatch :attr:`ON_WIN_EVENT` when whole packed screen is black.
 
-    def on_update(self, dt):
-        self._time += dt
+    Counterpart of :class:`WinConditionProcessor` for the packed
+    rendering backend: lit pixels are counted directly on the screen's
+    :class:`packed.PackedBitmap`, each cell being a byte.
+    """
+
+    def __init__(self, screen_bitmap: packed.PackedBitmap,
+                 verify: bool = False):
+        self.screen_bitmap = screen_bitmap
+        super().__init__(None, verify)
+
+    def _count_cells(self, cells: Optional[np.ndarray] = None) -> np.ndarray:
+        pages = self.screen_bitmap.pages.T
+        if cells is not None:
+            pages = pages[cells]
+        return _POPCOUNT[pages].astype(np.intp)
+
+
+@desper.event_handler(desper.ON_ADD_EVENT_NAME, desper.ON_REMOVE_EVENT_NAME)
+class Oscillate:
+    """Oscillate around the position held when added to an entity.
+
+    Each oscillator moves along an axis of the transform, as
+    ``amplitude * cos(time * freq + phase)``. More oscillators can be
+    added with :meth:`also`, those on the same axis are summed.
+    Oscillators are moved by the :class:`OscillationProcessor` of the
+    world.
+    """
+
+    def __init__(self, amplitude, freq, axis=0, phase=0.):
+        self.oscillators: list[tuple[float, float, int, float]] = []
+        self.times: list[float] = []
+        self.bases: dict[int, float] = {}
+        self.also(amplitude, freq, axis, phase)
+
+    def also(self, amplitude, freq, axis=0, phase=0.) -> 'Oscillate':
+        """Add an oscillator, return the component itself."""
+        self.oscillators.append((amplitude, freq, axis, phase))
+        self.times.append(0.)
+        return self
+
+    def on_add(self, entity, world):
+        processor = world.get_processor(OscillationProcessor)
+        if processor is not None:
+            processor.add(entity, self)
 
-        if self.axis == 0:
-            self.transform.position = desper.math.Vec2(self.base + self.amplitude
-                                                       * math.cos(self._time * self.freq),
-                                                       self.transform.position[1])
+    def on_remove(self, entity, world):
+        processor = world.get_processor(OscillationProcessor)
+        if processor is not None:
+            processor.remove(entity)
 
-        if self.axis == 1:
-            self.transform.position = desper.math.Vec2(self.transform.position[0],
-                                                       self.base + self.amplitude
-                                                       * math.cos(self._time * self.freq))
 
+class OscillationProcessor(desper.Processor):
+    """Move all :class:`Oscillate` entities, in a single pass.
 
-class Target:
+    Oscillator parameters are stored in arrays, rebuilt only when
+    oscillating entities change. If ``table_size`` is given, cosines
+    are approximated through a lookup table of such size (with linear
+    interpolation), which is cheaper on slow hardware.
+    """
+
+    def __init__(self, table_size: Optional[int] = None):
+        self._entries: dict[Hashable, Oscillate] = {}
+        self._adopted = False
+        self._dirty = True
+
+        self._table = None
+        if table_size is not None:
+            angles = np.linspace(0, 2 * math.pi, table_size + 1)
+            self._table = np.cos(angles)
+
+        self._rows: list[tuple[Oscillate, int, int]] = []
+        self._targets: list[tuple[desper.Transform2D, int, int]] = []
+        self._times = np.zeros(0)
+
+    def add(self, entity, oscillate: Oscillate):
+        """Start moving the given entity, around its current position."""
+        if self._entries.get(entity) is oscillate:
+            return
+
+        position = self.world.get_component(entity,
+                                            desper.Transform2D).position
+        oscillate.bases = {axis: position[axis]
+                           for _, _, axis, _ in oscillate.oscillators}
+        self._store_times()
+        self._entries[entity] = oscillate
+        self._dirty = True
+
+    def remove(self, entity):
+        """Stop moving the given entity."""
+        self._store_times()
+        if self._entries.pop(entity, None) is not None:
+            self._dirty = True
+
+    def process(self, dt):
+        if not self._adopted:
+            self._adopted = True
+            for entity, oscillate in self.world.get(Oscillate):
+                self.add(entity, oscillate)
+
+        if self._dirty:
+            self._build()
+        if not self._rows:
+            return
+
+        self._times += dt
+        offsets = self._amplitudes * self._cos(self._times * self._frequencies
+                                               + self._phases)
+        values = (self._group_bases
+                  + np.bincount(self._groups, offsets,
+                                minlength=len(self._group_bases))).tolist()
+
+        for transform, x_group, y_group in self._targets:
+            position = transform.position
+            transform.position = desper.math.Vec2(
+                values[x_group] if x_group >= 0 else position[0],
+                values[y_group] if y_group >= 0 else position[1])
+
+    def _cos(self, angles: np.ndarray) -> np.ndarray:
+        if self._table is None:
+            return np.cos(angles)
+
+        size = len(self._table) - 1
+        indices = np.mod(angles, 2 * math.pi) * (size / (2 * math.pi))
+        lower = np.minimum(indices.astype(np.intp), size - 1)
+        weights = indices - lower
+        return (self._table[lower] * (1 - weights)
+                + self._table[lower + 1] * weights)
+
+    def _store_times(self):
+        """Save elapsed times in the components, before a rebuild."""
+        times = self._times.tolist()
+        for oscillate, start, stop in self._rows:
+            oscillate.times = times[start:stop]
+
+    def _build(self):
+        """Rebuild the arrays from the oscillating entities."""
+        self._dirty = False
+        self._rows = []
+        self._targets = []
+        parameters = []
+        times = []
+        groups = []
+        group_bases = []
+
+        for entity, oscillate in self._entries.items():
+            transform = self.world.get_component(entity, desper.Transform2D)
+            axis_groups = [-1, -1]
+            for axis, base in oscillate.bases.items():
+                axis_groups[axis] = len(group_bases)
+                group_bases.append(base)
+
+            self._rows.append((oscillate, len(times),
+                               len(times) + len(oscillate.oscillators)))
+            self._targets.append((transform, *axis_groups))
+            for amplitude, freq, axis, phase in oscillate.oscillators:
+                parameters.append((amplitude, freq, phase))
+                groups.append(axis_groups[axis])
+            times += oscillate.times
+
+        parameters = np.array(parameters, dtype=float).reshape(-1, 3)
+        self._amplitudes, self._frequencies, self._phases = parameters.T
+        self._times = np.array(times, dtype=float)
+        self._groups = np.array(groups, dtype=np.intp)
+        self._group_bases = np.array(group_bases, dtype=float)
+
+
+class Target(movement.TargetView):
     """Target position for an entity."""
 
     def __init__(self, value: desper.math.Vec2):
-        self.value = value
+        super().__init__(value)
 
 
 @desper.event_handler('on_key_down')
@@ -136,14 +366,15 @@ class TrailerComponent(desper.Controller):
         if sym != sdl2.SDL_SCANCODE_RETURN:
             return
 
-        self.world.remove_processor(desper.OnUpdateProcessor)
+        self.world.remove_processor(OscillationProcessor)
         self.target = self._target
 
 
 def check_target(clip_rect, target: Target, shape) -> bool:
     """Check that a given candidate target is valid (within borders)."""
-    return not (target.value.x + shape[1] > clip_rect[2] or target.value.x < 0
-                or target.value.y + shape[0] > clip_rect[3] or target.value.y < 0)
+    lower, upper = graphics.clip_bounds(clip_rect, shape)
+    return (lower[0] <= target.value.x <= upper[0]
+            and lower[1] <= target.value.y <= upper[1])
 
 
 class Knight(desper.Controller):
@@ -218,9 +449,16 @@ class TargetProcessor(desper.Processor):
 
     This is a exp frame based interpolation. Some tricks to ensure
     that the target is reached.
+
+    With :mod:`movement` arrays, this is done in a single step.
     """
 
     def process(self, dt):
+        arrays = movement.get_arrays(self.world)
+        if arrays is not None:
+            arrays.seek_targets(dt)
+            return
+
         for entity, target in self.world.get(Target):
             transform = self.world.get_component(entity, desper.Transform2D)
             velocity = self.world.get_component(entity, Velocity)
@@ -263,6 +501,38 @@ class TargetSequence(desper.Controller):
         self._wait()
 
 
+# Entities owning one of these may move, all others are assumed static
+# (see graphics.ScreenSurfaceHandler)
+MOTION_COMPONENT_TYPES = (Velocity, Oscillate, Target, TargetSequence, Knight)
+
+
+def idle_timeout(world: desper.World) -> float:
+    """Get for how long the world can be left alone, waiting for input.
+
+    ``0`` is returned if anything is animating or is to be rendered.
+    Otherwise, the time until the next waiting coroutine resumes, or
+    ``math.inf`` if there is none (see
+    :class:`scheduler.FixedTimestepLoop`).
+    """
+    if any(world.get(component_type) for component_type
+           in (Oscillate, Target, AutoKnightMovement)):
+        return 0.
+
+    if any(velocity.value != (0, 0) for _, velocity in world.get(Velocity)):
+        return 0.
+
+    render_processor = world.get_processor(graphics.DirtyRenderLoopProcessor)
+    if render_processor is not None and render_processor.pending:
+        return 0.
+
+    coroutine_processor = world.get_processor(desper.CoroutineProcessor)
+    if coroutine_processor is None:
+        return math.inf
+    if not isinstance(coroutine_processor, coroutines.CoroutineProcessor):
+        return 0.       # Unknown schedule
+    return coroutine_processor.time_to_wake()
+
+
 @desper.event_handler('on_key_down')
 class QuitOnKey:
     """Quit game on given key press."""
@@ -0,0 +1,255 @@
+"""Edge driven button input.
+
+Instead of polling button lines each frame, a background thread waits
+for edge events and pushes timestamped, debounced button events in a
+queue, drained by the game loop (see :class:`bonnet.InputProcessor`).
+
+Lines are accessed through a minimal interface, implemented by
+:class:`GpiodLines` (Linux GPIO character device, libgpiod v2
+bindings) and :class:`FakeChip` (for testing without hardware).
+Buttons are assumed active low (pulled up, shorted to ground when
+pressed), as on the bonnet.
+"""
+import collections
+import threading
+import time
+from typing import Hashable, Iterable, NamedTuple, Optional
+
+from .log import logger
+
+DEFAULT_CHIP = '/dev/gpiochip0'
+CONSUMER = 'nerissimo'
+
+
+class LineEvent(NamedTuple):
+    """Edge on a line, as read from line sources."""
+    offset: int
+    pressed: bool
+    timestamp_ns: int
+
+
+class ButtonEvent(NamedTuple):
+    """Debounced button state change."""
+    button: Hashable
+    pressed: bool
+    timestamp_ns: int
+
+
+class GpiodLines:
+    """Request button lines through libgpiod (v2 bindings).
+
+    Lines are configured as pulled up inputs, with edge detection on
+    both edges. Timestamps come from the kernel, and are comparable to
+    :func:`time.monotonic_ns`.
+
+    Raise :class:`ImportError` if the bindings are not available and
+    :class:`OSError` if the lines cannot be requested.
+    """
+
+    def __init__(self, offsets: Iterable[int], chip_path: str = DEFAULT_CHIP):
+        import gpiod
+        from gpiod.line import Bias, Direction, Edge, Value
+
+        self._falling = gpiod.EdgeEvent.Type.FALLING_EDGE
+        self._inactive = Value.INACTIVE
+        self.offsets = tuple(offsets)
+        self._request = gpiod.request_lines(
+            chip_path, consumer=CONSUMER,
+            config={self.offsets: gpiod.LineSettings(
+                direction=Direction.INPUT, edge_detection=Edge.BOTH,
+                bias=Bias.PULL_UP)})
+
+    def wait(self, timeout: Optional[float]) -> bool:
+        """Wait for edge events, return whether any is available."""
+        return self._request.wait_edge_events(timeout)
+
+    def read(self) -> list[LineEvent]:
+        """Read available edge events (blocks if there are none)."""
+        return [LineEvent(event.line_offset,
+                          event.event_type == self._falling,
+                          event.timestamp_ns)
+                for event in self._request.read_edge_events()]
+
+    def pressed(self, offset: int) -> bool:
+        """Read the current state of a line."""
+        return self._request.get_value(offset) == self._inactive
+
+    def close(self):
+        self._request.release()
+
+
+class FakeChip:
+    """Stand-in for :class:`GpiodLines`, driven by hand.
+
+    Call :meth:`set` to simulate a line changing state (bounces
+    included). All lines start released.
+    """
+
+    def __init__(self, offsets: Iterable[int] = ()):
+        self.offsets = tuple(offsets)
+        self._states = {offset: False for offset in self.offsets}
+        self._events: collections.deque[LineEvent] = collections.deque()
+        self._condition = threading.Condition()
+
+    def set(self, offset: int, pressed: bool,
+            timestamp_ns: Optional[int] = None):
+        """Change the state of a line, queueing an edge event."""
+        if timestamp_ns is None:
+            timestamp_ns = time.monotonic_ns()
+
+        with self._condition:
+            if self._states[offset] != pressed:
+                self._states[offset] = pressed
+                self._events.append(LineEvent(offset, pressed, timestamp_ns))
+                self._condition.notify_all()
+
+    def wait(self, timeout: Optional[float]) -> bool:
+        with self._condition:
+            return self._condition.wait_for(lambda: self._events, timeout)
+
+    def read(self) -> list[LineEvent]:
+        with self._condition:
+            self._condition.wait_for(lambda: self._events)
+            events = list(self._events)
+            self._events.clear()
+        return events
+
+    def pressed(self, offset: int) -> bool:
+        return self._states[offset]
+
+    def close(self):
+        pass
+
+
+class ButtonReader:
+    """Read button events from lines, in a background thread.
+
+    ``buttons`` maps line offsets to the buttons they represent.
+    Events are appended to a deque (appends and pops are atomic, no
+    locking is required) and retrieved with :meth:`drain`. Use
+    :meth:`wait` to block until some are available.
+
+    Software debouncing: after an accepted change of state, a line
+    is ignored for ``debounce`` seconds. At the end of this window, its
+    state is read again, so that a change hidden in the bounces (e.g. a
+    very short tap) is never lost.
+    """
+
+    def __init__(self, lines, buttons: dict[int, Hashable],
+                 debounce: float = 0.005):
+        self.lines = lines
+        self.buttons = buttons
+        self.debounce_ns = int(debounce * 1e9)
+
+        self._events: collections.deque[ButtonEvent] = collections.deque()
+        self._available = threading.Event()
+        self._states = {offset: lines.pressed(offset) for offset in buttons}
+        self._last_change = {offset: -self.debounce_ns for offset in buttons}
+        self._settling: set[int] = set()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        """Start reading in a daemon thread."""
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='nerissimo-buttons')
+        self._thread.start()
+
+    def stop(self):
+        """Stop the reading thread and release the lines.
+
+        Stopping a reader that is not running has no effect.
+        """
+        if self._thread is None:
+            return
+
+        self._running = False
+        self._thread.join()
+        self._thread = None
+        self.lines.close()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for events, return whether any is available."""
+        return self._available.wait(timeout)
+
+    def drain(self) -> list[ButtonEvent]:
+        """Pop all the available events, oldest first."""
+        self._available.clear()
+        events = []
+        try:
+            while True:
+                events.append(self._events.popleft())
+        except IndexError:
+            return events
+
+    def _run(self):
+        while self._running:
+            if self.lines.wait(self._timeout()):
+                for event in self.lines.read():
+                    self._accept(event.offset, event.pressed,
+                                 event.timestamp_ns)
+
+            self._settle()
+
+    def _timeout(self) -> float:
+        """Time until the next debounce window ends (capped)."""
+        timeout = 0.1           # Check running state now and then
+        now = time.monotonic_ns()
+        for offset in self._settling:
+            timeout = min(timeout, max(0., (self._last_change[offset]
+                                            + self.debounce_ns - now) * 1e-9))
+        return timeout
+
+    def _accept(self, offset: int, pressed: bool, timestamp_ns: int):
+        if offset not in self.buttons:
+            return
+
+        if timestamp_ns - self._last_change[offset] < self.debounce_ns:
+            self._settling.add(offset)
+            return
+
+        if pressed == self._states[offset]:
+            return
+
+        self._states[offset] = pressed
+        self._last_change[offset] = timestamp_ns
+        self._events.append(ButtonEvent(self.buttons[offset], pressed,
+                                        timestamp_ns))
+        self._available.set()
+
+    def _settle(self):
+        """Read again lines whose debounce window is over."""
+        if not self._settling:
+            return
+
+        now = time.monotonic_ns()
+        for offset in tuple(self._settling):
+            if now - self._last_change[offset] >= self.debounce_ns:
+                self._settling.discard(offset)
+                self._accept(offset, self.lines.pressed(offset), now)
+
+
+def open_button_reader(buttons: dict[int, Hashable],
+                       chip_path: str = DEFAULT_CHIP,
+                       debounce: float = 0.005,
+                       lines=None) -> Optional[ButtonReader]:
+    """Start a :class:`ButtonReader` on the GPIO character device.
+
+    If given, ``lines`` are used instead of the character device (e.g.
+    a :class:`FakeChip`).
+
+    Return ``None`` if edge events are not available, in which case
+    the caller should fall back to polling.
+    """
+    if lines is None:
+        try:
+            lines = GpiodLines(buttons, chip_path)
+        except (ImportError, OSError) as error:
+            logger.warning('GPIO edge events unavailable (%s), polling '
+                           'buttons', error)
+            return None
+
+    reader = ButtonReader(lines, buttons, debounce)
+    reader.start()
+    return reader
@@ -1,12 +1,18 @@
 """Graphics rendering powered by SDL."""
 import ctypes
-import time
+import itertools
+from typing import Hashable, Optional
 
 import desper
-from desper.math import clamp, Vec2
+from desper.math import Vec2
 import sdl2
 from sdl2 import sdlttf as ttf
 from sdl2.ext import pixels2d, SurfaceArray
+import numpy as np
+
+from . import surfaces
+from .log import logger
+from .scheduler import ON_STEP_EVENT_NAME
 
 # Basic bonnet size, also used for window/surface dimenions
 BONNET_WIDTH = 128
@@ -47,20 +53,73 @@ class TTFHandle(desper.Handle):
         super().clear()
 
 
-def render_text(font_resource: str, text: str) -> LP_SDL_Surface:
-    """Render text with the given font resource."""
-    surface = ttf.TTF_RenderUTF8_Solid(desper.resource_map[font_resource],
-                                       text.encode(),
-                                       sdl2.SDL_Color())
-    # This gets rendered to a nasty bulky surface, get it to our space
-    return sdl2.SDL_ConvertSurfaceFormat(surface, sdl2.SDL_PIXELFORMAT_RGB332, 0)
-
-
 def prepare_surface_array_components(surface):
     """Return the pair: surface, an ndarray referencing it."""
     return surface, pixels2d(surface)
 
 
+Rect = tuple[int, int, int, int]
+"""Rectangle on the screen, as ``(x, y, w, h)``.
+
+``x`` is the horizontal coordinate. Mind that the axes are swapped in
+respect to :class:`desper.Transform2D` positions, where ``x`` is the
+vertical one (i.e. the row on the screen).
+"""
+
+SCREEN_RECT: Rect = (0, 0, BONNET_WIDTH, BONNET_HEIGHT)
+
+ON_SCREEN_DAMAGE_EVENT_NAME = 'on_screen_damage'
+
+
+def clip_rect(rect: Rect, bounds: Rect = SCREEN_RECT) -> Optional[Rect]:
+    """Return the intersection of the given rectangles, if any."""
+    x, y, w, h = rect
+    bounds_x, bounds_y, bounds_w, bounds_h = bounds
+    x0 = max(x, bounds_x)
+    y0 = max(y, bounds_y)
+    x1 = min(x + w, bounds_x + bounds_w)
+    y1 = min(y + h, bounds_y + bounds_h)
+
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def union_rect(rect: Rect, other: Rect) -> Rect:
+    """Return the bounding rectangle of the given rectangles."""
+    x0 = min(rect[0], other[0])
+    y0 = min(rect[1], other[1])
+    x1 = max(rect[0] + rect[2], other[0] + other[2])
+    y1 = max(rect[1] + rect[3], other[1] + other[3])
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def xor_blit(target: np.ndarray, source: np.ndarray,
+             rect: Rect) -> Optional[Rect]:
+    """Xor a surface array onto another, at the given rectangle.
+
+    Both arrays are indexed as ``[x, y]`` (see :func:`pixels2d`). The
+    rectangle is clipped to the target's bounds. The actually affected
+    rectangle is returned (``None`` if nothing was touched).
+    """
+    clipped = clip_rect(rect, (0, 0, *target.shape))
+    if clipped is None:
+        return None
+
+    x, y, w, h = clipped
+    source_x = x - rect[0]
+    source_y = y - rect[1]
+    target[x:x + w, y:y + h] ^= source[source_x:source_x + w,
+                                       source_y:source_y + h]
+    return clipped
+
+
+def sprite_rect(transform: desper.Transform2D, surface_array) -> Rect:
+    """Get the on screen rectangle of a sprite."""
+    int_pos = round(transform.position)
+    return int_pos.y, int_pos.x, surface_array.shape[0], surface_array.shape[1]
+
+
 class ScreenSurface:
     """ID component: identify the screen surface."""
 
@@ -75,26 +134,216 @@ class ScreenSurfaceHandler(desper.Controller):
     compatibility with the adafruit bonnet rendering implementation.
 
     Modded using numpy to use a xor blendmode.
+
+    Since xor is its own inverse, composition is incremental: the last
+    blitted rectangle of each sprite is stored, and only sprites that
+    moved, appeared or disappeared are xored out of their old
+    rectangle and into the new one. Changes in the content of sprite
+    surfaces are not detected.
+
+    After each composition, :attr:`ON_SCREEN_DAMAGE_EVENT_NAME` is
+    dispatched with the list of changed rectangles (:attr:`Rect`), if
+    any.
+
+    If ``incremental`` is ``False``, the screen is cleared and
+    composed from scratch each time (also done on the first
+    composition, or if the screen surface changes). If ``verify`` is
+    ``True``, incremental results are checked against a full
+    composition, falling back to the latter on mismatch.
+
+    If ``dynamic_types`` is given, sprites whose entities own none of
+    those component types are considered static: they are pre-baked
+    into a background layer, which is copied in place of clearing the
+    screen on full compositions and ignored altogether by incremental
+    ones. The layer is baked again whenever the set of static sprites
+    changes (e.g. an entity gains a movement component, or is
+    deleted) or one of them moves to a different pixel anyway.
     """
 
+    def __init__(self, incremental: bool = True, verify: bool = False,
+                 dynamic_types: Optional[tuple[type, ...]] = None):
+        self.incremental = incremental
+        self.verify = verify
+        self.dynamic_types = dynamic_types
+        self._blitted: dict[Hashable, tuple] = {}
+        self._target = None
+        self._static: dict[Hashable, SurfaceArray] = {}
+        self._layer = None
+        self._layer_watchers: list[_SpriteWatcher] = []
+
     def update_screen_surface(self):
         screen_surface_entity, _ = self.world.get(ScreenSurface)[0]
-        screen_surface = self.world.get_component(screen_surface_entity,
-                                                  LP_SDL_Surface)
-        screen_surface_array = self.world.get_component(screen_surface_entity,
-                                                        SurfaceArray)
-        sdl2.SDL_FillRect(screen_surface, None, 0)
-
+        target = self._get_target(screen_surface_entity)
+        if target is not self._target:
+            self._layer = None
+
+        layer_baked = self._update_static_layer(screen_surface_entity, target)
+        sprites = self._get_sprites(screen_surface_entity, self._static)
+
+        if (not self.incremental or target is not self._target
+                or layer_baked):
+            self._target = target
+            damage = self._compose_full(target, sprites)
+        else:
+            damage = self._compose_incremental(target, sprites)
+
+            if self.verify:
+                damage = self._verify(screen_surface_entity, target, sprites,
+                                      damage)
+
+        if damage:
+            self._flush(screen_surface_entity, damage)
+            self.world.dispatch(ON_SCREEN_DAMAGE_EVENT_NAME, damage)
+
+    def _get_target(self, screen_surface_entity) -> np.ndarray:
+        """Get the array sprites are composed onto."""
+        return self.world.get_component(screen_surface_entity, SurfaceArray)
+
+    def _get_sprite(self, entity, surface_array):
+        """Get what is actually blitted for the given sprite."""
+        return surface_array
+
+    def _blit(self, target, sprite, rect: Rect) -> Optional[Rect]:
+        """Xor a sprite onto the target, see :func:`xor_blit`."""
+        return xor_blit(target, sprite, rect)
+
+    def _flush(self, screen_surface_entity, damage: list[Rect]):
+        """Finalize damaged areas of the screen surface.
+
+        Nothing to do when composing directly on the screen surface.
+        """
+
+    def _get_sprites(self, screen_surface_entity,
+                     exclude=()) -> dict[Hashable, tuple]:
+        """Get sprites to render, with their on screen rectangle."""
+        sprites = {}
         for entity, surface in self.world.get(SurfaceArray):
-            if entity == screen_surface_entity:
+            if entity == screen_surface_entity or entity in exclude:
+                continue
+
+            transform = self.world.get_component(entity, desper.Transform2D)
+            if transform is None:
                 continue
 
-            transform: desper.Transform2D = self.world.get_component(
-                entity, desper.Transform2D)
+            sprites[entity] = (self._get_sprite(entity, surface),
+                               sprite_rect(transform, surface))
+
+        return sprites
+
+    def _find_static(self, screen_surface_entity) -> dict[Hashable, tuple]:
+        """Get surface arrays of entities owning no dynamic component."""
+        dynamic = {screen_surface_entity}
+        for component_type in self.dynamic_types:
+            dynamic.update(entity for entity, _
+                           in self.world.get(component_type))
 
-            int_pos = round(transform.position)
-            screen_surface_array[int_pos.y:int_pos.y+surface.shape[0],
-                                 int_pos.x:int_pos.x+surface.shape[1]] ^= surface
+        return {entity: surface
+                for entity, surface in self.world.get(SurfaceArray)
+                if entity not in dynamic}
+
+    def _update_static_layer(self, screen_surface_entity, target) -> bool:
+        """Bake static sprites again, if needed.
+
+        Return whether the layer was baked.
+        """
+        if self.dynamic_types is None:
+            return False
+
+        static = self._find_static(screen_surface_entity)
+        if (self._layer is not None and len(static) == len(self._static)
+                and all(self._static.get(entity) is surface
+                        for entity, surface in static.items())):
+            return False
+
+        for watcher in self._layer_watchers:
+            watcher.detach()
+        self._layer_watchers.clear()
+
+        layer = np.zeros_like(target)
+        for entity, surface in static.items():
+            transform = self.world.get_component(entity, desper.Transform2D)
+            if transform is None:
+                continue
+
+            self._blit(layer, self._get_sprite(entity, surface),
+                       sprite_rect(transform, surface))
+            self._layer_watchers.append(
+                _SpriteWatcher(self._invalidate_layer, surface, transform))
+
+        self._static = static
+        self._layer = layer
+        return True
+
+    def _invalidate_layer(self):
+        """Bake the static layer again on next composition."""
+        self._layer = None
+
+    def _compose_full(self, target, sprites) -> list[Rect]:
+        """Clear the screen and xor all sprites back in.
+
+        The screen is cleared to the static layer, if any.
+        """
+        if self._layer is None:
+            target[...] = 0
+        else:
+            target[...] = self._layer
+
+        for sprite, rect in sprites.values():
+            self._blit(target, sprite, rect)
+
+        self._blitted = dict(sprites)
+        return [SCREEN_RECT]
+
+    def _compose_incremental(self, target, sprites) -> list[Rect]:
+        """Xor only changed sprites out of and into the screen."""
+        blitted = self._blitted
+        damage = []
+
+        for entity, (sprite, rect) in sprites.items():
+            old = blitted.get(entity)
+            if old is not None and old[0] is sprite and old[1] == rect:
+                continue
+
+            new_rect = self._blit(target, sprite, rect)
+            old_rect = None
+            if old is not None:
+                old_rect = self._blit(target, *old)
+
+            if new_rect is not None and old_rect is not None:
+                damage.append(union_rect(new_rect, old_rect))
+            elif new_rect is not None or old_rect is not None:
+                damage.append(new_rect or old_rect)
+
+            blitted[entity] = sprite, rect
+
+        if len(blitted) != len(sprites):
+            for entity in tuple(blitted):
+                if entity not in sprites:
+                    old_rect = self._blit(target, *blitted.pop(entity))
+                    if old_rect is not None:
+                        damage.append(old_rect)
+
+        return damage
+
+    def _verify(self, screen_surface_entity, target, sprites,
+                damage) -> list[Rect]:
+        """Check the screen against a composition from scratch.
+
+        The static layer is not trusted either: all sprites are
+        blitted on a cleared screen.
+        """
+        reference = np.zeros_like(target)
+        for sprite, rect in self._get_sprites(screen_surface_entity).values():
+            self._blit(reference, sprite, rect)
+
+        if np.array_equal(reference, target):
+            return damage
+
+        logger.warning('Incremental composition diverged, recomposing')
+        self._invalidate_layer()
+        self._update_static_layer(screen_surface_entity, target)
+        self._compose_full(target, sprites)
+        return [SCREEN_RECT]
 
 
 class RenderLoopProcessor(desper.Processor):
@@ -105,47 +354,229 @@ class RenderLoopProcessor(desper.Processor):
         self.world.dispatch('render')
 
 
-class TimeProcessor(desper.Processor):
-    """Wait based on the given framerate cap."""
+@desper.event_handler(desper.ON_POSITION_CHANGE_EVENT_NAME)
+class _SpriteWatcher:
+    """Notify sprite movements through the given callback.
 
-    def __init__(self, interval=1 / 60):
-        self.interval = interval
-        self._start_time = time.perf_counter_ns()
+    Only changes that move the sprite to a different pixel are
+    notified.
+    """
 
-    def process(self, _):
-        processing_time = (time.perf_counter_ns() - self._start_time) * 1e-9
-        time.sleep(max(self.interval - processing_time, 0.))
+    def __init__(self, callback, surface_array, transform):
+        self.callback = callback
+        self.surface_array = surface_array
+        self.transform = transform
+        self.int_position = None
+
+        if transform is not None:
+            self.int_position = round(transform.position)
+            transform.add_handler(self)
+
+    def on_position_change(self, position):
+        int_position = round(position)
+        if int_position != self.int_position:
+            self.int_position = int_position
+            self.callback()
+
+    def detach(self):
+        if self.transform is not None:
+            self.transform.remove_handler(self)
+
+
+@desper.event_handler('on_dirty_render', ON_STEP_EVENT_NAME)
+class DirtyRenderLoopProcessor(desper.Processor):
+    """Dispatch ``update_screen_surface``, ``render`` events, if needed.
+
+    This implementation only updates and flips the screen if during the
+    frame a change is detected. Since the game is extremely static,
+    with nothing changing for entire seconds, this is a lot of
+    computation saved.
+
+    Changes are tracked automatically for all entities owning a
+    :class:`SurfaceArray`: their creation and deletion, a change of
+    surface or transform and any movement of their
+    :class:`desper.Transform2D` to a different pixel. Any other change
+    can be notified through the ``on_dirty_render`` event.
+
+    When run by a :class:`scheduler.FixedTimestepLoop`, the screen is
+    still updated on each step (keeping its users, e.g. the win
+    condition, deterministic), but ``render`` is only dispatched on
+    presented steps.
+    """
+    _dirty = True
+    _present = True
+    _rendered = True
+
+    def __init__(self):
+        self._watchers: dict[Hashable, _SpriteWatcher] = {}
+
+    def on_dirty_render(self):
+        """Store a dirty "bit" for this frame."""
+        self._dirty = True
+
+    def on_step(self, present: bool):
+        """Store whether the upcoming step is to be presented."""
+        self._present = present
+
+    @property
+    def pending(self) -> bool:
+        """Whether the screen is to be updated or rendered."""
+        return self._dirty or not self._rendered
+
+    def process(self, dt):
+        self._track_sprites()
+
+        if self._dirty:
+            self.world.dispatch('update_screen_surface')
+            self._dirty = False
+            self._rendered = False
 
-        self._start_time = time.perf_counter_ns()
+        if self._present and not self._rendered:
+            self.world.dispatch('render')
+            self._rendered = True
+
+    def _track_sprites(self):
+        """Watch new sprites, forget deleted ones."""
+        watchers = self._watchers
+        sprites = self.world.get(SurfaceArray)
+
+        for entity, surface_array in sprites:
+            watcher = watchers.get(entity)
+            transform = self.world.get_component(entity, desper.Transform2D)
+
+            if (watcher is None or watcher.surface_array is not surface_array
+                    or watcher.transform is not transform):
+                if watcher is not None:
+                    watcher.detach()
+                watchers[entity] = _SpriteWatcher(self.on_dirty_render,
+                                                  surface_array,
+                                                  transform)
+                self._dirty = True
+
+        if len(watchers) != len(sprites):
+            alive = {entity for entity, _ in sprites}
+            for entity in tuple(watchers):
+                if entity not in alive:
+                    watchers.pop(entity).detach()
+            self._dirty = True
 
 
 def build_surface(width: int, height: int, color: int) -> LP_SDL_Surface:
-    """Build a surface of given size and fill it with color."""
-    new_surface = sdl2.SDL_CreateRGBSurfaceWithFormat(
-        0, width, height, 1, sdl2.SDL_PIXELFORMAT_RGB332)
+    """Build a surface of given size and fill it with color.
+
+    The surface comes from :attr:`surfaces.pool`, and is owned by the
+    active owner, if any (see :mod:`surfaces`).
+    """
+    new_surface = surfaces.track(surfaces.pool.acquire(
+        width, height, sdl2.SDL_PIXELFORMAT_RGB332))
     sdl2.SDL_FillRect(new_surface, None, color)
 
     return new_surface
 
 
+def surface_from_array(array: np.ndarray) -> LP_SDL_Surface:
+    """Build a surface from an array indexed as ``[x, y]``."""
+    new_surface = build_surface(*array.shape, 0)
+    pixels2d(new_surface)[...] = array
+    return new_surface
+
+
+def clip_bounds(clip_rectangle, shape) -> tuple[tuple[float, float],
+                                                 tuple[float, float]]:
+    """Get the range of positions keeping a sprite in a rectangle.
+
+    ``clip_rectangle`` is in the same axes as
+    :class:`desper.Transform2D` positions (i.e. ``(top, left, bottom,
+    right)``), while ``shape`` is the one of the sprite's
+    :class:`SurfaceArray` (i.e. ``(w, h)``). Return the pair of
+    minimum and maximum positions.
+    """
+    return ((clip_rectangle[0], clip_rectangle[1]),
+            (clip_rectangle[2] - shape[1], clip_rectangle[3] - shape[0]))
+
+
+@desper.event_handler(desper.ON_ADD_EVENT_NAME, desper.ON_REMOVE_EVENT_NAME)
 class EnsureClipped:
-    """Ensure the transform of the given entity is clipped."""
+    """Ensure the transform of the given entity is clipped.
+
+    Clipping bounds are computed when added, a change of surface
+    afterwards is not taken into account.
+    """
+
+    def on_add(self, entity, world):
+        processor = world.get_processor(ClipTransformsProcessors)
+        if processor is not None:
+            processor.add(entity)
+
+    def on_remove(self, entity, world):
+        processor = world.get_processor(ClipTransformsProcessors)
+        if processor is not None:
+            processor.remove(entity)
 
 
 class ClipTransformsProcessors(desper.Processor):
-    """Ensure entities are clipped in the given rectangle (screen)."""
+    """Ensure entities are clipped in the given rectangle (screen).
+
+    Bounds are precomputed for each :class:`EnsureClipped` entity (see
+    :func:`clip_bounds`), all positions are then clamped at once. Only
+    transforms actually out of bounds are changed.
+    """
 
     def __init__(self, clip_rectangle):
         self.clip_rectangle = clip_rectangle
+        self._entries: dict[Hashable, tuple] = {}
+        self._adopted = False
+        self._dirty = True
+
+        self._transforms: list[desper.Transform2D] = []
+        self._lower = np.zeros((0, 2))
+        self._upper = np.zeros((0, 2))
+
+    def add(self, entity):
+        """Start clipping the given entity."""
+        if entity in self._entries:
+            return
+
+        lower, upper = clip_bounds(
+            self.clip_rectangle,
+            self.world.get_component(entity, SurfaceArray).shape)
+        self._entries[entity] = (
+            self.world.get_component(entity, desper.Transform2D),
+            lower, upper)
+        self._dirty = True
+
+    def remove(self, entity):
+        """Stop clipping the given entity."""
+        if self._entries.pop(entity, None) is not None:
+            self._dirty = True
 
     def process(self, _):
-        for entity, _ in self.world.get(EnsureClipped):
-            transform = self.world.get_component(entity, desper.Transform2D)
-            surface = self.world.get_component(entity, LP_SDL_Surface)
-
-            position_x = transform.position[0]
-            position_y = transform.position[1]
-            transform.position = Vec2(clamp(position_x, self.clip_rectangle[0],
-                                            self.clip_rectangle[2] - surface.contents.h),
-                                      clamp(position_y, self.clip_rectangle[1],
-                                            self.clip_rectangle[3] - surface.contents.w))
+        if not self._adopted:
+            self._adopted = True
+            for entity, _ in self.world.get(EnsureClipped):
+                self.add(entity)
+
+        if self._dirty:
+            self._dirty = False
+            self._transforms = [transform for transform, _, _
+                                in self._entries.values()]
+            self._lower = np.array([lower for _, lower, _
+                                    in self._entries.values()],
+                                   dtype=float).reshape(-1, 2)
+            self._upper = np.array([upper for _, _, upper
+                                    in self._entries.values()],
+                                   dtype=float).reshape(-1, 2)
+
+        if not self._transforms:
+            return
+
+        # Vec2 is slow to convert as a whole, go through its coordinates
+        positions = np.fromiter(
+            itertools.chain.from_iterable(
+                transform.position for transform in self._transforms),
+            float, 2 * len(self._transforms)).reshape(-1, 2)
+        # Same as desper's clamp (lower bound wins on tiny rectangles)
+        clipped = np.maximum(np.minimum(positions, self._upper), self._lower)
+
+        for index in np.flatnonzero((clipped != positions).any(axis=1)):
+            self._transforms[index].position = Vec2(*clipped[index].tolist())
@@ -0,0 +1,181 @@
+"""Headless simulation: no window, no display, no throttling.
+
+Levels are built as usual, but input comes from a script and rendered
+frames are simply counted. Each level is processed in fixed timesteps
+as fast as possible, measuring the simulated frames per second.
+"""
+import time
+from functools import partial
+from typing import Iterable, Optional
+
+import desper
+import sdl2
+from sdl2 import sdlttf as ttf
+
+from . import game
+from . import graphics
+from . import levels
+from . import movement
+from . import profiling
+from . import surfaces
+from . import load_resources, register_levels
+from .log import logger
+
+Script = dict[int, list[tuple[str, int]]]
+"""Scripted input, as ``{frame: [(event_name, scancode), ...]}``."""
+
+# Roam around, repeated every DEFAULT_SCRIPT_PERIOD frames
+DEFAULT_SCRIPT: Script = {
+    3: [('on_key_down', sdl2.SDL_SCANCODE_RIGHT)],
+    20: [('on_key_up', sdl2.SDL_SCANCODE_RIGHT)],
+    22: [('on_key_down', sdl2.SDL_SCANCODE_DOWN)],
+    30: [('on_key_up', sdl2.SDL_SCANCODE_DOWN)],
+    40: [('on_key_down', sdl2.SDL_SCANCODE_LEFT)],
+    45: [('on_key_up', sdl2.SDL_SCANCODE_LEFT)],
+    50: [('on_key_down', sdl2.SDL_SCANCODE_UP)],
+    52: [('on_key_up', sdl2.SDL_SCANCODE_UP)],
+    60: [('on_key_down', sdl2.SDL_SCANCODE_RIGHT)],
+    61: [('on_key_up', sdl2.SDL_SCANCODE_RIGHT)],
+    90: [('on_key_down', sdl2.SDL_SCANCODE_DOWN)],
+    91: [('on_key_up', sdl2.SDL_SCANCODE_DOWN)],
+    100: [('on_key_down', sdl2.SDL_SCANCODE_RETURN)],
+    101: [('on_key_up', sdl2.SDL_SCANCODE_RETURN)],
+}
+DEFAULT_SCRIPT_PERIOD = 120
+
+_SCRIPT_EVENTS = {'down': 'on_key_down', 'up': 'on_key_up'}
+
+
+def load_script(filename: str) -> Script:
+    """Load a script from a text file.
+
+    Each line is in the form ``FRAME down|up KEY``, where ``KEY`` is the
+    name of an SDL scancode without prefix (e.g. ``10 down RIGHT``).
+    Empty lines and lines starting with ``#`` are ignored.
+    """
+    script: Script = {}
+    with open(filename) as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+
+            frame, kind, key = line.split()
+            script.setdefault(int(frame), []).append(
+                (_SCRIPT_EVENTS[kind], getattr(sdl2, f'SDL_SCANCODE_{key}')))
+
+    return script
+
+
+class ScriptedInputProcessor(desper.Processor):
+    """Dispatch key events from a script, frame by frame.
+
+    If ``period`` is given, the script is repeated with such period.
+    """
+
+    def __init__(self, script: Script, period: Optional[int] = None):
+        self.script = script
+        self.period = period
+        self.frame = 0
+
+    def process(self, dt):
+        frame = self.frame
+        if self.period:
+            frame %= self.period
+
+        for event_name, scancode in self.script.get(frame, ()):
+            self.world.dispatch(event_name, scancode)
+
+        self.frame += 1
+
+
+@desper.event_handler('render')
+class NullRenderHandler:
+    """Count ``render`` events, without rendering anything."""
+    renders = 0
+
+    def render(self):
+        self.renders += 1
+
+
+def game_world_transformer(handle: desper.WorldHandle, world: desper.World,
+                           script: Script = DEFAULT_SCRIPT,
+                           period: Optional[int] = DEFAULT_SCRIPT_PERIOD):
+    """Instantiate game world (headless)."""
+    world.add_processor(ScriptedInputProcessor(script, period))
+    world.add_processor(graphics.DirtyRenderLoopProcessor(), 100)
+    world.create_entity(NullRenderHandler())
+
+
+def run(frames: int = 1000, step: float = 1 / 30, packed: bool = False,
+        script: Optional[Script] = None,
+        level_names: Optional[Iterable[str]] = None,
+        profiler: Optional[profiling.Profiler] = None,
+        array_movement: bool = False,
+        pack_filename: Optional[str] = None) -> dict[str, dict]:
+    """Process each level for the given number of frames, unthrottled.
+
+    A level ends early if won. If no script is given, the default one
+    is repeated. If ``array_movement`` is ``True``, the
+    :mod:`movement` arrays are used. Resources are loaded from
+    ``pack_filename``, if given. Return a dictionary of results, by
+    level name.
+    """
+    sdl2.SDL_Init(0)
+    ttf.TTF_Init()
+    load_resources(pack_filename)
+
+    if script is None:
+        transformer = game_world_transformer
+    else:
+        transformer = partial(game_world_transformer, script=script,
+                              period=None)
+    register_levels(transformer, packed,
+                    [movement.world_transformer] if array_movement else ())
+
+    if profiler is not None:
+        profiler.install(desper.default_loop)
+
+    if level_names is None:
+        level_names = [name for name, _ in levels.transformer_list]
+
+    results = {}
+    try:
+        for level_name in level_names:
+            results[level_name] = run_level(
+                desper.resource_map.get(f'worlds/{level_name}'), frames, step)
+            logger.info('%s: %s', level_name, ', '.join(
+                f'{key}={value:.2f}' if isinstance(value, float)
+                else f'{key}={value}'
+                for key, value in results[level_name].items()))
+    except desper.Quit:
+        pass
+
+    surfaces.log_report()
+    sdl2.SDL_Quit()
+    return results
+
+
+def run_level(handle: desper.WorldHandle, frames: int,
+              step: float) -> dict:
+    """Process a level as fast as possible, see :func:`run`."""
+    desper.default_loop.switch(handle, clear_next=True)
+    world = desper.default_loop.current_world
+
+    processed = 0
+    won = False
+    start = time.perf_counter()
+    try:
+        while processed < frames:
+            processed += 1
+            world.process(step)
+    except game.Next:
+        won = True
+    elapsed = time.perf_counter() - start
+
+    renders = sum(handler.renders
+                  for _, handler in world.get(NullRenderHandler))
+    handle.clear()
+
+    return {'frames': processed, 'renders': renders, 'won': won,
+            'seconds': elapsed, 'fps': processed / elapsed}
@@ -2,30 +2,45 @@ import desper
 import sdl2
 from sdl2 import sdlttf as ttf
 
+from . import coroutines
 from . import graphics
 from . import game
+from . import packed as packed_backend
+from . import text
 from .log import logger
 
 
 def base_level_transformer(handle: desper.WorldHandle,
                            world: desper.World,
-                           framerate: float = 1 / 30):
-    """Common to all levels."""
-    world.add_processor(desper.CoroutineProcessor())
-    world.add_processor(graphics.TimeProcessor())
+                           packed: bool = False):
+    """Common to all levels.
+
+    If ``packed`` is ``True``, the packed 1-bit rendering backend is
+    used (see :mod:`packed`).
+
+    Frame pacing is not handled here, see :mod:`scheduler`.
+    """
+    world.add_processor(coroutines.CoroutineProcessor())
 
     # Setup screen rendering
-    world.create_entity(graphics.ScreenSurfaceHandler())
     screen_surface, screen_surface_array = graphics.prepare_surface_array_components(
-            sdl2.SDL_CreateRGBSurfaceWithFormat(0, graphics.BONNET_WIDTH,
-                                                graphics.BONNET_HEIGHT, 1,
-                                                sdl2.SDL_PIXELFORMAT_RGB332))
+            graphics.build_surface(graphics.BONNET_WIDTH,
+                                   graphics.BONNET_HEIGHT, 0))
     world.create_entity(
         graphics.ScreenSurface(), screen_surface, screen_surface_array)
 
-    world.add_processor(graphics.TimeProcessor(framerate))
+    if packed:
+        world.create_entity(packed_backend.PackedScreenSurfaceHandler(
+            dynamic_types=game.MOTION_COMPONENT_TYPES))
+        screen_bitmap = packed_backend.add_screen_bitmap(world)
+        win_condition = game.PackedWinConditionProcessor(screen_bitmap)
+    else:
+        world.create_entity(graphics.ScreenSurfaceHandler(
+            dynamic_types=game.MOTION_COMPONENT_TYPES))
+        win_condition = game.WinConditionProcessor(screen_surface_array)
+
     world.add_processor(game.VelocityProcessor())
-    world.add_processor(game.WinConditionProcessor(screen_surface_array), 1000)
+    world.add_processor(win_condition, 1000)
     world.add_processor(graphics.ClipTransformsProcessors((0, 0, graphics.BONNET_HEIGHT,
                                                            graphics.BONNET_WIDTH)), 99)
 
@@ -72,7 +87,7 @@ def base_squarechase_level_transformer(handle: desper.WorldHandle,
 def base_nerissimo_level_transformer(handle: desper.WorldHandle,
                                      world: desper.World):
     """Title drop."""
-    nerissimo = graphics.render_text('fonts/exepixelperfect', 'NERISSIMO')
+    nerissimo = text.render_text('fonts/exepixelperfect', 'NERISSIMO')
 
     world.create_entity(
         desper.Transform2D(position=(2, 2)),
@@ -89,46 +104,40 @@ def base_nerissimo_level_transformer(handle: desper.WorldHandle,
 def base_restart_level_transformer(handle: desper.WorldHandle,
                                    world: desper.World):
     """End."""
-    text = graphics.render_text('fonts/exepixelperfect', 'RESTART')
+    restart = text.render_text('fonts/exepixelperfect', 'RESTART')
 
     world.create_entity(
         desper.Transform2D(position=(2, 2)),
-        *graphics.prepare_surface_array_components(text),
+        *graphics.prepare_surface_array_components(restart),
         game.Velocity(0, 0),
         game.UserControlled(),
         graphics.EnsureClipped())
 
     world.create_entity(
         desper.Transform2D(position=(20, 2)),
-        *graphics.prepare_surface_array_components(text))
+        *graphics.prepare_surface_array_components(restart))
 
 
 def base_nerissimo_trailer_level_transformer(handle: desper.WorldHandle,
                                              world: desper.World):
     """Title drop trailer."""
-    nerissimo = graphics.render_text('fonts/exepixelperfect', 'NERISSIMO')
-
-    # Cheap trick to get two components of the same type on an entity
-    class O2(game.Oscillate):
-        pass
+    nerissimo = text.render_text('fonts/exepixelperfect', 'NERISSIMO')
 
     target = game.Target(desper.math.Vec2(13, 10))
 
     world.create_entity(
         desper.Transform2D(position=(10, 10)),
         *graphics.prepare_surface_array_components(nerissimo),
-        game.Oscillate(7, 3.5, 0),
-        O2(5, 5, 1),
+        game.Oscillate(7, 3.5, 0).also(5, 5, 1),
         game.TrailerComponent(target))
 
     world.create_entity(
         desper.Transform2D(position=(15, 10)),
         *graphics.prepare_surface_array_components(nerissimo),
-        game.Oscillate(7, 5.5, 0),
-        O2(5, 3, 1),
+        game.Oscillate(7, 5.5, 0).also(5, 3, 1),
         game.TrailerComponent(target))
 
-    world.add_processor(desper.OnUpdateProcessor())
+    world.add_processor(game.OscillationProcessor())
     world.add_processor(game.TargetProcessor())
 
 
@@ -156,7 +165,7 @@ def base_crossing_level_transformer(handle: desper.WorldHandle,
         desper.Transform2D(position=(22, 49)),
         *graphics.prepare_surface_array_components(graphics.build_surface(20, 20, 0xFF)))
 
-    world.add_processor(desper.OnUpdateProcessor())
+    world.add_processor(game.OscillationProcessor())
 
 
 def base_crossing2_level_transformer(handle: desper.WorldHandle,
@@ -179,7 +188,7 @@ def base_crossing2_level_transformer(handle: desper.WorldHandle,
         *graphics.prepare_surface_array_components(graphics.build_surface(20, 20, 0xFF)),
         game.Oscillate(-20, 2.3))
 
-    world.add_processor(desper.OnUpdateProcessor())
+    world.add_processor(game.OscillationProcessor())
 
 
 def base_knight_level_transformer(handle: desper.WorldHandle,
@@ -0,0 +1,269 @@
+"""Optional struct of arrays movement engine.
+
+When :func:`world_transformer` is applied to a world, positions,
+velocities and targets of moving entities are kept in contiguous
+arrays (:class:`MovementArrays`), indexed by slot. Velocity
+integration and target interpolation then run as vectorized steps,
+instead of per entity loops (see :class:`game.VelocityProcessor` and
+:class:`game.TargetProcessor`).
+
+Components deriving from :class:`VelocityView` and
+:class:`TargetView` (i.e. :class:`game.Velocity` and
+:class:`game.Target`) become views onto such arrays while attached to
+an entity, so that their users are not affected. Each entity's
+:class:`desper.Transform2D` stays the reference for its position:
+external changes are tracked through its events, and results are
+written back to it (only when they differ).
+"""
+from typing import Hashable, Optional
+
+import desper
+import numpy as np
+from desper.math import Vec2
+
+from .log import logger
+
+# Target interpolation factor and minimum speed (pixels per frame)
+TARGET_FACTOR = 0.2
+TARGET_MIN_SPEED = 0.5
+TARGET_MIN_DT = 1 / 20
+
+INITIAL_CAPACITY = 16
+
+
+@desper.event_handler(desper.ON_ADD_EVENT_NAME, desper.ON_REMOVE_EVENT_NAME)
+class ArrayComponent:
+    """Base class for components backed by :class:`MovementArrays`.
+
+    The value is kept in :attr:`_value` while detached (or if the world
+    has no arrays), in the ``array_name`` array of the world's
+    :class:`MovementArrays` otherwise. ``flag_name`` is the array
+    telling which slots own such a component. A component attached to
+    more entities at once is a view onto the first one only.
+    """
+    array_name: str = ''
+    flag_name: str = ''
+    _arrays: Optional['MovementArrays'] = None
+    _entity: Hashable = None
+    _slot = 0
+
+    def __init__(self, value: Vec2):
+        self._value = value
+
+    @property
+    def value(self) -> Vec2:
+        if self._arrays is None:
+            return self._value
+        return Vec2(*getattr(self._arrays, self.array_name)[self._slot]
+                    .tolist())
+
+    @value.setter
+    def value(self, value):
+        if self._arrays is None:
+            self._value = value
+        else:
+            getattr(self._arrays, self.array_name)[self._slot] = value
+
+    def on_add(self, entity, world):
+        arrays = get_arrays(world)
+        if arrays is not None:
+            arrays.bind(entity, self)
+
+    def on_remove(self, entity, world):
+        arrays = get_arrays(world)
+        if arrays is not None:
+            arrays.unbind(entity, self)
+
+
+class VelocityView(ArrayComponent):
+    """Base class for velocity components."""
+    array_name = 'velocities'
+    flag_name = 'has_velocity'
+
+
+class TargetView(ArrayComponent):
+    """Base class for target position components."""
+    array_name = 'targets'
+    flag_name = 'has_target'
+
+
+@desper.event_handler(desper.ON_POSITION_CHANGE_EVENT_NAME)
+class _PositionWatcher:
+    """Mirror transform changes onto the arrays."""
+
+    def __init__(self, arrays: 'MovementArrays', slot: int,
+                 transform: desper.Transform2D):
+        self.arrays = arrays
+        self.slot = slot
+        self.transform = transform
+        transform.add_handler(self)
+
+    def on_position_change(self, position):
+        if not self.arrays._writing:
+            self.arrays.positions[self.slot] = position
+
+    def detach(self):
+        self.transform.remove_handler(self)
+
+
+class MovementArrays:
+    """Positions, velocities and targets of moving entities.
+
+    Each entity owning at least one :class:`ArrayComponent` is given a
+    slot. Slots are reused once freed, arrays grow as needed.
+    """
+
+    def __init__(self, world: desper.World, capacity: int = INITIAL_CAPACITY):
+        self.world = world
+        self.positions = np.zeros((capacity, 2))
+        self.velocities = np.zeros((capacity, 2))
+        self.targets = np.zeros((capacity, 2))
+        self.has_velocity = np.zeros(capacity, dtype=bool)
+        self.has_target = np.zeros(capacity, dtype=bool)
+
+        self.entities: list[Hashable] = [None] * capacity
+        self._watchers: list[Optional[_PositionWatcher]] = [None] * capacity
+        self._slots: dict[Hashable, int] = {}
+        self._free = list(range(capacity - 1, -1, -1))
+        self._writing = False
+
+    def bind(self, entity, component: ArrayComponent):
+        """Store the component's value in the entity's slot."""
+        if component._arrays is self and component._entity == entity:
+            return
+
+        slot = self._get_slot(entity)
+        getattr(self, component.array_name)[slot] = component.value
+        getattr(self, component.flag_name)[slot] = True
+
+        if component._arrays is None:
+            component._arrays = self
+            component._entity = entity
+            component._slot = slot
+
+    def unbind(self, entity, component: ArrayComponent):
+        """Release the component, freeing the slot if no more used."""
+        slot = self._slots.get(entity)
+        if slot is None:
+            return
+
+        if component._arrays is self and component._entity == entity:
+            component._value = component.value
+            component._arrays = None
+            component._entity = None
+
+        getattr(self, component.flag_name)[slot] = False
+        if not (self.has_velocity[slot] or self.has_target[slot]):
+            self._watchers[slot].detach()
+            self._watchers[slot] = None
+            self.entities[slot] = None
+            del self._slots[entity]
+            self._free.append(slot)
+
+    def integrate(self, dt):
+        """Add velocities to positions, in a single step."""
+        moving = self.has_velocity & self.velocities.any(axis=1)
+        if not moving.any():
+            return
+
+        old_positions = self.positions[moving]
+        self.positions[moving] += self.velocities[moving] * dt
+
+        if __debug__:
+            steps = np.abs(np.round(old_positions)
+                           - np.round(self.positions[moving]))
+            for slot in np.flatnonzero(moving)[(steps > 1).any(axis=1)]:
+                logger.warning('Velocity of entity %d surpassing 1 pixel per '
+                               'frame (%s)', self.entities[slot],
+                               Vec2(*(self.velocities[slot] * dt).tolist()))
+
+        self._write_back(np.flatnonzero(moving))
+
+    def seek_targets(self, dt):
+        """Interpolate positions towards targets, in a single step.
+
+        Entities close enough to their target are snapped to it, their
+        velocity is zeroed and their target component removed.
+        """
+        seeking = np.flatnonzero(self.has_target)
+        if not len(seeking):
+            return
+
+        min_speed = TARGET_MIN_SPEED / max(TARGET_MIN_DT, dt)
+        targets = self.targets[seeking]
+        positions = self.positions[seeking] + np.clip(
+            (targets - self.positions[seeking]) * TARGET_FACTOR,
+            -min_speed, min_speed)
+
+        distances = positions - targets
+        arrived = np.sqrt(distances[:, 0] ** 2 + distances[:, 1] ** 2) < 1
+        positions[arrived] = targets[arrived]
+        self.positions[seeking] = positions
+
+        arrived_slots = seeking[arrived]
+        self.velocities[arrived_slots[self.has_velocity[arrived_slots]]] = 0
+
+        self._write_back(seeking)
+
+        for slot in arrived_slots.tolist():
+            self.world.remove_component(self.entities[slot], TargetView)
+
+    def _write_back(self, slots: np.ndarray):
+        """Update transforms, for the given slots."""
+        self._writing = True
+        try:
+            for slot, position in zip(slots.tolist(),
+                                      self.positions[slots].tolist()):
+                self._watchers[slot].transform.position = Vec2(*position)
+        finally:
+            self._writing = False
+
+    def _get_slot(self, entity) -> int:
+        slot = self._slots.get(entity)
+        if slot is not None:
+            return slot
+
+        if not self._free:
+            self._grow()
+
+        slot = self._free.pop()
+        transform = self.world.get_component(entity, desper.Transform2D)
+        self._slots[entity] = slot
+        self.entities[slot] = entity
+        self._watchers[slot] = _PositionWatcher(self, slot, transform)
+        self.positions[slot] = transform.position
+        self.velocities[slot] = 0
+        self.targets[slot] = 0
+        return slot
+
+    def _grow(self):
+        capacity = len(self.entities)
+        for name in ('positions', 'velocities', 'targets', 'has_velocity',
+                     'has_target'):
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate((array, np.zeros_like(array))))
+
+        self.entities += [None] * capacity
+        self._watchers += [None] * capacity
+        self._free = list(range(2 * capacity - 1, capacity - 1, -1))
+
+
+def get_arrays(world: desper.World) -> Optional[MovementArrays]:
+    """Get the world's movement arrays, if any."""
+    found = world.get(MovementArrays)
+    if found:
+        return found[0][1]
+    return None
+
+
+def world_transformer(handle: desper.WorldHandle, world: desper.World):
+    """Enable the array movement engine on the given world.
+
+    Apply after any other transformer, so that all the components
+    already in the world are adopted.
+    """
+    arrays = MovementArrays(world)
+    world.create_entity(arrays)
+
+    for entity, component in world.get(ArrayComponent):
+        arrays.bind(entity, component)
@@ -0,0 +1,166 @@
+"""Packed 1-bit rendering backend.
+
+The game is strictly black and white, yet surfaces are stored one byte
+per pixel. Here, the screen and sprites are stored as packed bits
+instead, in the same page-major layout used by the SSD1306 (see
+:func:`ssd1306.pack_pages`). Xor composition runs directly on packed
+bytes, with sprites shifted to align to arbitrary vertical offsets.
+
+The backend is a drop-in replacement for
+:class:`graphics.ScreenSurfaceHandler`. The usual screen surface is
+kept in sync (damaged areas only), so that all its users keep
+working.
+"""
+from typing import Optional
+
+import desper
+import numpy as np
+from sdl2.ext import SurfaceArray
+
+from . import graphics
+from .ssd1306 import PAGE_HEIGHT, pack_pages, page_span
+
+
+class PackedBitmap:
+    """Component: 1-bit bitmap stored as page-major packed bytes.
+
+    Bit ``k`` of byte ``pages[page, x]`` is pixel
+    ``(x, page * PAGE_HEIGHT + k)``. Bits exceeding :attr:`height` are
+    always zero.
+
+    ``source`` optionally references the surface array the bitmap was
+    built from.
+    """
+
+    def __init__(self, pages: np.ndarray, height: int, source=None):
+        self.pages = pages
+        self.height = height
+        self.source = source
+        self._shifted = [None] * PAGE_HEIGHT
+
+    @classmethod
+    def from_surface_array(cls, surface_array) -> 'PackedBitmap':
+        """Pack a surface array (lit pixels have the lowest bit set)."""
+        width, height = surface_array.shape
+        padded = np.zeros((width, -(-height // PAGE_HEIGHT) * PAGE_HEIGHT),
+                          dtype=np.uint8)
+        padded[:, :height] = surface_array
+        return cls(pack_pages(padded), height, surface_array)
+
+    @classmethod
+    def blank(cls, width: int, height: int) -> 'PackedBitmap':
+        """Build a bitmap with no lit pixels."""
+        return cls(np.zeros((-(-height // PAGE_HEIGHT), width),
+                            dtype=np.uint8), height)
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        """Size of the bitmap, as ``(width, height)``.
+
+        Same convention as surface arrays (see
+        :func:`sdl2.ext.pixels2d`).
+        """
+        return self.pages.shape[1], self.height
+
+    def shifted(self, shift: int) -> np.ndarray:
+        """Get pages shifted down by the given amount of bits.
+
+        The result has an extra page, receiving overflowing bits. Shifts
+        are cached, as sprites usually do not change.
+        """
+        shifted = self._shifted[shift]
+        if shifted is None:
+            wide = self.pages.astype(np.uint16) << shift
+            shifted = np.zeros((self.pages.shape[0] + 1, self.pages.shape[1]),
+                               dtype=np.uint8)
+            shifted[:-1] = (wide & 0xFF).astype(np.uint8)
+            shifted[1:] |= (wide >> 8).astype(np.uint8)
+            self._shifted[shift] = shifted
+
+        return shifted
+
+
+def xor_blit(target: np.ndarray, source: PackedBitmap,
+             rect: graphics.Rect) -> Optional[graphics.Rect]:
+    """Xor a packed bitmap onto packed target pages.
+
+    Counterpart of :func:`graphics.xor_blit`. The rectangle is clipped
+    to the target's bounds. The actually affected rectangle is
+    returned (``None`` if nothing was touched).
+    """
+    clipped = graphics.clip_rect(
+        rect, (0, 0, target.shape[1], target.shape[0] * PAGE_HEIGHT))
+    if clipped is None:
+        return None
+
+    x, y, _, _ = rect
+    clipped_x, _, clipped_w, _ = clipped
+    shifted = source.shifted(y % PAGE_HEIGHT)
+    first_page = y // PAGE_HEIGHT
+    start_page = max(first_page, 0)
+    end_page = min(first_page + shifted.shape[0], target.shape[0])
+    source_x = clipped_x - x
+
+    target[start_page:end_page, clipped_x:clipped_x + clipped_w] ^= shifted[
+        start_page - first_page:end_page - first_page,
+        source_x:source_x + clipped_w]
+    return clipped
+
+
+def unpack_into(surface_array, pages: np.ndarray, rect: graphics.Rect):
+    """Unpack a rectangle of pages into a surface array.
+
+    Whole pages are unpacked, meaning that the affected area is
+    aligned to pages. Lit pixels are set to ``0xFF``.
+    """
+    x, _, w, _ = rect
+    first_page, end_page = page_span(rect)
+    bits = np.unpackbits(pages[first_page:end_page, x:x + w], axis=0,
+                         bitorder='little')
+    surface_array[x:x + w, first_page * PAGE_HEIGHT:
+                  end_page * PAGE_HEIGHT] = bits.T * np.uint8(0xFF)
+
+
+class PackedScreenSurfaceHandler(graphics.ScreenSurfaceHandler):
+    """Render world on a packed screen on ``update_screen_surface``.
+
+    Sprites are packed on first use (a :class:`PackedBitmap` is added
+    to their entities) and composed onto the :class:`PackedBitmap` of
+    the screen entity. Damaged areas are then unpacked into the
+    screen's surface array.
+
+    See :class:`graphics.ScreenSurfaceHandler` for the details on
+    composition.
+    """
+
+    def _get_target(self, screen_surface_entity) -> np.ndarray:
+        screen_bitmap = self.world.get_component(screen_surface_entity,
+                                                 PackedBitmap)
+        return screen_bitmap.pages
+
+    def _get_sprite(self, entity, surface_array) -> PackedBitmap:
+        bitmap = self.world.get_component(entity, PackedBitmap)
+        if bitmap is None or bitmap.source is not surface_array:
+            bitmap = PackedBitmap.from_surface_array(surface_array)
+            self.world.add_component(entity, bitmap)
+
+        return bitmap
+
+    def _blit(self, target, sprite, rect):
+        return xor_blit(target, sprite, rect)
+
+    def _flush(self, screen_surface_entity, damage):
+        screen_surface_array = self.world.get_component(screen_surface_entity,
+                                                        SurfaceArray)
+        for rect in damage:
+            unpack_into(screen_surface_array, self._target, rect)
+
+
+def add_screen_bitmap(world: desper.World):
+    """Add a blank :class:`PackedBitmap` to the screen surface entity."""
+    screen_surface_entity, _ = world.get(graphics.ScreenSurface)[0]
+    screen_bitmap = PackedBitmap.blank(graphics.BONNET_WIDTH,
+                                       graphics.BONNET_HEIGHT)
+    world.add_component(screen_surface_entity, screen_bitmap)
+
+    return screen_bitmap
@@ -0,0 +1,55 @@
+"""Build worlds ahead of time, in a background thread.
+
+Loading a :class:`desper.WorldHandle` runs all of its transformers
+(rendering text, building surfaces, registering processors). Through
+:class:`WorldPreloader`, the next level is loaded while the current
+one is being played, so that switching to it only swaps worlds.
+
+Worlds are loaded with event dispatching disabled (it is only enabled
+by the loop when switching), hence building them does not interfere
+with the running world. The main thread must not load the same handle
+concurrently: call :meth:`WorldPreloader.wait` before switching.
+"""
+import threading
+from typing import Optional
+
+import desper
+
+from .log import logger
+
+
+class WorldPreloader:
+    """Load at most one world handle at a time, in the background.
+
+    Only the handle given to :meth:`preload` is loaded ahead, so that
+    at most the current and the next worlds are resident.
+    """
+
+    def __init__(self):
+        self._thread: Optional[threading.Thread] = None
+        self.handle: Optional[desper.WorldHandle] = None
+
+    def preload(self, handle: desper.WorldHandle):
+        """Start loading the given handle, unless already loaded."""
+        self.wait()
+        self.handle = handle
+        if handle.cached:
+            return
+
+        self._thread = threading.Thread(target=self._load, args=(handle,),
+                                        name='world-preloader', daemon=True)
+        self._thread.start()
+
+    def wait(self):
+        """Wait for the ongoing load, if any."""
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    @staticmethod
+    def _load(handle: desper.WorldHandle):
+        try:
+            handle()
+        except Exception:
+            # The loop will load it again (and fail) when switching
+            logger.exception('Preloading of %s failed', handle.key)
@@ -0,0 +1,268 @@
+"""Opt-in timing instrumentation for worlds and loops.
+
+A :class:`Profiler` wraps, on each world it is attached to:
+
+* :meth:`desper.World.process` (key ``frame``);
+* the ``process`` method of every processor (keys
+  ``process/<processor type>``);
+* :meth:`desper.World.dispatch` (keys ``event/<event name>``), timing
+  all the handlers of an event together.
+
+Timings are inclusive: nested calls (e.g. ``render``, dispatched by a
+processor) are also accounted in the outer ones. When installed on a
+:class:`scheduler.FixedTimestepLoop`, time spent waiting for the next
+step is also measured (key ``sleep``).
+
+For each key, the time spent in every frame is aggregated in a
+cumulative histogram and in a rolling window, from which percentiles
+are computed. In sampling mode, only one frame out of ``sample_every``
+is measured.
+"""
+import atexit
+import bisect
+import collections
+import json
+import signal
+import time
+import weakref
+from typing import Callable, Optional
+
+import desper
+import numpy as np
+
+from .log import logger
+
+# Histogram bucket upper bounds in nanoseconds, from 1us to 10s
+BUCKET_BOUNDS = np.logspace(3, 10, 7 * 20 + 1).tolist()
+
+PERCENTILES = (50, 95, 99)
+
+
+class Histogram:
+    """Cumulative histogram of durations, on logarithmic buckets.
+
+    Percentiles are approximated to the upper bound of their bucket
+    (about 12% relative error at most).
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.total = 0
+
+    def add(self, duration_ns: int):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, duration_ns)] += 1
+        self.total += 1
+
+    def percentile(self, percent: float) -> float:
+        """Get an approximate percentile, in nanoseconds."""
+        if not self.total:
+            return 0.
+
+        threshold = self.total * percent / 100
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= threshold:
+                break
+
+        return BUCKET_BOUNDS[min(index, len(BUCKET_BOUNDS) - 1)]
+
+
+class Timing:
+    """Statistics for a single key."""
+
+    def __init__(self, window: int):
+        self.calls = 0
+        self.frames = 0
+        self.total_ns = 0
+        self.histogram = Histogram()
+        self.rolling: collections.deque[int] = collections.deque(
+            maxlen=window)
+
+    def add_frame(self, duration_ns: int):
+        self.frames += 1
+        self.total_ns += duration_ns
+        self.histogram.add(duration_ns)
+        self.rolling.append(duration_ns)
+
+    def report(self) -> dict:
+        """Get a summary of the statistics, times in milliseconds."""
+        report = {
+            'calls': self.calls,
+            'frames': self.frames,
+            'total_ms': self.total_ns * 1e-6,
+            'mean_ms': self.total_ns / max(self.frames, 1) * 1e-6,
+        }
+        for percent in PERCENTILES:
+            report[f'p{percent}_ms'] = self.histogram.percentile(percent) * 1e-6
+
+        rolling = np.percentile(self.rolling, PERCENTILES) if self.rolling \
+            else [0.] * len(PERCENTILES)
+        for percent, value in zip(PERCENTILES, rolling):
+            report[f'rolling_p{percent}_ms'] = float(value) * 1e-6
+
+        return report
+
+
+class Profiler:
+    """Measure where frame time goes, see the module documentation.
+
+    ``window`` is the number of frames retained for rolling
+    percentiles.
+    """
+
+    def __init__(self, sample_every: int = 1, window: int = 1000):
+        self.sample_every = max(1, sample_every)
+        self.window = window
+        self.timings: dict[str, Timing] = {}
+        self.frames = 0
+        self.sampled_frames = 0
+
+        self._active = False
+        self._frame_times: dict[str, int] = collections.defaultdict(int)
+        self._attached = weakref.WeakSet()
+
+    def install(self, loop: desper.Loop):
+        """Attach to the loop's current and future worlds.
+
+        The loop's scheduler, if any, is also timed.
+        """
+        switch = loop.switch
+
+        def instrumented_switch(*args, **kwargs):
+            switch(*args, **kwargs)
+            self.attach(loop.current_world)
+
+        loop.switch = instrumented_switch
+
+        scheduler = getattr(loop, 'scheduler', None)
+        if scheduler is not None:
+            scheduler.wait = self._timed('sleep', scheduler.wait)
+
+        if loop.current_world is not None:
+            self.attach(loop.current_world)
+
+    def attach(self, world: desper.World):
+        """Instrument a world, its processors and its events."""
+        if world in self._attached:
+            return
+        self._attached.add(world)
+
+        for processor in world.processors:
+            self._instrument_processor(processor)
+
+        add_processor = world.add_processor
+
+        def instrumented_add_processor(processor, *args, **kwargs):
+            add_processor(processor, *args, **kwargs)
+            self._instrument_processor(processor)
+
+        world.add_processor = instrumented_add_processor
+
+        dispatch = world.dispatch
+
+        def instrumented_dispatch(event_name, *args, **kwargs):
+            if not self._active:
+                return dispatch(event_name, *args, **kwargs)
+
+            start = time.perf_counter_ns()
+            try:
+                return dispatch(event_name, *args, **kwargs)
+            finally:
+                self._add(f'event/{event_name}',
+                          time.perf_counter_ns() - start)
+
+        world.dispatch = instrumented_dispatch
+
+        process = world.process
+
+        def instrumented_process(dt=1):
+            self._begin_frame()
+            start = time.perf_counter_ns()
+            try:
+                return process(dt)
+            finally:
+                if self._active:
+                    self._add('frame', time.perf_counter_ns() - start)
+                self._end_frame()
+
+        world.process = instrumented_process
+
+    def report(self) -> dict:
+        """Get a summary of all the statistics."""
+        return {
+            'frames': self.frames,
+            'sampled_frames': self.sampled_frames,
+            'sample_every': self.sample_every,
+            'timings': {key: timing.report() for key, timing
+                        in sorted(self.timings.items())},
+        }
+
+    def dump(self, filename: str):
+        """Write the report to a JSON file."""
+        with open(filename, 'w') as file:
+            json.dump(self.report(), file, indent=2)
+        logger.info('Profile written to %s', filename)
+
+    def dump_on_exit(self, filename: str):
+        """Dump the report at exit, and on ``SIGUSR1`` if available."""
+        atexit.register(self.dump, filename)
+
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1,
+                          lambda *_: self.dump(filename))
+
+    def _instrument_processor(self, processor: desper.Processor):
+        if 'process' in vars(processor):       # Already instrumented
+            return
+
+        processor.process = self._timed(
+            f'process/{type(processor).__name__}', processor.process)
+
+    def _timed(self, key: str, function: Callable) -> Callable:
+        def timed(*args, **kwargs):
+            if not self._active:
+                return function(*args, **kwargs)
+
+            start = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._add(key, time.perf_counter_ns() - start)
+
+        return timed
+
+    def _begin_frame(self):
+        self.frames += 1
+        self._active = self.frames % self.sample_every == 0
+
+    def _end_frame(self):
+        if self._active:
+            self.sampled_frames += 1
+            for key, duration_ns in self._frame_times.items():
+                self._get_timing(key).add_frame(duration_ns)
+            self._frame_times.clear()
+
+        # Measure the scheduler's wait before the next sampled frame
+        self._active = (self.frames + 1) % self.sample_every == 0
+
+    def _add(self, key: str, duration_ns: int):
+        self._frame_times[key] += duration_ns
+        self._get_timing(key).calls += 1
+
+    def _get_timing(self, key: str) -> Timing:
+        timing = self.timings.get(key)
+        if timing is None:
+            timing = self.timings[key] = Timing(self.window)
+        return timing
+
+
+def open_profiler(filename: Optional[str],
+                  sample_every: int = 1) -> Optional[Profiler]:
+    """Build a profiler dumping to the given file, if any."""
+    if filename is None:
+        return None
+
+    profiler = Profiler(sample_every)
+    profiler.dump_on_exit(filename)
+    return profiler
@@ -0,0 +1,305 @@
+"""Record play sessions, replay them deterministically.
+
+A :class:`Recorder` logs key events (``on_key_down`` and
+``on_key_up``), with the index of the frame in which they happened,
+to a compact binary file. Every :attr:`Recorder.hash_interval` frames,
+a hash of the screen surface is logged too.
+
+Since the simulation advances in fixed timesteps (see
+:mod:`scheduler`), feeding the same events at the same frames
+reproduces the session exactly, wherever it was recorded (e.g. on a
+bonnet). :func:`run` replays a recording headless and unthrottled,
+checking screen hashes along the way. Steps slept through by an idle
+loop are counted as frames (see :attr:`scheduler.ON_IDLE_EVENT_NAME`).
+
+The file starts with a header (:attr:`HEADER`), followed by records,
+each introduced by a tag byte:
+
+* :attr:`LEVEL`: a level starts, followed by the length of its name
+  (one byte) and the UTF-8 encoded name;
+* :attr:`KEY_DOWN`, :attr:`KEY_UP`: followed by frame index and
+  scancode (:attr:`KEY_RECORD`);
+* :attr:`HASH`: followed by frame index and screen hash
+  (:attr:`HASH_RECORD`), for the screen as it is at the beginning of
+  such frame;
+* :attr:`END`: the current level ends, followed by its amount of
+  processed frames (:attr:`END_RECORD`).
+"""
+import hashlib
+import struct
+from dataclasses import dataclass, field
+from functools import partial
+from typing import BinaryIO, Optional
+
+import desper
+import numpy as np
+import sdl2
+from sdl2 import sdlttf as ttf
+from sdl2.ext import SurfaceArray
+
+from . import graphics
+from . import headless
+from . import movement
+from . import profiling
+from . import scheduler
+from . import snapshot
+from . import load_resources, register_levels
+from .log import logger
+
+MAGIC = b'NRSR'
+VERSION = 1
+
+HEADER = struct.Struct('<4sBdH')
+"""Magic, version, timestep (seconds) and hash interval (frames)."""
+KEY_RECORD = struct.Struct('<IH')
+HASH_RECORD = struct.Struct('<I8s')
+END_RECORD = struct.Struct('<I')
+
+LEVEL = 0
+KEY_DOWN = 1
+KEY_UP = 2
+HASH = 3
+END = 4
+
+_KEY_TAGS = {'on_key_down': KEY_DOWN, 'on_key_up': KEY_UP}
+_KEY_EVENTS = {tag: event_name for event_name, tag in _KEY_TAGS.items()}
+
+DEFAULT_HASH_INTERVAL = 30
+
+# Run before any other processor, so that a frame starts here
+PRIORITY = -1000
+
+
+def screen_hash(world: desper.World) -> bytes:
+    """Get a short hash of the world's screen surface."""
+    screen_surface_entity, _ = world.get(graphics.ScreenSurface)[0]
+    screen = world.get_component(screen_surface_entity, SurfaceArray)
+    return hashlib.blake2b(np.ascontiguousarray(screen).tobytes(),
+                           digest_size=8).digest()
+
+
+@dataclass
+class LevelRecording:
+    """Events, hashes and length of a recorded level."""
+    name: str
+    frames: int = 0
+    script: headless.Script = field(default_factory=dict)
+    hashes: dict[int, bytes] = field(default_factory=dict)
+
+
+@dataclass
+class Recording:
+    """A whole recorded session, see :func:`load`."""
+    step: float
+    hash_interval: int
+    levels: list[LevelRecording] = field(default_factory=list)
+
+
+@snapshot.shared
+class Recorder:
+    """Record the session to the given binary file.
+
+    Add :meth:`world_transformer` to the transformers of each level
+    (e.g. through ``extra_transformers`` in :func:`register_levels`).
+    The file is completed by :meth:`close`.
+    """
+
+    def __init__(self, filename: str, step: float,
+                 hash_interval: int = DEFAULT_HASH_INTERVAL):
+        self.filename = filename
+        self.hash_interval = hash_interval
+        self._file: Optional[BinaryIO] = open(filename, 'wb')
+        self._file.write(HEADER.pack(MAGIC, VERSION, step, hash_interval))
+        self._current: Optional['RecordProcessor'] = None
+
+    def world_transformer(self, handle: desper.WorldHandle,
+                          world: desper.World):
+        """Record the given level, once it starts being processed."""
+        world.add_processor(RecordProcessor(self, handle.key), PRIORITY)
+
+    def start_level(self, processor: 'RecordProcessor'):
+        self._end_level()
+        self._current = processor
+        name = processor.level_name.encode()
+        self._file.write(bytes((LEVEL, len(name))) + name)
+
+    def write_key(self, event_name: str, frame: int, scancode: int):
+        self._file.write(bytes((_KEY_TAGS[event_name],))
+                         + KEY_RECORD.pack(frame, scancode))
+
+    def write_hash(self, frame: int, digest: bytes):
+        self._file.write(bytes((HASH,)) + HASH_RECORD.pack(frame, digest))
+
+    def close(self):
+        """End the current level and close the file."""
+        if self._file is None:
+            return
+
+        self._end_level()
+        self._file.close()
+        self._file = None
+        logger.info('Session recorded to %s', self.filename)
+
+    def _end_level(self):
+        if self._current is not None:
+            self._file.write(bytes((END,))
+                             + END_RECORD.pack(self._current.frame + 1))
+        self._current = None
+
+
+@desper.event_handler('on_key_down', 'on_key_up',
+                      scheduler.ON_IDLE_EVENT_NAME)
+class RecordProcessor(desper.Processor):
+    """Feed a :class:`Recorder`, see :meth:`Recorder.world_transformer`.
+
+    Frames are counted when they begin, so that the last frame of a
+    level (e.g. the winning one) is counted too. Idle steps are counted
+    as well, with no screen hash (the screen does not change).
+    """
+
+    def __init__(self, recorder: Recorder, level_name: str):
+        self.recorder = recorder
+        self.level_name = level_name
+        self.frame = -1
+
+    def on_key_down(self, scancode):
+        self.recorder.write_key('on_key_down', max(self.frame, 0), scancode)
+
+    def on_key_up(self, scancode):
+        self.recorder.write_key('on_key_up', max(self.frame, 0), scancode)
+
+    def on_idle(self, steps, dt):
+        self.frame += steps
+
+    def process(self, dt):
+        self.frame += 1
+        if self.frame == 0:
+            self.recorder.start_level(self)
+        elif self.frame % self.recorder.hash_interval == 0:
+            self.recorder.write_hash(self.frame, screen_hash(self.world))
+
+
+def load(filename: str) -> Recording:
+    """Load a recording from a binary file."""
+    with open(filename, 'rb') as file:
+        data = file.read()
+
+    magic, version, step, hash_interval = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'{filename} is not a recording (version {VERSION})')
+
+    recording = Recording(step, hash_interval)
+    level: Optional[LevelRecording] = None
+    offset = HEADER.size
+    while offset < len(data):
+        tag = data[offset]
+        offset += 1
+
+        if tag == LEVEL:
+            length = data[offset]
+            level = LevelRecording(
+                data[offset + 1:offset + 1 + length].decode())
+            recording.levels.append(level)
+            offset += 1 + length
+        elif tag in _KEY_EVENTS:
+            frame, scancode = KEY_RECORD.unpack_from(data, offset)
+            level.script.setdefault(frame, []).append(
+                (_KEY_EVENTS[tag], scancode))
+            offset += KEY_RECORD.size
+        elif tag == HASH:
+            frame, digest = HASH_RECORD.unpack_from(data, offset)
+            level.hashes[frame] = digest
+            offset += HASH_RECORD.size
+        elif tag == END:
+            level.frames, = END_RECORD.unpack_from(data, offset)
+            offset += END_RECORD.size
+        else:
+            raise ValueError(f'Unknown record {tag} at offset {offset - 1}')
+
+    # A level may be left unterminated, if recording was interrupted
+    if level is not None and not level.frames:
+        level.frames = max([*level.script, *level.hashes], default=0) + 1
+
+    return recording
+
+
+class VerifyProcessor(desper.Processor):
+    """Compare the screen with the recorded hashes, while replaying."""
+
+    def __init__(self, level: LevelRecording):
+        self.level = level
+        self.frame = -1
+        self.checked = 0
+        self.mismatches = 0
+
+    def process(self, dt):
+        self.frame += 1
+        digest = self.level.hashes.get(self.frame)
+        if digest is None:
+            return
+
+        self.checked += 1
+        if screen_hash(self.world) != digest:
+            if not self.mismatches:
+                logger.warning('%s: screen diverged at frame %d',
+                               self.level.name, self.frame)
+            self.mismatches += 1
+
+
+def replay_world_transformer(handle: desper.WorldHandle,
+                             world: desper.World,
+                             verify_processor: VerifyProcessor):
+    """Instantiate game world, replaying a level.
+
+    The level is the one of the given processor.
+    """
+    headless.game_world_transformer(handle, world,
+                                    verify_processor.level.script, None)
+    world.add_processor(verify_processor, PRIORITY)
+
+
+def run(filename: str, packed: bool = False,
+        profiler: Optional[profiling.Profiler] = None,
+        array_movement: bool = False,
+        pack_filename: Optional[str] = None) -> list[dict]:
+    """Replay a recording headless, as fast as possible.
+
+    If ``array_movement`` is ``True``, the :mod:`movement` arrays are
+    used. Resources are loaded from ``pack_filename``, if given.
+
+    Return a list of results, one for each recorded level, including
+    the amount of checked screen hashes and of mismatches.
+    """
+    recording = load(filename)
+
+    sdl2.SDL_Init(0)
+    ttf.TTF_Init()
+    load_resources(pack_filename)
+
+    if profiler is not None:
+        profiler.install(desper.default_loop)
+
+    results = []
+    try:
+        for level in recording.levels:
+            verify_processor = VerifyProcessor(level)
+            register_levels(partial(replay_world_transformer,
+                                    verify_processor=verify_processor),
+                            packed,
+                            [movement.world_transformer] if array_movement
+                            else ())
+            handle = desper.resource_map.get(f'worlds/{level.name}')
+
+            result = headless.run_level(handle, level.frames, recording.step)
+            result.update(name=level.name, checked=verify_processor.checked,
+                          mismatches=verify_processor.mismatches)
+            results.append(result)
+            logger.info('%s: %d frames, %d/%d hashes match, fps=%.2f',
+                        level.name, result['frames'],
+                        result['checked'] - result['mismatches'],
+                        result['checked'], result['fps'])
+    except desper.Quit:
+        pass
+
+    sdl2.SDL_Quit()
+    return results
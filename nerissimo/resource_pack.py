@@ -0,0 +1,216 @@
+"""Single file resource pack, memory mapped at runtime.
+
+:func:`build` packs all sprites (normalized, see :mod:`assets`) and
+fonts (along with their rasterized glyph atlases, see :mod:`text`)
+from a resource directory into one file. At runtime,
+:class:`PackPopulator` maps such file in memory and populates the
+resource map from it, in place of
+:class:`desper.DirectoryResourcePopulator`: sprite surfaces and fonts
+are backed by the mapped file, with no copies and no decoding.
+
+Build a pack from the repository root with::
+
+    python -m nerissimo.resource_pack resources resources.pack
+
+The file starts with a header (:attr:`HEADER`), followed by data
+blocks, each aligned to :attr:`ALIGNMENT` bytes. The index, a UTF-8
+encoded JSON document describing all resources and the position of
+their data, is the last block. Sprite pixels are stored row by row
+(i.e. as ``[y, x]``), so that surfaces can directly reference them.
+"""
+import ctypes
+import json
+import mmap
+import pathlib
+import struct
+import sys
+from typing import Optional
+
+import desper
+import numpy as np
+import sdl2
+from sdl2 import sdlttf as ttf
+
+from . import assets
+from . import graphics
+from . import text
+from .log import logger
+
+MAGIC = b'NRSP'
+VERSION = 2
+
+HEADER = struct.Struct('<4sBQQ')
+"""Magic, version, index offset and index size (bytes)."""
+
+ALIGNMENT = 8
+
+PACK_FILENAME = 'resources.pack'
+
+
+def _align(file):
+    file.write(bytes(-file.tell() % ALIGNMENT))
+
+
+def _write_block(file, data: bytes) -> dict:
+    _align(file)
+    offset = file.tell()
+    file.write(data)
+    return {'offset': offset, 'size': len(data)}
+
+
+def build(resource_root: str, filename: str):
+    """Pack the sprites and fonts found in a resource directory.
+
+    Same layout as the one expected by :func:`load_resources`:
+    sprites under ``sprites/``, fonts under ``fonts/``.
+    """
+    resource_root = pathlib.Path(resource_root)
+    ttf.TTF_Init()
+
+    index = {'sprites': {}, 'fonts': {}}
+    with open(filename, 'wb') as file:
+        file.write(bytes(HEADER.size))
+
+        for path in sorted((resource_root / 'sprites').rglob('*.bmp')):
+            key = path.relative_to(resource_root).with_suffix('').as_posix()
+            pixels = assets.decode(path.read_bytes())
+            width, height = pixels.shape
+            index['sprites'][key] = {
+                **_write_block(file, np.ascontiguousarray(pixels.T).tobytes()),
+                'width': width, 'height': height}
+
+        for path in sorted((resource_root / 'fonts').rglob('*.ttf')):
+            key = path.relative_to(resource_root).with_suffix('').as_posix()
+            handle = graphics.TTFHandle(str(path))
+            font = handle()
+            atlas = text.GlyphAtlas(font)
+            index['fonts'][key] = {
+                **_write_block(file, path.read_bytes()),
+                'pt': handle.pt,
+                'atlas': {**_write_block(file, atlas.atlas.tobytes()),
+                          'width': len(atlas.atlas)},
+                'glyphs': atlas.glyphs}
+            handle.clear()
+
+        index_block = _write_block(file, json.dumps(index).encode())
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, VERSION, index_block['offset'],
+                               index_block['size']))
+
+    logger.info('Packed %d sprites and %d fonts into %s',
+                len(index['sprites']), len(index['fonts']), filename)
+
+
+class ResourcePack:
+    """A resource pack file, mapped in memory.
+
+    The mapping is private (copy on write), so that the file is never
+    modified. It stays open as long as the pack is referenced.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        with open(filename, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+
+        magic, version, index_offset, index_size = HEADER.unpack_from(
+            self._mmap)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(
+                f'{filename} is not a resource pack (version {VERSION})')
+
+        self.index = json.loads(
+            self._mmap[index_offset:index_offset + index_size])
+
+    def _buffer(self, entry: dict):
+        return (ctypes.c_uint8 * entry['size']).from_buffer(self._mmap,
+                                                            entry['offset'])
+
+    def sprite_pixels(self, key: str) -> np.ndarray:
+        """Get a view of a sprite's pixels, indexed as ``[x, y]``."""
+        entry = self.index['sprites'][key]
+        return np.frombuffer(self._mmap, dtype=np.uint8, count=entry['size'],
+                             offset=entry['offset']).reshape(
+            entry['height'], entry['width']).T
+
+    def sprite_surface(self, key: str) -> graphics.LP_SDL_Surface:
+        """Build a surface referencing a sprite's pixels."""
+        entry = self.index['sprites'][key]
+        return sdl2.SDL_CreateRGBSurfaceWithFormatFrom(
+            self._buffer(entry), entry['width'], entry['height'], 8,
+            entry['width'], sdl2.SDL_PIXELFORMAT_RGB332)
+
+    def open_font(self, key: str) -> graphics.LP_TTF_Font:
+        """Open a font, reading it from the mapped file."""
+        entry = self.index['fonts'][key]
+        return ttf.TTF_OpenFontRW(
+            sdl2.SDL_RWFromConstMem(self._buffer(entry), entry['size']), 1,
+            entry['pt'])
+
+    def glyph_atlas(self, key: str, font: graphics.LP_TTF_Font
+                    ) -> text.GlyphAtlas:
+        """Get the prebuilt glyph atlas of an open font."""
+        entry = self.index['fonts'][key]
+        atlas_entry = entry['atlas']
+        atlas = np.frombuffer(self._mmap, dtype=bool,
+                              count=atlas_entry['size'],
+                              offset=atlas_entry['offset']).reshape(
+            atlas_entry['width'], -1)
+        glyphs = {character: tuple(glyph)
+                  for character, glyph in entry['glyphs'].items()}
+        return text.GlyphAtlas.prebuilt(font, atlas, glyphs)
+
+
+class PackSpriteHandle(graphics.SurfaceHandle):
+    """Handle for sprites in a :class:`ResourcePack`."""
+
+    def __init__(self, pack: ResourcePack, pack_key: str):
+        super().__init__(pack.filename)
+        self.pack = pack
+        self.pack_key = pack_key
+
+    def load(self) -> graphics.LP_SDL_Surface:
+        return self.pack.sprite_surface(self.pack_key)
+
+
+class PackFontHandle(graphics.TTFHandle):
+    """Handle for fonts in a :class:`ResourcePack`.
+
+    Once loaded, :attr:`atlas` is the font's prebuilt glyph atlas.
+    """
+    atlas: Optional[text.GlyphAtlas] = None
+
+    def __init__(self, pack: ResourcePack, pack_key: str):
+        super().__init__(pack.filename, pack.index['fonts'][pack_key]['pt'])
+        self.pack = pack
+        self.pack_key = pack_key
+
+    def load(self) -> graphics.LP_TTF_Font:
+        font = self.pack.open_font(self.pack_key)
+        self.atlas = self.pack.glyph_atlas(self.pack_key, font)
+        return font
+
+
+class PackPopulator:
+    """Populate a resource map from a :class:`ResourcePack`.
+
+    Resources get the same keys as the ones given by
+    :func:`load_resources` in directory mode.
+    """
+
+    def __init__(self, filename: str):
+        self.pack = ResourcePack(filename)
+
+    def __call__(self, resource_map: desper.ResourceMap):
+        for key in self.pack.index['sprites']:
+            resource_map[key] = PackSpriteHandle(self.pack, key)
+        for key in self.pack.index['fonts']:
+            resource_map[key] = PackFontHandle(self.pack, key)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit(f'Usage: python -m nerissimo.resource_pack RESOURCE_DIR '
+                 f'OUTPUT (e.g. {PACK_FILENAME})')
+
+    build(sys.argv[1], sys.argv[2])
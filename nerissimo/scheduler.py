@@ -0,0 +1,277 @@
+"""Fixed timestep frame scheduling.
+
+The simulation advances in steps of constant length, regardless of the
+actual time spent by each iteration. This keeps the game deterministic
+(same inputs lead to the same steps) while the scheduler takes care of
+pacing steps in real time. When running late, multiple steps are
+processed in a row and only the last one is presented, up to a maximum
+after which time is simply dropped (the game slows down).
+
+When nothing is animating, the loop can also sleep until input is
+available (see :class:`FixedTimestepLoop`).
+"""
+import math
+import time
+from typing import Callable, Optional
+
+import desper
+
+from .log import logger
+
+ON_STEP_EVENT_NAME = 'on_step'
+ON_IDLE_EVENT_NAME = 'on_idle'
+
+# Upper bound to a single idle sleep, in seconds
+MAX_IDLE_TIME = 1.
+
+
+class FrameStats:
+    """Accumulate statistics on frame pacing.
+
+    Intervals between consecutive wake ups are measured, their standard
+    deviation being the jitter. Lateness is the delay of wake ups in
+    respect to their deadlines. Presented steps are the ones allowed
+    to render, whether the screen actually changed or not. Idle steps
+    are slept through (see :class:`FixedTimestepLoop`).
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.frames = 0
+        self.steps = 0
+        self.dropped_steps = 0
+        self.presented_steps = 0
+        self.idle_steps = 0
+        self.max_lateness = 0.
+        self.max_interval = 0.
+        self._mean_interval = 0.
+        self._interval_m2 = 0.
+        self._intervals = 0
+        self._last_wake = None
+
+    def add_wake(self, timestamp: float, lateness: float):
+        """Record a wake up at the given time."""
+        self.frames += 1
+        self.max_lateness = max(self.max_lateness, lateness)
+
+        if self._last_wake is not None:
+            interval = timestamp - self._last_wake
+            self.max_interval = max(self.max_interval, interval)
+
+            # Welford's online variance
+            self._intervals += 1
+            delta = interval - self._mean_interval
+            self._mean_interval += delta / self._intervals
+            self._interval_m2 += delta * (interval - self._mean_interval)
+
+        self._last_wake = timestamp
+
+    def interrupt(self):
+        """Do not measure the interval up to the next wake up."""
+        self._last_wake = None
+
+    @property
+    def mean_interval(self) -> float:
+        return self._mean_interval
+
+    @property
+    def jitter(self) -> float:
+        """Standard deviation of intervals between wake ups."""
+        if self._intervals < 2:
+            return 0.
+        return math.sqrt(self._interval_m2 / (self._intervals - 1))
+
+    def report(self) -> dict:
+        """Get a summary of the statistics, times in milliseconds."""
+        return {
+            'frames': self.frames,
+            'steps': self.steps,
+            'dropped_steps': self.dropped_steps,
+            'presented_steps': self.presented_steps,
+            'idle_steps': self.idle_steps,
+            'mean_interval_ms': self.mean_interval * 1e3,
+            'jitter_ms': self.jitter * 1e3,
+            'max_interval_ms': self.max_interval * 1e3,
+            'max_lateness_ms': self.max_lateness * 1e3,
+        }
+
+
+class FrameScheduler:
+    """Pace fixed simulation steps in real time.
+
+    ``step`` is the simulation timestep, in seconds. ``render_interval``
+    is the minimum time between presented frames (defaults to
+    ``step``), rounded to a whole number of steps. If more than
+    ``max_steps`` steps are due at once, the exceeding ones are dropped.
+
+    Waiting is done by sleeping until ``spin_threshold`` seconds before
+    the deadline, then spinning (sleep resolution is coarse on most
+    platforms).
+    """
+
+    def __init__(self, step: float = 1 / 30,
+                 render_interval: Optional[float] = None,
+                 max_steps: int = 4, spin_threshold: float = 0.001,
+                 time_function: Callable[[], float] = time.perf_counter):
+        self.step = step
+        self.render_every = max(1, round((render_interval or step) / step))
+        self.max_steps = max_steps
+        self.spin_threshold = spin_threshold
+        self.time_function = time_function
+        self.stats = FrameStats()
+
+        self._deadline = None
+        self._step_count = 0
+        self._last_presented = None
+
+    def reset(self):
+        """Restart pacing from now, forgetting any delay.
+
+        Call after long, expected pauses (e.g. loading), which are
+        not measured in the statistics either.
+        """
+        self._deadline = None
+        self.stats.interrupt()
+
+    def wait(self) -> int:
+        """Wait for the next deadline, return the number of steps due."""
+        if self._deadline is None:
+            now = self.time_function()
+            self._deadline = now
+        else:
+            self._sleep_until(self._deadline)
+            now = self.time_function()
+
+        lateness = now - self._deadline
+        self.stats.add_wake(now, lateness)
+
+        steps = 1 + int(lateness // self.step)
+        if steps > self.max_steps:
+            self.stats.dropped_steps += steps - self.max_steps
+            steps = self.max_steps
+            self._deadline = now + self.step
+        else:
+            self._deadline += steps * self.step
+
+        return steps
+
+    def should_present(self, last_in_batch: bool) -> bool:
+        """Tell whether the current step is to be presented.
+
+        Only the last step of a batch is presented, and no more often
+        than the render interval.
+        """
+        self._step_count += 1
+        self.stats.steps += 1
+
+        if not last_in_batch:
+            return False
+
+        if (self._last_presented is not None
+                and self._step_count - self._last_presented
+                < self.render_every):
+            return False
+
+        self._last_presented = self._step_count
+        self.stats.presented_steps += 1
+        return True
+
+    def _sleep_until(self, deadline: float):
+        remaining = deadline - self.time_function()
+        if remaining > self.spin_threshold:
+            time.sleep(remaining - self.spin_threshold)
+
+        while self.time_function() < deadline:
+            time.sleep(0)
+
+
+class FixedTimestepLoop(desper.SimpleLoop):
+    """Process the current world in fixed timesteps.
+
+    See :class:`FrameScheduler`. Before each step,
+    :attr:`ON_STEP_EVENT_NAME` is dispatched with a boolean, telling
+    whether the step is to be presented (see
+    :class:`graphics.DirtyRenderLoopProcessor`).
+
+    If both ``idle_timeout`` and ``wait_input`` are given, the loop
+    sleeps while the world is quiescent. ``idle_timeout(world)`` tells
+    for how long the world can be left alone (``0`` if it is animating,
+    ``math.inf`` if only input can change it), ``wait_input(timeout)``
+    blocks until input may be available or the timeout expires. On
+    wake up, :attr:`ON_IDLE_EVENT_NAME` is dispatched with the number
+    of whole steps that were slept and the step, so that handlers can
+    account for them as if they were processed (e.g. advancing
+    coroutine timers, see :mod:`coroutines`). The world is not
+    processed for them: input that woke the loop is handled in the
+    next regular step. Steps in which something would happen (i.e.
+    past ``idle_timeout``) are never slept.
+
+    Frame statistics are logged and reset on each world switch.
+    """
+
+    def __init__(self, scheduler: Optional[FrameScheduler] = None,
+                 idle_timeout: Optional[Callable[[desper.World],
+                                                 float]] = None,
+                 wait_input: Optional[Callable[[float], None]] = None):
+        super().__init__()
+        self.scheduler = scheduler or FrameScheduler()
+        self.idle_timeout = idle_timeout
+        self.wait_input = wait_input
+
+    def loop(self):
+        scheduler = self.scheduler
+        while True:
+            try:
+                self._idle()
+
+                steps = scheduler.wait()
+                for index in range(steps):
+                    world = self._current_world
+                    world.dispatch(ON_STEP_EVENT_NAME,
+                                   scheduler.should_present(
+                                       index == steps - 1))
+                    world.process(scheduler.step)
+
+            except desper.SwitchWorld as ex:
+                self.switch(ex.world_handle, ex.clear_current, ex.clear_next)
+
+    def _idle(self):
+        """Sleep while the current world is quiescent."""
+        if self.idle_timeout is None or self.wait_input is None:
+            return
+
+        scheduler = self.scheduler
+        timeout = min(self.idle_timeout(self._current_world), MAX_IDLE_TIME)
+        # Keep a step of margin, the step in which something happens is
+        # processed regularly
+        max_steps = int(timeout // scheduler.step) - 1
+        if max_steps < 1:
+            return
+
+        start = scheduler.time_function()
+        self.wait_input(max_steps * scheduler.step)
+        idle_steps = min(max_steps, int((scheduler.time_function() - start)
+                                        // scheduler.step))
+
+        scheduler.reset()
+        if idle_steps > 0:
+            scheduler.stats.idle_steps += idle_steps
+            self._current_world.dispatch(ON_IDLE_EVENT_NAME, idle_steps,
+                                         scheduler.step)
+
+    def switch(self, world_handle, clear_current=False, clear_next=False):
+        if self.scheduler.stats.frames:
+            self.log_stats()
+
+        super().switch(world_handle, clear_current, clear_next)
+        self.scheduler.reset()
+
+    def log_stats(self):
+        """Log frame statistics and reset them."""
+        logger.info('Frame stats: %s', ', '.join(
+            f'{key}={value:.2f}' if isinstance(value, float)
+            else f'{key}={value}'
+            for key, value in self.scheduler.stats.report().items()))
+        self.scheduler.stats.reset()
@@ -0,0 +1,216 @@
+"""Snapshot freshly built worlds, restore them without rebuilding.
+
+A :class:`WorldSnapshot` captures a world before it is ever processed
+(i.e. right after its transformers ran) and restores copies of it on
+demand. Since building a level renders text, creates surfaces and
+sets up processors, restoring a snapshot is cheaper than running the
+transformer chain again (see :class:`SnapshotWorldHandle`).
+
+The world is captured by pickling it, entities, components,
+processors and pending events (e.g. deferred ``on_add`` events)
+included. Restoring unpickles it, with some exceptions:
+
+* Sprite surfaces (and their arrays) are shared among copies, as
+  they are never drawn on. The snapshot holds a reference to each of
+  them (see :mod:`surfaces`). Surfaces of entities marked as written
+  (:attr:`WRITTEN_MARKERS`, e.g. the screen surface) are duplicated
+  instead, owned by the restored world.
+* Instances of :func:`shared` classes (e.g. a
+  :class:`replay.Recorder`) are shared among copies.
+* Event dispatchers (e.g. the world itself and
+  :class:`desper.Transform2D`) reference their handlers weakly. Their
+  handlers are registered again, on the respective copies.
+
+Worlds including objects that cannot be pickled (e.g. running
+coroutines) cannot be snapshotted.
+"""
+import copyreg
+import io
+import itertools
+import pickle
+import weakref
+from typing import Optional
+
+import desper
+from desper.math import Vec2
+from sdl2.ext import pixels2d, SurfaceArray
+
+from . import graphics
+from . import surfaces
+from .log import logger
+
+# Entities holding surfaces that are drawn on
+WRITTEN_MARKERS = (graphics.ScreenSurface,)
+
+# Component types that pickle cannot find by name
+_COMPONENT_TYPES = (graphics.LP_SDL_Surface, graphics.LP_TTF_Font)
+
+# Vectors are immutable, yet cannot be pickled by default
+copyreg.pickle(Vec2, lambda vector: (Vec2, tuple(vector)))
+
+_shared_types: set[type] = set()
+
+
+def shared(cls: type) -> type:
+    """Class decorator, instances are shared by restored worlds."""
+    _shared_types.add(cls)
+    return cls
+
+
+def _register(dispatcher: desper.EventDispatcher, handler, methods: tuple):
+    # Same as EventDispatcher.add_handler, with methods already known
+    handler_ref = weakref.ref(handler, dispatcher._remove_weak_handler)
+    for event_name, method in methods:
+        dispatcher._events.setdefault(event_name, set()).add(
+            (handler_ref, method))
+    dispatcher._handlers[handler_ref] = methods
+
+
+class _Pickler(pickle.Pickler):
+
+    def __init__(self, file, references: dict, objects: dict):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.references = references
+        self.objects = objects
+
+    def persistent_id(self, obj):
+        reference = self.references.get(id(obj))
+        if reference is None and type(obj) in _shared_types:
+            reference = self.references[id(obj)] = 'shared', id(obj)
+            self.objects[reference] = obj
+        return reference
+
+
+class _Unpickler(pickle.Unpickler):
+
+    def __init__(self, snapshot: 'WorldSnapshot'):
+        super().__init__(io.BytesIO(snapshot._data))
+        self.snapshot = snapshot
+        self.duplicates = {}
+
+    def persistent_load(self, reference):
+        kind, key = reference
+        if kind == 'handlers':
+            return {}
+        if kind == 'id_generator':
+            return itertools.count(self.snapshot._next_id)
+        if kind not in ('written', 'written_array'):
+            return self.snapshot._objects[reference]
+
+        # One duplicate of each written surface, for each restore
+        duplicate = self.duplicates.get(key)
+        if duplicate is None:
+            duplicate = self.duplicates[key] = surfaces.duplicate(
+                self.snapshot._written[key])
+            self.duplicates[key, 'array'] = pixels2d(duplicate)
+        if kind == 'written':
+            return duplicate
+        return self.duplicates[key, 'array']
+
+
+class WorldSnapshot:
+    """A world as it was when captured, to be restored at will.
+
+    The world must have never been processed. The captured world can
+    be freely used afterwards. Surfaces needed for restoring are owned
+    by :attr:`surface_owner`, named after ``name``.
+    """
+
+    def __init__(self, world: desper.World, name: str = 'snapshot'):
+        self.surface_owner = surfaces.SurfaceOwner(name)
+        # Entity IDs are usually given by a count, go on from there
+        self._next_id = next(world.id_generator)
+        world.id_generator = itertools.chain((self._next_id,),
+                                             world.id_generator)
+
+        references = {id(world.id_generator): ('id_generator', None),
+                      id(world.id_generator_factory): ('shared', 'factory')}
+        self._objects = {('shared', 'factory'): world.id_generator_factory}
+        for component_type in _COMPONENT_TYPES:
+            references[id(component_type)] = 'shared', component_type.__name__
+            self._objects['shared', component_type.__name__] = component_type
+
+        self._written: dict[int, graphics.LP_SDL_Surface] = {}
+        dispatchers = [world, *world.processors]
+        for entity in world.entities:
+            components = world.get_components(entity)
+            dispatchers += components
+
+            surface = world.get_component(entity, graphics.LP_SDL_Surface)
+            if surface is None:
+                continue
+
+            surface_array = world.get_component(entity, SurfaceArray)
+            if any(world.has_component(entity, marker)
+                   for marker in WRITTEN_MARKERS):
+                # Keep a pristine copy, the captured world goes on
+                with self.surface_owner.active():
+                    self._written[entity] = surfaces.duplicate(surface)
+                references[id(surface)] = 'written', entity
+                if surface_array is not None:
+                    references[id(surface_array)] = 'written_array', entity
+                continue
+
+            if id(surface) not in references:
+                surface.contents.refcount += 1
+                self.surface_owner.track(surface)
+            for obj in (surface, surface_array):
+                if obj is not None:
+                    references[id(obj)] = 'shared', id(obj)
+                    self._objects['shared', id(obj)] = obj
+
+        # Handlers are weakly referenced, they are registered again
+        handlers = []
+        for dispatcher in dispatchers:
+            if not isinstance(dispatcher, desper.EventDispatcher):
+                continue
+            references[id(dispatcher._events)] = 'handlers', None
+            references[id(dispatcher._handlers)] = 'handlers', None
+            handlers.append((dispatcher, [
+                (handler_ref(), methods)
+                for handler_ref, methods in dispatcher._handlers.items()
+                if handler_ref() is not None]))
+
+        file = io.BytesIO()
+        try:
+            _Pickler(file, references, self._objects).dump((world, handlers))
+        except BaseException:
+            self.surface_owner.release()
+            raise
+        self._data = file.getvalue()
+
+    def restore(self) -> desper.World:
+        """Get a new copy of the captured world."""
+        world, handlers = _Unpickler(self).load()
+        for dispatcher, dispatcher_handlers in handlers:
+            for handler, methods in dispatcher_handlers:
+                _register(dispatcher, handler, methods)
+        return world
+
+
+class SnapshotWorldHandle(surfaces.OwningWorldHandle):
+    """World handle running its transformers only once.
+
+    The first time, the world is built and a :class:`WorldSnapshot` of
+    it is taken. From then on, loading restores the snapshot. If the
+    world cannot be snapshotted, it is built every time.
+    """
+    snapshot: Optional[WorldSnapshot] = None
+
+    def __init__(self):
+        super().__init__()
+        self._snapshot_failed = False
+
+    def build(self) -> desper.World:
+        if self.snapshot is not None:
+            return self.snapshot.restore()
+
+        world = super().build()
+        if not self._snapshot_failed:
+            try:
+                self.snapshot = WorldSnapshot(world, f'{self.key} snapshot')
+            except (pickle.PicklingError, TypeError, AttributeError) as error:
+                logger.warning('Cannot snapshot world %s (%s), it will be '
+                               'built every time', self.key, error)
+                self._snapshot_failed = True
+        return world
@@ -0,0 +1,315 @@
+"""SSD1306 framebuffer utilities.
+
+Kept apart from :mod:`bonnet`, which requires the actual hardware at
+import time, so that conversions can be used and measured anywhere.
+"""
+import threading
+import time
+from typing import Iterable, Optional
+
+import numpy as np
+
+from . import graphics
+from .log import logger
+
+PAGE_HEIGHT = 8
+PAGES = graphics.BONNET_HEIGHT // PAGE_HEIGHT
+
+
+def pack_pages(surface_array: np.ndarray) -> np.ndarray:
+    """Convert a surface array to SSD1306 page-major 1-bit data.
+
+    The surface array is indexed as ``[x, y]`` (see
+    :func:`sdl2.ext.pixels2d`), its height must be a multiple of
+    :attr:`PAGE_HEIGHT`. A pixel is lit if its least significant bit
+    is set.
+
+    Return a ``(height // PAGE_HEIGHT, width)`` array of bytes. Bit
+    ``k`` of byte ``[page, x]`` is pixel ``(x, page * PAGE_HEIGHT + k)``,
+    which is exactly the layout of the display's GDDRAM.
+    """
+    width, height = surface_array.shape
+    lit = surface_array.T & 1
+    return np.packbits(
+        lit.reshape(height // PAGE_HEIGHT, PAGE_HEIGHT, width),
+        axis=1, bitorder='little').reshape(height // PAGE_HEIGHT, width)
+
+
+def fill_display(display, screen_surface_array: np.ndarray,
+                 rects: Optional[Iterable[graphics.Rect]] = None):
+    """Write the screen surface array into the display's buffer.
+
+    The conversion is done in a single batched operation and copied
+    straight into the driver's framebuffer. Nothing is sent to the
+    display.
+
+    If given, only the pages and columns covered by ``rects`` are
+    converted.
+
+    Anything exposing a compatible ``buf`` can be passed as display
+    (e.g. a :class:`DisplayWorker`).
+    """
+    pages = np.frombuffer(display.buf, dtype=np.uint8).reshape(
+        PAGES, graphics.BONNET_WIDTH)
+
+    if rects is None:
+        pages[...] = pack_pages(screen_surface_array)
+        return
+
+    for rect in rects:
+        x, _, w, _ = rect
+        first_page, end_page = page_span(rect)
+        pages[first_page:end_page, x:x + w] = pack_pages(
+            screen_surface_array[x:x + w, first_page * PAGE_HEIGHT:
+                                 end_page * PAGE_HEIGHT])
+
+
+def copy_pages(display, screen_pages: np.ndarray,
+               rects: Optional[Iterable[graphics.Rect]] = None):
+    """Write already packed screen pages into the display's buffer.
+
+    See :func:`fill_display`, of which this is the counterpart for
+    page-major packed screens (e.g. :class:`packed.PackedBitmap`).
+    """
+    pages = np.frombuffer(display.buf, dtype=np.uint8).reshape(
+        PAGES, graphics.BONNET_WIDTH)
+
+    if rects is None:
+        pages[...] = screen_pages
+        return
+
+    for rect in rects:
+        x, _, w, _ = rect
+        first_page, end_page = page_span(rect)
+        pages[first_page:end_page, x:x + w] = screen_pages[
+            first_page:end_page, x:x + w]
+
+
+def page_span(rect: graphics.Rect) -> tuple[int, int]:
+    """Get the range of pages ``[first, end)`` covered by a rectangle."""
+    _, y, _, h = rect
+    return y // PAGE_HEIGHT, -(-(y + h) // PAGE_HEIGHT)
+
+
+# Fundamental commands, see the SSD1306 datasheet
+SET_COL_ADDR = 0x21
+SET_PAGE_ADDR = 0x22
+
+# I2C control byte, announcing a data transfer
+CONTROL_DATA = 0x40
+
+# Bytes sent by the driver to transmit a single command, and the
+# bytes spent to address a window (column and page ranges)
+COMMAND_SIZE = 2
+WINDOW_COMMANDS_SIZE = 6 * COMMAND_SIZE
+
+
+class PartialUpdater:
+    """Transmit only the changed parts of a display's framebuffer.
+
+    A copy of the last transmitted pages is kept. On :meth:`show`, the
+    driver's buffer is compared against it and, for each page that
+    changed, only the range of columns between the first and the last
+    changed one is sent. Windows are addressed through the column and
+    page addressing commands, which require the display to be in
+    horizontal (default) addressing mode.
+
+    If the partial transfers would cost more than a full one (e.g.
+    all the pages changed), the whole buffer is sent as usual.
+
+    Transfer statistics for the last call to :meth:`show` are stored in
+    :attr:`bytes_sent` and :attr:`pages_skipped`. Bytes count all that
+    is passed to the I2C driver (commands and data, control bytes
+    included).
+    """
+    bytes_sent = 0
+    pages_skipped = 0
+
+    def __init__(self, display):
+        self.display = display
+        self.pages = np.frombuffer(display.buf, dtype=np.uint8).reshape(
+            PAGES, display.width)
+        self.column_offset = (128 - display.width) // 2
+        self._sent = None
+        self._data = bytearray(display.width + 1)
+
+        self.total_bytes_sent = 0
+        self.total_frames = 0
+
+    def invalidate(self):
+        """Forget transmitted data, next update will be a full one."""
+        self._sent = None
+
+    def show(self):
+        """Transmit changes in the driver's buffer to the display."""
+        if self._sent is None or getattr(self.display, 'page_addressing',
+                                         False):
+            self._show_full()
+            return
+
+        changed = self.pages != self._sent
+        changed_pages = np.flatnonzero(changed.any(axis=1))
+
+        windows = []
+        for page in changed_pages:
+            columns = np.flatnonzero(changed[page])
+            windows.append((page, columns[0], columns[-1] + 1))
+
+        partial_size = sum(WINDOW_COMMANDS_SIZE + 1 + end - start
+                           for _, start, end in windows)
+        if partial_size >= self._full_size():
+            self._show_full()
+            return
+
+        for page, start, end in windows:
+            self._write_window(page, start, end)
+
+        self._sent[...] = self.pages
+        self._count(partial_size, PAGES - len(windows))
+
+    def _full_size(self):
+        return WINDOW_COMMANDS_SIZE + 1 + self.pages.size
+
+    def _show_full(self):
+        self.display.show()
+
+        if self._sent is None:
+            self._sent = self.pages.copy()
+        else:
+            self._sent[...] = self.pages
+        self._count(self._full_size(), 0)
+
+    def _write_window(self, page, start, end):
+        """Send columns ``[start, end)`` of the given page."""
+        display = self.display
+        display.write_cmd(SET_COL_ADDR)
+        display.write_cmd(start + self.column_offset)
+        display.write_cmd(end - 1 + self.column_offset)
+        display.write_cmd(SET_PAGE_ADDR)
+        display.write_cmd(page)
+        display.write_cmd(page)
+
+        size = end - start + 1
+        self._data[0] = CONTROL_DATA
+        self._data[1:size] = self.pages[page, start:end].tobytes()
+        with display.i2c_device:
+            display.i2c_device.write(self._data, end=size)
+
+    def _count(self, bytes_sent, pages_skipped):
+        self.bytes_sent = bytes_sent
+        self.pages_skipped = pages_skipped
+        self.total_bytes_sent += bytes_sent
+        self.total_frames += 1
+
+
+class DisplayWorker:
+    """Transmit frames to the display from a background thread.
+
+    Frames are drawn into :attr:`buf`, which mirrors the display's own
+    buffer (it can be passed to :func:`fill_display` and
+    :func:`copy_pages` in place of the display) and is never touched by
+    the worker. On :meth:`submit`, a copy is handed to the worker,
+    which transmits it through the given :class:`PartialUpdater`.
+
+    Only the latest submitted frame is kept: if a new one is submitted
+    while the previous is still waiting for the bus, the previous is
+    dropped.
+
+    Statistics are kept in :attr:`frames_submitted`,
+    :attr:`frames_sent`, :attr:`frames_dropped` and transfer times, in
+    seconds.
+    """
+
+    def __init__(self, updater: PartialUpdater):
+        self.updater = updater
+        display_pages = updater.pages
+        self._display_pages = display_pages
+        self._back = np.zeros_like(display_pages)
+        self.buf = memoryview(self._back.reshape(-1))
+
+        # Two more buffers rotate between the pending slot and the free
+        # list, no new frame is ever allocated
+        self._free = [np.empty_like(display_pages),
+                      np.empty_like(display_pages)]
+        self._pending: Optional[np.ndarray] = None
+        self._condition = threading.Condition()
+        self._running = True
+
+        self.frames_submitted = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.last_transfer_time = 0.
+        self.max_transfer_time = 0.
+        self.total_transfer_time = 0.
+
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='nerissimo-display')
+        self._thread.start()
+
+    def submit(self):
+        """Hand the current content of :attr:`buf` to the worker."""
+        with self._condition:
+            if self._pending is not None:
+                frame = self._pending
+                self.frames_dropped += 1
+            else:
+                frame = self._free.pop()
+
+            frame[...] = self._back
+            self._pending = frame
+            self.frames_submitted += 1
+            self._condition.notify()
+
+    def close(self):
+        """Transmit the last pending frame, then stop the worker.
+
+        The display can be safely used again afterwards. Closing more
+        than once has no effect.
+        """
+        if self._thread is None:
+            return
+
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join()
+        self._thread = None
+
+        logger.info('Display stats: %s', ', '.join(
+            f'{key}={value:.2f}' if isinstance(value, float)
+            else f'{key}={value}' for key, value in self.report().items()))
+
+    def report(self) -> dict:
+        """Get a summary of the statistics, times in milliseconds."""
+        return {
+            'frames_submitted': self.frames_submitted,
+            'frames_sent': self.frames_sent,
+            'frames_dropped': self.frames_dropped,
+            'mean_transfer_ms': (self.total_transfer_time
+                                 / max(self.frames_sent, 1) * 1e3),
+            'max_transfer_ms': self.max_transfer_time * 1e3,
+            'total_bytes_sent': self.updater.total_bytes_sent,
+        }
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._pending is not None or not self._running)
+                frame = self._pending
+                if frame is None:
+                    return
+
+                self._pending = None
+                self._display_pages[...] = frame
+                self._free.append(frame)
+
+            start = time.perf_counter()
+            self.updater.show()
+            transfer_time = time.perf_counter() - start
+
+            self.frames_sent += 1
+            self.last_transfer_time = transfer_time
+            self.max_transfer_time = max(self.max_transfer_time,
+                                         transfer_time)
+            self.total_transfer_time += transfer_time
@@ -0,0 +1,211 @@
+"""Surface ownership and pooling.
+
+SDL surfaces built for a world (sprites drawn at runtime, rendered
+text, the screen) are owned by that world, and released when its
+handle is cleared (see :class:`OwningWorldHandle`). Otherwise, a game
+rotating its levels forever would keep allocating surfaces.
+
+Ownership is scoped: while a :class:`SurfaceOwner` is active (see
+:meth:`SurfaceOwner.active`), surfaces passed to :func:`track` (e.g.
+all the ones built by :func:`graphics.build_surface`) are owned by
+it. The active owner is a context variable, so that worlds built in
+other threads (see :mod:`preload`) get their own. Resources which
+outlive worlds (e.g. cached sprites) are built :func:`detached`.
+
+Releasing a surface drops the owner's reference to it (see
+``SDL_Surface.refcount``). If it was the last one, the surface is
+recycled into :attr:`pool`, keyed by size and format, so that the
+next world can reuse it.
+
+:func:`report` describes live owned surfaces, by owner.
+"""
+import contextlib
+import contextvars
+import ctypes
+import logging
+import threading
+import weakref
+from typing import Optional
+
+import desper
+import sdl2
+
+from .log import logger
+
+LP_SDL_Surface = ctypes.POINTER(sdl2.SDL_Surface)
+
+# Free surfaces kept for each size and format
+POOL_SIZE = 8
+
+_current_owner: contextvars.ContextVar[Optional['SurfaceOwner']] = \
+    contextvars.ContextVar('surface_owner', default=None)
+
+_owners: 'weakref.WeakSet[SurfaceOwner]' = weakref.WeakSet()
+
+
+def surface_bytes(surface: LP_SDL_Surface) -> int:
+    """Size of a surface's pixels, in bytes."""
+    return surface.contents.pitch * surface.contents.h
+
+
+class SurfacePool:
+    """Free surfaces, by size and format, up to ``size`` per key."""
+
+    def __init__(self, size: int = POOL_SIZE):
+        self.size = size
+        self._surfaces: dict[tuple[int, int, int], list[LP_SDL_Surface]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(map(len, self._surfaces.values()))
+
+    @property
+    def bytes(self) -> int:
+        return sum(surface_bytes(surface)
+                   for surfaces in self._surfaces.values()
+                   for surface in surfaces)
+
+    def acquire(self, width: int, height: int,
+                pixel_format: int) -> LP_SDL_Surface:
+        """Get a surface, with undefined content."""
+        with self._lock:
+            surfaces = self._surfaces.get((width, height, pixel_format))
+            if surfaces:
+                return surfaces.pop()
+
+        depth = sdl2.SDL_BITSPERPIXEL(pixel_format)
+        return sdl2.SDL_CreateRGBSurfaceWithFormat(0, width, height, depth,
+                                                   pixel_format)
+
+    def release(self, surface: LP_SDL_Surface):
+        """Drop a reference to a surface, recycling it if the last."""
+        contents = surface.contents
+        # Surfaces referencing foreign pixels are not recycled
+        if contents.refcount > 1 or contents.flags & sdl2.SDL_PREALLOC:
+            sdl2.SDL_FreeSurface(surface)
+            return
+
+        with self._lock:
+            surfaces = self._surfaces.setdefault(
+                (contents.w, contents.h, contents.format.contents.format), [])
+            if len(surfaces) < self.size:
+                sdl2.SDL_SetClipRect(surface, None)
+                surfaces.append(surface)
+                return
+
+        sdl2.SDL_FreeSurface(surface)
+
+    def clear(self):
+        with self._lock:
+            for surfaces in self._surfaces.values():
+                for surface in surfaces:
+                    sdl2.SDL_FreeSurface(surface)
+            self._surfaces.clear()
+
+
+pool = SurfacePool()
+
+
+class SurfaceOwner:
+    """Hold a reference to each tracked surface, until released."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._surfaces: list[LP_SDL_Surface] = []
+        _owners.add(self)
+
+    def __len__(self):
+        return len(self._surfaces)
+
+    @property
+    def bytes(self) -> int:
+        return sum(map(surface_bytes, self._surfaces))
+
+    def track(self, surface: LP_SDL_Surface) -> LP_SDL_Surface:
+        self._surfaces.append(surface)
+        return surface
+
+    def release(self):
+        """Release all tracked surfaces, into :attr:`pool`."""
+        for surface in self._surfaces:
+            pool.release(surface)
+        self._surfaces.clear()
+
+    @contextlib.contextmanager
+    def active(self):
+        """Make this the owner of surfaces tracked in the context."""
+        token = _current_owner.set(self)
+        try:
+            yield self
+        finally:
+            _current_owner.reset(token)
+
+
+def track(surface: LP_SDL_Surface) -> LP_SDL_Surface:
+    """Let the active owner, if any, own the given surface."""
+    owner = _current_owner.get()
+    if owner is not None:
+        owner.track(surface)
+    return surface
+
+
+@contextlib.contextmanager
+def detached():
+    """Do not track surfaces in the context, e.g. for cached ones."""
+    token = _current_owner.set(None)
+    try:
+        yield
+    finally:
+        _current_owner.reset(token)
+
+
+def duplicate(surface: LP_SDL_Surface) -> LP_SDL_Surface:
+    """Copy a surface, through :attr:`pool`, and track the copy."""
+    contents = surface.contents
+    copy = pool.acquire(contents.w, contents.h, contents.format.contents.format)
+    # Surfaces with no alpha channel are blitted as they are
+    sdl2.SDL_BlitSurface(surface, None, copy, None)
+    return track(copy)
+
+
+def report() -> dict[str, tuple[int, int]]:
+    """Get the amount of live surfaces and their bytes, by owner.
+
+    Free surfaces in :attr:`pool` are reported as ``'pool'``.
+    """
+    surfaces = {owner.name: (len(owner), owner.bytes)
+                for owner in list(_owners) if len(owner)}
+    surfaces['pool'] = len(pool), pool.bytes
+    return surfaces
+
+
+def log_report(level: int = logging.INFO):
+    for name, (count, size) in report().items():
+        logger.log(level, 'Surfaces of %s: %d (%d bytes)', name, count, size)
+
+
+class OwningWorldHandle(desper.WorldHandle):
+    """World handle owning the surfaces built along with its world.
+
+    Surfaces tracked while loading (see :meth:`build`) are released
+    when the handle is cleared.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.surface_owner: Optional[SurfaceOwner] = None
+
+    def load(self) -> desper.World:
+        self.surface_owner = SurfaceOwner(str(self.key))
+        with self.surface_owner.active():
+            return self.build()
+
+    def build(self) -> desper.World:
+        """Build the world, see :class:`desper.WorldHandle`."""
+        return super().load()
+
+    def clear(self):
+        if self.surface_owner is not None:
+            self.surface_owner.release()
+            self.surface_owner = None
+        super().clear()
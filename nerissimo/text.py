@@ -0,0 +1,225 @@
+"""Text rendering, through glyph atlases and a rendered text cache.
+
+Glyphs of each font resource are rasterized by SDL_ttf once, into a
+binary atlas (:class:`GlyphAtlas`). Strings are then composed from the
+atlas with NumPy, instead of being rendered by FreeType every time.
+Finished surfaces are memoized in a bounded LRU cache
+(:class:`TextCache`), so that rebuilding a level does not render its
+texts again.
+
+Atlases need SDL_ttf 2.0.18 or later. With older versions, text is
+rendered by SDL_ttf directly.
+"""
+import ctypes
+from collections import OrderedDict
+from typing import Optional
+
+import desper
+import numpy as np
+import sdl2
+from sdl2 import sdlttf as ttf
+from sdl2.ext import pixels2d
+
+from . import surfaces
+from .graphics import LP_SDL_Surface, LP_TTF_Font, surface_from_array
+from .log import logger
+
+# Characters rasterized when an atlas is built, others are added lazily
+ATLAS_CHARACTERS = ''.join(map(chr, range(0x20, 0x7F)))
+
+TEXT_CACHE_SIZE = 32
+
+# Color of text pixels, as rendered by SDL_ttf with the default color
+INK = 0xFF
+
+
+class GlyphAtlas:
+    """Rasterized glyphs of a font.
+
+    Glyphs are stored side by side in :attr:`atlas`, a boolean array
+    indexed as ``[x, y]`` (like surface arrays). :attr:`glyphs` maps
+    each character to its ``(x, width, advance)`` in the atlas.
+    """
+
+    def __init__(self, font: LP_TTF_Font,
+                 characters: str = ATLAS_CHARACTERS):
+        self.font = font
+        self.height = ttf.TTF_FontHeight(font)
+        self.kerning = bool(ttf.TTF_GetFontKerning(font))
+        self.atlas = np.zeros((0, self.height), dtype=bool)
+        self.glyphs: dict[str, tuple[int, int, int]] = {}
+        self.add(characters)
+
+    @classmethod
+    def prebuilt(cls, font: LP_TTF_Font, atlas: np.ndarray,
+                 glyphs: dict[str, tuple[int, int, int]]) -> 'GlyphAtlas':
+        """Build from an already rasterized atlas (see :meth:`__init__`)."""
+        glyph_atlas = cls(font, '')
+        glyph_atlas.atlas = atlas
+        glyph_atlas.glyphs = dict(glyphs)
+        return glyph_atlas
+
+    def add(self, characters: str) -> bool:
+        """Rasterize the given characters, if missing.
+
+        Return ``False`` if the font does not provide any of them, in
+        which case none is added.
+        """
+        missing = [character for character in dict.fromkeys(characters)
+                   if character not in self.glyphs]
+        if not all(ttf.TTF_GlyphIsProvided32(self.font, ord(character))
+                   for character in missing):
+            return False
+        if not missing:
+            return True
+
+        columns = [self.atlas]
+        x = len(self.atlas)
+        for character in missing:
+            code = ord(character)
+            advance = ctypes.c_int()
+            ttf.TTF_GlyphMetrics32(self.font, code, None, None, None, None,
+                                   ctypes.byref(advance))
+            surface = ttf.TTF_RenderGlyph32_Solid(self.font, code,
+                                                  sdl2.SDL_Color())
+            glyph = pixels2d(surface)[:, :self.height] != 0
+            sdl2.SDL_FreeSurface(surface)
+
+            self.glyphs[character] = x, len(glyph), advance.value
+            columns.append(glyph)
+            x += len(glyph)
+
+        self.atlas = np.concatenate(columns)
+        return True
+
+    def compose(self, text: str) -> Optional[np.ndarray]:
+        """Compose text from the atlas, as a boolean array.
+
+        Return ``None`` if the font does not provide some character.
+        """
+        if not self.add(text):
+            return None
+
+        width = ctypes.c_int()
+        ttf.TTF_SizeUTF8(self.font, text.encode(), ctypes.byref(width), None)
+
+        canvas = np.zeros((width.value, self.height), dtype=bool)
+        pen = 0
+        previous = None
+        for character in text:
+            if self.kerning and previous is not None:
+                pen += ttf.TTF_GetFontKerningSizeGlyphs32(
+                    self.font, ord(previous), ord(character))
+
+            x, glyph_width, advance = self.glyphs[character]
+            glyph = self.atlas[x:x + glyph_width]
+            target = canvas[pen:pen + glyph_width]
+            target |= glyph[:len(target)]
+            pen += advance
+            previous = character
+
+        return canvas
+
+
+class TextCache:
+    """LRU cache of rendered text surfaces, up to ``size`` entries.
+
+    The cache holds a reference to each surface, released on eviction
+    or :meth:`clear` (see ``SDL_Surface.refcount``).
+    """
+
+    def __init__(self, size: int = TEXT_CACHE_SIZE):
+        self.size = size
+        self._surfaces: OrderedDict[tuple, LP_SDL_Surface] = OrderedDict()
+
+    def __len__(self):
+        return len(self._surfaces)
+
+    def get(self, key) -> Optional[LP_SDL_Surface]:
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self._surfaces.move_to_end(key)
+        return surface
+
+    def put(self, key, surface: LP_SDL_Surface):
+        self._surfaces[key] = surface
+        self._surfaces.move_to_end(key)
+        while len(self._surfaces) > self.size:
+            _, evicted = self._surfaces.popitem(last=False)
+            surfaces.pool.release(evicted)
+
+    def clear(self):
+        for surface in self._surfaces.values():
+            surfaces.pool.release(surface)
+        self._surfaces.clear()
+
+
+# Glyph functions are only provided by SDL_ttf 2.0.18 and later
+glyph_functions_available = True
+
+_atlases: dict[str, GlyphAtlas] = {}
+text_cache = TextCache()
+
+
+def get_atlas(font_resource: str) -> GlyphAtlas:
+    """Get the glyph atlas of a font resource, building it if needed.
+
+    Font handles may provide a prebuilt one, as their ``atlas``
+    attribute (see :mod:`resource_pack`).
+    """
+    handle = desper.resource_map.get(font_resource)
+    font = handle()
+    atlas = _atlases.get(font_resource)
+    # Fonts may be reloaded, in which case the atlas is built again
+    if atlas is None or ctypes.addressof(atlas.font.contents) \
+            != ctypes.addressof(font.contents):
+        atlas = getattr(handle, 'atlas', None)
+        if atlas is None or atlas.font is not font:
+            atlas = GlyphAtlas(font)
+        _atlases[font_resource] = atlas
+    return atlas
+
+
+def render_text(font_resource: str, text: str) -> LP_SDL_Surface:
+    """Render text with the given font resource.
+
+    The returned surface is shared with the cache, and must not be
+    drawn on. Freeing it is allowed, and only releases the caller's
+    reference. Such reference is owned by the active owner, if any
+    (see :mod:`surfaces`).
+    """
+    key = font_resource, text
+    surface = text_cache.get(key)
+    if surface is None:
+        with surfaces.detached():
+            surface = _render(font_resource, text)
+        text_cache.put(key, surface)
+
+    surface.contents.refcount += 1
+    return surfaces.track(surface)
+
+
+def _render(font_resource: str, text: str) -> LP_SDL_Surface:
+    global glyph_functions_available
+
+    canvas = None
+    if glyph_functions_available:
+        try:
+            canvas = get_atlas(font_resource).compose(text)
+        except RuntimeError as error:
+            # Raised by pysdl2 for functions missing in the linked library
+            logger.warning('Glyph atlases unavailable (%s), rendering text '
+                           'through SDL_ttf', error)
+            glyph_functions_available = False
+
+    if canvas is None:
+        # Missing glyphs (or functions), let SDL_ttf deal with them
+        rendered = ttf.TTF_RenderUTF8_Solid(
+            desper.resource_map[font_resource], text.encode(),
+            sdl2.SDL_Color())
+        surface = sdl2.SDL_ConvertSurfaceFormat(
+            rendered, sdl2.SDL_PIXELFORMAT_RGB332, 0)
+        sdl2.SDL_FreeSurface(rendered)
+        return surface
+
+    return surface_from_array(canvas * np.uint8(INK))
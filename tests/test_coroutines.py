@@ -0,0 +1,125 @@
+"""Idle aware coroutine processing, see :mod:`nerissimo.coroutines`.
+
+Run from the repository root with::
+
+    python -m unittest
+"""
+import math
+import unittest
+
+import desper
+
+from nerissimo import coroutines
+from nerissimo import scheduler
+
+STEP = 1 / 30
+
+
+def waiting(seconds):
+    yield seconds
+
+
+def active():
+    while True:
+        yield
+
+
+class DtProbe(desper.Processor):
+    """Record the timestep of every processed frame."""
+
+    def __init__(self):
+        self.dts = []
+
+    def process(self, dt):
+        self.dts.append(dt)
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, timeout):
+        # Waking up a little late, as real sleeps do
+        self.now += timeout + 0.01
+
+
+def processed(processor, frames=1):
+    for _ in range(frames):
+        processor.process(STEP)
+    return processor
+
+
+class CoroutineProcessorTest(unittest.TestCase):
+
+    def test_time_to_wake(self):
+        processor = coroutines.CoroutineProcessor()
+        self.assertEqual(processor.time_to_wake(), math.inf)
+
+        processor.start(waiting(1.))
+        self.assertEqual(processor.time_to_wake(), 0.)
+
+        processed(processor, 4)
+        self.assertAlmostEqual(processor.time_to_wake(), 1. - 3 * STEP)
+
+        processor.start(active())
+        self.assertEqual(processor.time_to_wake(), 0.)
+
+    def test_idle_same_as_processing(self):
+        processor = processed(coroutines.CoroutineProcessor())
+        idle_processor = processed(coroutines.CoroutineProcessor())
+        for each in (processor, idle_processor):
+            each.start(waiting(1.))
+            processed(each)
+
+        processed(processor, 17)
+        idle_processor.on_idle(17, STEP)
+        self.assertEqual(idle_processor.time_to_wake(),
+                         processor.time_to_wake())
+
+
+class IdleLoopTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.coroutine_processor = coroutines.CoroutineProcessor()
+        self.probe = DtProbe()
+
+        def transformer(handle, world):
+            world.add_processor(self.coroutine_processor)
+            world.add_processor(self.probe)
+
+        handle = desper.WorldHandle()
+        handle.transform_functions.append(transformer)
+        self.loop = scheduler.FixedTimestepLoop(
+            scheduler.FrameScheduler(STEP, time_function=self.clock),
+            idle_timeout=lambda world:
+                self.coroutine_processor.time_to_wake(),
+            wait_input=self.clock.sleep)
+        self.loop.switch(handle)
+
+    def test_idle_does_not_process(self):
+        self.coroutine_processor.start(waiting(10.))
+        processed(self.coroutine_processor)
+        wake = self.coroutine_processor.time_to_wake()
+
+        self.loop._idle()
+        self.assertEqual(self.probe.dts, [])
+        self.assertAlmostEqual(self.coroutine_processor.time_to_wake(),
+                               wake - round(scheduler.MAX_IDLE_TIME / STEP - 1)
+                               * STEP)
+
+    def test_idle_stops_before_wake(self):
+        self.coroutine_processor.start(waiting(0.3))
+        processed(self.coroutine_processor)
+
+        self.loop._idle()
+        self.assertGreater(self.coroutine_processor.time_to_wake(), 0.)
+        self.assertEqual(self.probe.dts, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+"""Text rendering through glyph atlases, see :mod:`nerissimo.text`.
+
+Run from the repository root with::
+
+    python -m unittest
+"""
+import os
+import unittest
+from unittest import mock
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import desper
+import sdl2
+from sdl2 import sdlttf as ttf
+from sdl2.ext import pixels2d
+
+from nerissimo import load_resources
+from nerissimo import text
+
+FONT = 'fonts/exepixelperfect'
+
+
+def render_pixels(string: str):
+    surface = text.render_text(FONT, string)
+    pixels = pixels2d(surface).copy()
+    sdl2.SDL_FreeSurface(surface)
+    return pixels
+
+
+class TextTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        sdl2.SDL_Init(0)
+        ttf.TTF_Init()
+        load_resources()
+
+    def setUp(self):
+        text.text_cache.clear()
+        text._atlases.clear()
+
+    def test_missing_glyph_leaves_atlas_consistent(self):
+        # The second character is not provided by the font
+        text.render_text(FONT, '\xa0一')
+        atlas = text.get_atlas(FONT)
+        self.assertNotIn('\xa0', atlas.glyphs)
+        for x, width, _ in atlas.glyphs.values():
+            self.assertLessEqual(x + width, len(atlas.atlas))
+
+        self.assertEqual(render_pixels('\xa0').shape[1], atlas.height)
+
+    def test_fallback_without_glyph_functions(self):
+        expected = render_pixels('NERISSIMO')
+        text.text_cache.clear()
+        text._atlases.clear()
+
+        def unavailable(*args):
+            raise RuntimeError('unavailable')
+
+        with mock.patch.object(ttf, 'TTF_GlyphIsProvided32', unavailable), \
+                mock.patch.object(text, 'glyph_functions_available', True):
+            self.assertTrue((render_pixels('NERISSIMO') == expected).all())
+            self.assertFalse(text.glyph_functions_available)
+
+
+if __name__ == '__main__':
+    unittest.main()
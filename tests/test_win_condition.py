@@ -0,0 +1,73 @@
+"""Lit pixels counting, see :class:`nerissimo.game.WinConditionProcessor`.
+
+Run from the repository root with::
+
+    python -m unittest
+"""
+import unittest
+
+import desper
+import numpy as np
+
+from nerissimo import game
+from nerissimo import graphics
+from nerissimo import packed
+
+
+def random_pixels(rng, shape):
+    return (rng.integers(0, 2, shape) * 0xFF).astype(np.uint8)
+
+
+class WinConditionTest(unittest.TestCase):
+
+    def check_damage(self, height):
+        rng = np.random.default_rng(0)
+        surface_array = random_pixels(rng, (graphics.BONNET_WIDTH, height))
+        bitmap = packed.PackedBitmap.from_surface_array(surface_array)
+        processors = {
+            'surface_array': game.WinConditionProcessor(surface_array),
+            'packed': game.PackedWinConditionProcessor(bitmap)}
+        for processor in processors.values():
+            desper.World().add_processor(processor)
+
+        for _ in range(20):
+            # Change a rectangle, only notifying the rows it covers
+            x, y = rng.integers(0, (graphics.BONNET_WIDTH, height))
+            w, h = rng.integers(1, 24, 2)
+            rect = graphics.clip_rect((int(x), int(y), int(w), int(h)),
+                                      (0, 0, graphics.BONNET_WIDTH, height))
+            x, y, w, h = rect
+            surface_array[x:x + w, y:y + h] = random_pixels(rng, (w, h))
+            bitmap.pages[...] = packed.PackedBitmap.from_surface_array(
+                surface_array).pages
+
+            for name, processor in processors.items():
+                with self.subTest(name):
+                    processor.on_screen_damage([rect])
+                    processor.process(1)
+                    self.assertEqual(processor.lit_count,
+                                     np.count_nonzero(surface_array))
+
+    def test_damaged_rows(self):
+        self.check_damage(graphics.BONNET_HEIGHT)
+
+    def test_partial_page(self):
+        self.check_damage(graphics.BONNET_HEIGHT - 3)
+
+    def test_win(self):
+        surface_array = np.zeros((graphics.BONNET_WIDTH,
+                                  graphics.BONNET_HEIGHT), dtype=np.uint8)
+        surface_array[3, 40] = 0xFF
+        processor = game.WinConditionProcessor(surface_array)
+        desper.World().add_processor(processor)
+        self.assertEqual(processor.lit_count, 1)
+
+        surface_array[3, 40] = 0
+        processor.on_screen_damage([(3, 40, 1, 1)])
+        with self.assertLogs('nerissimo', 'INFO'):
+            processor.process(1)
+        self.assertEqual(processor.lit_count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()